@@ -1 +0,0 @@
-from . import cli as _cli
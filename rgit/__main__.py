@@ -1,9 +1,18 @@
-import sys, asyncio
-from . import cli
+import sys
 
 
 def _smain(args):
-	asyncio.run(cli.main(args))
+	if args[:1] == ["prompt"]:
+		# Runs on every shell prompt, so must not pay for loading the rest of rgit.
+		from . import prompt # pylint: disable=import-outside-toplevel
+		return prompt.main(args[1:])
+	if args[:1] == ["complete"]:
+		# Runs on every press of the tab key, the same as above.
+		from . import completion # pylint: disable=import-outside-toplevel
+		return completion.main(args[1:])
+	import asyncio # pylint: disable=import-outside-toplevel
+	from . import cli # pylint: disable=import-outside-toplevel
+	return asyncio.run(cli.main(args))
 
 
 def _ssmain():
@@ -0,0 +1,81 @@
+import json, os, socket, subprocess, sys, threading
+
+
+# The helper process of the "forkserver" launcher (see `_launchers.ForkserverLauncher`). It's a
+# fresh interpreter that only imports what it needs, so spawning git from it stays cheap however
+# large rgit itself grows.
+#
+# Requests and responses are JSON messages on a SOCK_SEQPACKET socket inherited as the only
+# argument. A request to spawn carries the stdin, stdout and stderr of the child as file descriptors.
+#
+#   {"id": 1, "args": ["git", ...]} + fds  ->  {"id": 1, "pid": 1234}
+#                                          ->  {"id": 1, "returncode": 0}
+#                                     or   ->  {"id": 1, "errno": 2, "error": "..."}
+#   {"kill": 1}
+
+
+MAX_MESSAGE_SIZE = 1 << 20
+
+
+def main(args):
+	sock = socket.socket(fileno=int(args[0]))
+	lock = threading.Lock()
+	children = {}
+
+	def send(message):
+		with lock:
+			try:
+				sock.send(json.dumps(message).encode("utf_8"))
+			except OSError:
+				# The parent is gone, the main loop will notice.
+				pass
+
+	def wait(request_id, p):
+		returncode = p.wait()
+		with lock:
+			children.pop(request_id, None)
+		send({"id": request_id, "returncode": returncode})
+
+	while True:
+		try:
+			data, fds, _flags, _address = socket.recv_fds(sock, MAX_MESSAGE_SIZE, 3)
+		except ConnectionResetError:
+			data, fds = b"", []
+		if not data:
+			# The parent is gone.
+			break
+		request = json.loads(data)
+		if "kill" in request:
+			with lock:
+				p = children.get(request["kill"])
+			if p is not None:
+				try:
+					p.kill()
+				except ProcessLookupError:
+					pass
+			continue
+		request_id = request["id"]
+		try:
+			p = subprocess.Popen(request["args"], stdin=fds[0], stdout=fds[1], stderr=fds[2], close_fds=True)
+		except OSError as e:
+			send({"id": request_id, "errno": e.errno, "error": str(e)})
+			continue
+		finally:
+			for fd in fds:
+				os.close(fd)
+		with lock:
+			children[request_id] = p
+		send({"id": request_id, "pid": p.pid})
+		threading.Thread(target=wait, args=(request_id, p), daemon=True).start()
+
+	with lock:
+		remaining = list(children.values())
+	for p in remaining:
+		try:
+			p.kill()
+		except ProcessLookupError:
+			pass
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
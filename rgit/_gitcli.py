@@ -2,11 +2,82 @@ import asyncio, os, pathlib, subprocess
 
 _git_env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
 
+LAUNCHERS = ("asyncio", "spawn", "forkserver", "record", "replay")
+# Launchers that also run the processes of `run_sync()`.
+SYNC_LAUNCHERS = ("record", "replay")
+DEFAULT_LAUNCHER = "asyncio"
+LAUNCHER_ENV_VAR = "RGIT_LAUNCHER"
+
+_launcher_name = None
+# The number of processes started, for metrics of a run.
+processes_started = 0
+# The launcher and the event loop it was created for.
+_launcher = None
+_launcher_loop = None
+# The launcher used by `run_sync()`, if the selected one is in `SYNC_LAUNCHERS`.
+_sync_launcher = None
+
+
+def set_launcher(name):
+	"""
+	Selects how git processes started from now on are started, see `_launchers`. With `None`, the
+	one named by the RGIT_LAUNCHER environment variable or the default is used.
+	"""
+	global _launcher_name, _launcher, _sync_launcher # pylint: disable=global-statement
+	if name is not None and name not in LAUNCHERS:
+		raise ValueError("unknown launcher", name)
+	_launcher_name = name
+	_launcher = None
+	_sync_launcher = None
+
+
+def _get_launcher():
+	global _launcher, _launcher_loop # pylint: disable=global-statement
+	loop = asyncio.get_running_loop()
+	if _launcher is None or _launcher_loop is not loop:
+		_launcher = _create_launcher(_get_launcher_name())
+		_launcher_loop = loop
+	return _launcher
+
+
+def _get_launcher_name():
+	name = _launcher_name or os.environ.get(LAUNCHER_ENV_VAR) or DEFAULT_LAUNCHER
+	if name not in LAUNCHERS:
+		raise ValueError(f"unknown launcher {name!r} in {LAUNCHER_ENV_VAR}")
+	return name
+
+
+def _create_launcher(name):
+	# Imported here, this module is also loaded on its own by the build (see tools/hatch_build.py).
+	from . import _launchers # pylint: disable=import-outside-toplevel
+	return _launchers.LAUNCHERS[name](_git_env)
+
+
+async def close_launcher():
+	"""
+	Stops helper processes of the launcher, if any. Must be called before the event loop is closed.
+	"""
+	global _launcher # pylint: disable=global-statement
+	if _launcher is not None:
+		launcher, _launcher = _launcher, None
+		await launcher.close()
+
 
 def run_sync(*args, cwd=None, encoding="UTF-8", capture_output=True, check=True, rstrip=True):
+	global processes_started, _sync_launcher # pylint: disable=global-statement
+	processes_started += 1
+	cwd = cwd if cwd is not None else pathlib.Path.home()
+	name = _get_launcher_name()
+	if name in SYNC_LAUNCHERS:
+		if _sync_launcher is None:
+			_sync_launcher = _create_launcher(name)
+		returncode, stdout, stderr = _sync_launcher.run(args, cwd=cwd)
+		if check and returncode:
+			raise subprocess.CalledProcessError(returncode, args, stdout, stderr)
+		return stdout.decode(encoding).rstrip() if rstrip else stdout.decode(encoding)
 	p = subprocess.run(
 		args,
-		cwd=cwd if cwd is not None else pathlib.Path.home(),
+		cwd=cwd,
 		shell=False,
 		check=check,
 		capture_output=capture_output,
@@ -18,19 +89,131 @@ def run_sync(*args, cwd=None, encoding="UTF-8", capture_output=True, check=True,
 	return result
 
 
+# Stdout is read in chunks of this size, and no more is read until the records are consumed.
+STREAM_CHUNK_SIZE = 64 * 1024
+# Stderr beyond this size is read and discarded.
+MAX_STDERR_SIZE = 1024 * 1024
+
+
 async def run_async(*args, cwd=None, stdin=None, stderr_ok=False, returncode_ok=None):
-	p = await asyncio.create_subprocess_exec(
-		*args,
-		stdout=subprocess.PIPE,
-		stderr=subprocess.PIPE,
-		stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
-		env=_git_env,
-		encoding=None, # We want bytes
-	)
-	assert isinstance(stdin, (str, bytes, type(None)))
-	if isinstance(stdin, str):
-		stdin = stdin.encode("utf_8")
-	stdout, stderr = await p.communicate(input=stdin)
+	chunks = []
+	async for chunk in stream_async(*args, stdin=stdin, delimiter=None, stderr_ok=stderr_ok, returncode_ok=returncode_ok):
+		chunks.append(chunk)
+	return b"".join(chunks).decode("utf_8")
+
+
+async def stream_async(*args, stdin=None, delimiter=b"\n", stderr_ok=False, returncode_ok=None):
+	"""
+	Yields records of stdout as bytes, split on the single byte `delimiter` which is not included,
+	or chunks as they are read if `delimiter` is `None`. Stdout is only read as records are
+	consumed, a slow consumer blocks the process instead of its output piling up in memory.
+
+	`stdin` is bytes, str, or an iterable or async iterable of them, written as the process reads
+	it. The return code and stderr are checked like `run_async()` does, once stdout is exhausted.
+	Closing the generator early kills the process, which is what `contextlib.aclosing()` does for
+	an `async for` that might not run to completion.
+	"""
+	global processes_started # pylint: disable=global-statement
+	assert delimiter is None or len(delimiter) == 1, delimiter
+	processes_started += 1
+	p = await _get_launcher().spawn(args, stdin=stdin is not None)
+	stdin_writer = asyncio.ensure_future(_write_stdin(p.stdin, stdin)) if stdin is not None else None
+	stderr_reader = asyncio.ensure_future(_read_stderr(p.stderr))
+	completed = False
+	try:
+		parts = []
+		while chunk := await p.stdout.read(STREAM_CHUNK_SIZE):
+			if delimiter is None:
+				yield chunk
+				continue
+			start = 0
+			while (end := chunk.find(delimiter, start)) >= 0:
+				if parts:
+					parts.append(chunk[start:end])
+					yield b"".join(parts)
+					parts = []
+				else:
+					yield chunk[start:end]
+				start = end + 1
+			if start < len(chunk):
+				parts.append(chunk[start:])
+		if parts:
+			yield b"".join(parts)
+		if stdin_writer is not None:
+			await stdin_writer
+		stderr = await stderr_reader
+		await p.wait()
+		completed = True
+	finally:
+		if not completed:
+			tasks = [task for task in (stdin_writer, stderr_reader) if task is not None]
+			for task in tasks:
+				task.cancel()
+			# Nothing may be reading stderr while `_kill()` does.
+			await asyncio.gather(*tasks, return_exceptions=True)
+			await _kill(p, readers=(p.stdout, p.stderr))
+	_check_result(args, p.returncode, stderr, stderr_ok=stderr_ok, returncode_ok=returncode_ok)
+
+
+async def start_async(*args):
+	"""
+	Starts a process to talk to over its stdin and stdout for as long as needed, unlike the other
+	functions here. It must be ended with `stop_async()`.
+	"""
+	global processes_started # pylint: disable=global-statement
+	processes_started += 1
+	return await _get_launcher().spawn(args, stdin=True)
+
+
+async def stop_async(p, timeout=1):
+	"""
+	Closes stdin of a process started with `start_async()`, which tells most programs to exit, and
+	kills it if it doesn't within `timeout` seconds.
+	"""
+	try:
+		p.stdin.close()
+		await asyncio.wait_for(p.wait(), timeout)
+	except (TimeoutError, OSError):
+		pass
+	finally:
+		await _kill(p)
+
+
+async def _write_stdin(writer, stdin):
+	try:
+		if isinstance(stdin, (str, bytes)):
+			stdin = [stdin]
+		if hasattr(stdin, "__aiter__"):
+			async for chunk in stdin:
+				await _write_chunk(writer, chunk)
+		else:
+			for chunk in stdin:
+				await _write_chunk(writer, chunk)
+	except (BrokenPipeError, ConnectionResetError):
+		# The process exited without reading all of it, which its return code will tell about.
+		pass
+	finally:
+		writer.close()
+
+
+async def _write_chunk(writer, chunk):
+	assert isinstance(chunk, (str, bytes)), type(chunk)
+	writer.write(chunk.encode("utf_8") if isinstance(chunk, str) else chunk)
+	# Waits while the pipe is full.
+	await writer.drain()
+
+
+async def _read_stderr(reader):
+	result = []
+	size = 0
+	while chunk := await reader.read(STREAM_CHUNK_SIZE):
+		if size < MAX_STDERR_SIZE:
+			result.append(chunk[:MAX_STDERR_SIZE - size])
+			size += len(result[-1])
+	return b"".join(result)
+
+
+def _check_result(args, returncode, stderr, *, stderr_ok, returncode_ok):
 	returncode_checker = None
 	if callable(returncode_ok):
 		returncode_checker = returncode_ok
@@ -38,10 +221,31 @@ async def run_async(*args, cwd=None, stdin=None, stderr_ok=False, returncode_ok=
 		def assert_returncode(returncode):
 			return returncode == (returncode_ok if returncode_ok is not None else 0)
 		returncode_checker = assert_returncode
-	assert returncode_checker(p.returncode), (args, p.returncode, stderr)
+	assert returncode_checker(returncode), (args, returncode, stderr)
 	if not stderr_ok:
-		assert not stderr, (args, p.returncode, stderr)
-	return stdout.decode("utf_8")
+		assert not stderr, (args, returncode, stderr)
+
+
+async def _kill(p, readers=()):
+	"""
+	Kills the process and reads what is left in `readers`, its pipes nothing else reads anymore. An
+	asyncio process isn't done before all of its pipes are closed, and one that stopped being read
+	with a full buffer never is.
+	"""
+	if p.returncode is not None:
+		return
+	try:
+		p.kill()
+	except ProcessLookupError:
+		pass
+	async def discard(reader):
+		while await reader.read(STREAM_CHUNK_SIZE):
+			pass
+	# Reap the child unless it's stuck in the kernel (e.g. on a stale NFS mount).
+	try:
+		await asyncio.wait_for(asyncio.gather(p.wait(), *(discard(r) for r in readers)), 1)
+	except TimeoutError:
+		pass
 
 
 def git_describe(cwd=None):
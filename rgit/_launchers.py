@@ -0,0 +1,583 @@
+import asyncio, collections, json, os, signal, socket, subprocess, sys, threading, time
+
+
+# Ways to start git processes, selected with `--launcher` or the RGIT_LAUNCHER environment
+# variable (see `_gitcli.set_launcher()`). All of them return objects with the part of the
+# interface of `asyncio.subprocess.Process` that `_gitcli` uses - `stdin`, `stdout`, `stderr`,
+# `returncode`, `wait()`, `kill()` and `communicate()`.
+#
+# * "asyncio" - `asyncio.create_subprocess_exec()`. Python forks (or vforks) itself and, before
+#   Python 3.12, a thread is started for every child to wait for it to exit.
+# * "spawn" - `posix_spawn()`, which never copies the page tables of the parent, and a pidfd to
+#   wait for the child on the event loop instead of a thread. Linux only.
+# * "forkserver" - a small helper process (`_forkserver.py`) started on first use spawns all the
+#   children and passes their exit statuses back.
+# * "record" - the processes are started like "asyncio" does, and their arguments, stdin, output,
+#   return code and duration are appended to the fixture file named by RGIT_FIXTURE, one JSON
+#   object per line.
+# * "replay" - no processes are started, the output recorded for the same arguments is served
+#   from the fixture file instead, after the number of seconds in RGIT_REPLAY_LATENCY (0 by
+#   default) or, with "recorded", as long as the process took when recorded. A "latency" added to
+#   a record in the fixture overrides it, e.g. to simulate a hung repository.
+#
+# Recording and replaying makes the time rgit itself spends parsing, scheduling and rendering
+# measurable without the noise of git and the file system:
+#
+#	RGIT_LAUNCHER=record RGIT_FIXTURE=status.jsonl rgit status
+#	RGIT_LAUNCHER=replay RGIT_FIXTURE=status.jsonl python -m cProfile -m rgit status
+#
+# Processes with the same arguments are replayed in the order they were recorded, and the last one
+# is repeated if there are more, and stdin is not compared. `git cat-file --batch` and
+# `--batch-check`, which are fed requests while they run, are the exception - what they answered to
+# each line is recorded as "exchanges", and a replayed one answers every line written to it with
+# what any process with the same arguments answered to it, whatever the order they're asked in.
+
+FIXTURE_ENV_VAR = "RGIT_FIXTURE"
+REPLAY_LATENCY_ENV_VAR = "RGIT_REPLAY_LATENCY"
+
+
+class AsyncioLauncher(object):
+	def __init__(self, env):
+		self._env = env
+
+	async def spawn(self, args, *, stdin):
+		return await asyncio.create_subprocess_exec(
+			*args,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.PIPE,
+			stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+			env=self._env,
+		)
+
+	async def close(self):
+		pass
+
+
+class SpawnLauncher(object):
+	def __init__(self, env):
+		if not (hasattr(os, "posix_spawnp") and hasattr(os, "pidfd_open")):
+			raise RuntimeError("the spawn launcher needs posix_spawn and pidfd support")
+		self._env = env
+
+	async def spawn(self, args, *, stdin):
+		pipes = _Pipes(stdin)
+		try:
+			pid = os.posix_spawnp(args[0], args, self._env, file_actions=[
+				(os.POSIX_SPAWN_DUP2, fd, i) for i, fd in enumerate(pipes.child_fds())
+			])
+		except BaseException:
+			pipes.close()
+			raise
+		pipes.close_child_fds()
+		pidfd = os.pidfd_open(pid)
+		loop = asyncio.get_running_loop()
+		exited = loop.create_future()
+		def on_exit():
+			loop.remove_reader(pidfd)
+			os.close(pidfd)
+			_, status = os.waitpid(pid, 0)
+			if not exited.done():
+				exited.set_result(os.waitstatus_to_exitcode(status))
+		loop.add_reader(pidfd, on_exit)
+		def kill():
+			if not exited.done():
+				signal.pidfd_send_signal(pidfd, signal.SIGKILL)
+		return await _Process.create(pipes, exited, kill)
+
+	async def close(self):
+		pass
+
+
+class ForkserverLauncher(object):
+	def __init__(self, env):
+		self._env = env
+		self._sock = None
+		self._helper = None
+		self._loop = None
+		self._next_id = 0
+		# Futures for the pid and the exit status of every child.
+		self._started = {}
+		self._exited = {}
+
+	def _start(self):
+		parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+		with child_sock:
+			self._helper = subprocess.Popen(
+				[sys.executable, os.path.join(os.path.dirname(__file__), "_forkserver.py"), str(child_sock.fileno())],
+				stdin=subprocess.DEVNULL, pass_fds=[child_sock.fileno()], env=self._env,
+			)
+		self._sock = parent_sock
+		self._loop = asyncio.get_running_loop()
+		self._loop.add_reader(self._sock.fileno(), self._on_message)
+
+	def _on_message(self):
+		try:
+			data = self._sock.recv(65536)
+		except OSError:
+			data = b""
+		if not data:
+			self._fail(BrokenPipeError("the forkserver helper exited"))
+			return
+		message = json.loads(data)
+		request_id = message["id"]
+		if "returncode" in message:
+			future = self._exited.pop(request_id, None)
+			if future is not None and not future.done():
+				future.set_result(message["returncode"])
+			return
+		future = self._started.pop(request_id, None)
+		if future is None or future.done():
+			return
+		if "pid" in message:
+			future.set_result(message["pid"])
+		else:
+			self._exited.pop(request_id, None)
+			future.set_exception(OSError(message["errno"], message["error"]))
+
+	def _fail(self, exception):
+		self._loop.remove_reader(self._sock.fileno())
+		for futures in (self._started, self._exited):
+			for future in futures.values():
+				if not future.done():
+					future.set_exception(exception)
+			futures.clear()
+
+	async def spawn(self, args, *, stdin):
+		if self._sock is None:
+			self._start()
+		self._next_id += 1
+		request_id = self._next_id
+		started = self._started[request_id] = self._loop.create_future()
+		exited = self._exited[request_id] = self._loop.create_future()
+		pipes = _Pipes(stdin)
+		try:
+			message = json.dumps({"id": request_id, "args": list(args)}).encode("utf_8")
+			socket.send_fds(self._sock, [message], pipes.child_fds())
+			pipes.close_child_fds()
+			await started
+		except BaseException:
+			self._started.pop(request_id, None)
+			self._exited.pop(request_id, None)
+			pipes.close()
+			raise
+		def kill():
+			if not exited.done():
+				try:
+					self._sock.send(json.dumps({"kill": request_id}).encode("utf_8"))
+				except (OSError, AttributeError) as e:
+					raise ProcessLookupError() from e
+		return await _Process.create(pipes, exited, kill)
+
+	async def close(self):
+		if self._sock is None:
+			return
+		self._loop.remove_reader(self._sock.fileno())
+		self._sock.close()
+		self._sock = None
+		# The helper kills the remaining children and exits once the socket is closed.
+		await asyncio.get_running_loop().run_in_executor(None, self._helper.wait)
+
+
+class RecordLauncher(object):
+	def __init__(self, env, *, fixture=None):
+		self._env = env
+		self._fixture = fixture if fixture is not None else _get_fixture_path()
+		self._launcher = AsyncioLauncher(env)
+		self._lock = threading.Lock()
+
+	async def spawn(self, args, *, stdin):
+		started = time.monotonic()
+		p = await self._launcher.spawn(args, stdin=stdin)
+		return _RecordedProcess(p, lambda stdin, stdout, stderr: self._record(
+			args, None, stdin, stdout, stderr, p.returncode, time.monotonic() - started,
+		))
+
+	def run(self, args, *, cwd):
+		"""
+		Runs the process to completion and returns its return code, stdout and stderr, like
+		`_gitcli.run_sync()` does without a launcher.
+		"""
+		started = time.monotonic()
+		p = subprocess.run(args, cwd=cwd, capture_output=True, stdin=subprocess.DEVNULL, env=self._env, check=False)
+		self._record(args, cwd, b"", p.stdout, p.stderr, p.returncode, time.monotonic() - started)
+		return p.returncode, p.stdout, p.stderr
+
+	def _record(self, args, cwd, stdin, stdout, stderr, returncode, duration):
+		record = {
+			"args": [os.fspath(a) for a in args],
+			"cwd": os.fspath(cwd) if cwd is not None else None,
+			"stdin": _decode(stdin),
+			"stdout": _decode(stdout),
+			"stderr": _decode(stderr),
+			"returncode": returncode,
+			"duration": duration,
+		}
+		exchanges = _split_exchanges(args, stdin, stdout)
+		if exchanges is not None:
+			record["exchanges"] = [[_decode(request), _decode(response)] for request, response in exchanges]
+		line = json.dumps(record) + "\n"
+		with self._lock, open(self._fixture, "a", encoding="utf_8") as fo:
+			fo.write(line)
+
+	async def close(self):
+		pass
+
+
+class ReplayLauncher(object):
+	def __init__(self, env, *, fixture=None, latency=None):
+		del env
+		if latency is None:
+			latency = os.environ.get(REPLAY_LATENCY_ENV_VAR) or 0
+		self._latency = latency if latency == "recorded" else float(latency)
+		# `(args, cwd)` to the records not replayed yet, the last one is never removed.
+		self._records = collections.defaultdict(collections.deque)
+		# `args` to the responses to each request of all recorded exchanges.
+		self._answers = {}
+		with open(fixture if fixture is not None else _get_fixture_path(), "r", encoding="utf_8") as fo:
+			for line in fo:
+				record = json.loads(line)
+				self._records[(tuple(record["args"]), record["cwd"])].append(record)
+				if "exchanges" in record:
+					answers = self._answers.setdefault(tuple(record["args"]), {})
+					for request, response in record["exchanges"]:
+						answers[_encode(request)] = _encode(response)
+		self._lock = threading.Lock()
+
+	async def spawn(self, args, *, stdin):
+		record = self._next_record(args, None)
+		answers = self._answers.get(tuple(os.fspath(a) for a in args))
+		return _ReplayedProcess(record, self._get_latency(record), stdin=stdin, answers=answers)
+
+	def run(self, args, *, cwd):
+		record = self._next_record(args, cwd)
+		time.sleep(self._get_latency(record))
+		return record["returncode"], _encode(record["stdout"]), _encode(record["stderr"])
+
+	def _next_record(self, args, cwd):
+		key = (tuple(os.fspath(a) for a in args), os.fspath(cwd) if cwd is not None else None)
+		with self._lock:
+			records = self._records.get(key)
+			if not records:
+				raise LookupError("no recording of the process", args, cwd)
+			return records.popleft() if len(records) > 1 else records[0]
+
+	def _get_latency(self, record):
+		if "latency" in record:
+			return record["latency"]
+		return record["duration"] if self._latency == "recorded" else self._latency
+
+	async def close(self):
+		pass
+
+
+LAUNCHERS = {
+	"asyncio": AsyncioLauncher,
+	"spawn": SpawnLauncher,
+	"forkserver": ForkserverLauncher,
+	"record": RecordLauncher,
+	"replay": ReplayLauncher,
+}
+
+
+def _get_fixture_path():
+	path = os.environ.get(FIXTURE_ENV_VAR)
+	if not path:
+		raise RuntimeError(f"the record and replay launchers need the fixture file in ${FIXTURE_ENV_VAR}")
+	return path
+
+
+# Output is mostly text, anything else is kept with the surrogates `surrogateescape` decodes it to.
+def _decode(data):
+	return data.decode("utf_8", errors="surrogateescape")
+
+
+def _encode(text):
+	return text.encode("utf_8", errors="surrogateescape")
+
+
+def _split_exchanges(args, stdin, stdout):
+	"""
+	Returns `(request, response)` pairs of the lines written to a `git cat-file --batch` or
+	`--batch-check` process and its output for each, or `None` for other processes.
+	"""
+	args = [os.fspath(a) for a in args]
+	if "cat-file" not in args or args[-1] not in ("--batch", "--batch-check"):
+		return None
+	exchanges = []
+	position = 0
+	for request in stdin.split(b"\n")[:-1]:
+		end = stdout.find(b"\n", position) + 1
+		if not end:
+			break
+		header = stdout[position:end - 1].split(b" ")
+		# Missing and ambiguous objects only get the header.
+		if args[-1] == "--batch" and len(header) == 3:
+			end += int(header[2]) + 1
+		if end > len(stdout):
+			break
+		exchanges.append((request, stdout[position:end]))
+		position = end
+	return exchanges
+
+
+class _Pipes(object):
+	"""
+	The pipes for stdin, stdout and stderr of a child, stdin is /dev/null unless requested.
+	"""
+
+	def __init__(self, stdin):
+		self.stdin = os.pipe() if stdin else (os.open(os.devnull, os.O_RDONLY), None)
+		self.stdout = os.pipe()
+		self.stderr = os.pipe()
+
+	def child_fds(self):
+		return [self.stdin[0], self.stdout[1], self.stderr[1]]
+
+	def close_child_fds(self):
+		for fd in self.child_fds():
+			os.close(fd)
+
+	def close(self):
+		for fd in (*self.stdin, *self.stdout, *self.stderr):
+			if fd is not None:
+				try:
+					os.close(fd)
+				except OSError:
+					pass
+
+
+class _Process(object):
+	def __init__(self, exited, kill):
+		self._exited = exited
+		self._kill = kill
+		self.stdin = None
+		self.stdout = None
+		self.stderr = None
+
+	@classmethod
+	async def create(cls, pipes, exited, kill):
+		loop = asyncio.get_running_loop()
+		p = cls(exited, kill)
+		p.stdout = await cls._connect_read_pipe(loop, pipes.stdout[0])
+		p.stderr = await cls._connect_read_pipe(loop, pipes.stderr[0])
+		if pipes.stdin[1] is not None:
+			transport, protocol = await loop.connect_write_pipe(
+				asyncio.streams.FlowControlMixin, open(pipes.stdin[1], "wb", buffering=0),
+			)
+			p.stdin = asyncio.StreamWriter(transport, protocol, None, loop)
+		return p
+
+	@staticmethod
+	async def _connect_read_pipe(loop, fd):
+		reader = asyncio.StreamReader()
+		await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), open(fd, "rb", buffering=0))
+		return reader
+
+	@property
+	def returncode(self):
+		return self._exited.result() if self._exited.done() and not self._exited.exception() else None
+
+	async def wait(self):
+		return await asyncio.shield(self._exited)
+
+	def kill(self):
+		if self._exited.done():
+			raise ProcessLookupError()
+		self._kill()
+
+	async def communicate(self, input=None): # pylint: disable=redefined-builtin
+		return await _communicate(self, input)
+
+
+class _RecordedProcess(object):
+	"""
+	A process that keeps what was written to its stdin and read from its stdout and stderr, and
+	passes it to `on_exit(stdin, stdout, stderr)` once it exits.
+	"""
+
+	def __init__(self, p, on_exit):
+		self._p = p
+		self._on_exit = on_exit
+		self.stdin = _RecordingWriter(p.stdin) if p.stdin is not None else None
+		self.stdout = _RecordingReader(p.stdout)
+		self.stderr = _RecordingReader(p.stderr)
+
+	@property
+	def returncode(self):
+		return self._p.returncode
+
+	async def wait(self):
+		returncode = await self._p.wait()
+		if self._on_exit is not None:
+			on_exit, self._on_exit = self._on_exit, None
+			on_exit(
+				b"".join(self.stdin.data) if self.stdin is not None else b"",
+				b"".join(self.stdout.data),
+				b"".join(self.stderr.data),
+			)
+		return returncode
+
+	def kill(self):
+		self._p.kill()
+
+	async def communicate(self, input=None): # pylint: disable=redefined-builtin
+		return await _communicate(self, input)
+
+
+class _RecordingReader(object):
+	def __init__(self, reader):
+		self._reader = reader
+		self.data = []
+
+	async def read(self, n=-1):
+		return self._keep(await self._reader.read(n))
+
+	async def readline(self):
+		return self._keep(await self._reader.readline())
+
+	async def readexactly(self, n):
+		try:
+			return self._keep(await self._reader.readexactly(n))
+		except asyncio.IncompleteReadError as e:
+			self._keep(e.partial)
+			raise
+
+	def _keep(self, data):
+		self.data.append(data)
+		return data
+
+
+class _RecordingWriter(object):
+	def __init__(self, writer):
+		self._writer = writer
+		self.data = []
+
+	def write(self, data):
+		self.data.append(data)
+		self._writer.write(data)
+
+	def __getattr__(self, name):
+		return getattr(self._writer, name)
+
+
+class _ReplayedProcess(object):
+	"""
+	Serves the output of the record after `latency` seconds. With `answers`, the responses to the
+	requests written to stdin are served instead, as they are written, until stdin is closed.
+	"""
+
+	def __init__(self, record, latency, *, stdin, answers=None):
+		loop = asyncio.get_running_loop()
+		self._exited = loop.create_future()
+		self._answers = answers
+		# Responses to requests written before the latency is over.
+		self._delayed = []
+		if answers is not None:
+			self.stdin = _AnsweringWriter(answers, self._respond)
+		else:
+			self.stdin = _DiscardingWriter() if stdin else None
+		self.stdout = asyncio.StreamReader()
+		self.stderr = asyncio.StreamReader()
+		self._replay = asyncio.ensure_future(self._run(record, latency))
+
+	async def _run(self, record, latency):
+		await asyncio.sleep(latency)
+		if self._answers is None:
+			self.stdout.feed_data(_encode(record["stdout"]))
+		else:
+			delayed, self._delayed = self._delayed, None
+			for response in delayed:
+				self.stdout.feed_data(response)
+			await self.stdin.closed.wait()
+		self.stderr.feed_data(_encode(record["stderr"]))
+		self._exit(record["returncode"])
+
+	def _respond(self, response):
+		if self._delayed is not None:
+			self._delayed.append(response)
+		else:
+			self.stdout.feed_data(response)
+
+	def _exit(self, returncode):
+		self.stdout.feed_eof()
+		self.stderr.feed_eof()
+		self._exited.set_result(returncode)
+
+	@property
+	def returncode(self):
+		return self._exited.result() if self._exited.done() else None
+
+	async def wait(self):
+		return await asyncio.shield(self._exited)
+
+	def kill(self):
+		if self._exited.done():
+			raise ProcessLookupError()
+		self._replay.cancel()
+		self._exit(-signal.SIGKILL)
+
+	async def communicate(self, input=None): # pylint: disable=redefined-builtin
+		return await _communicate(self, input)
+
+
+class _DiscardingWriter(object):
+	def __init__(self):
+		self._closed = False
+
+	def write(self, data):
+		if self._closed:
+			raise BrokenPipeError()
+
+	async def drain(self):
+		pass
+
+	def close(self):
+		self._closed = True
+
+	def is_closing(self):
+		return self._closed
+
+	async def wait_closed(self):
+		pass
+
+
+class _AnsweringWriter(_DiscardingWriter):
+	"""
+	Passes the recorded response to each line written to `respond()`.
+	"""
+
+	def __init__(self, answers, respond):
+		super().__init__()
+		self._answers = answers
+		self._respond = respond
+		self._buffer = b""
+		self.closed = asyncio.Event()
+
+	def write(self, data):
+		super().write(data)
+		*requests, self._buffer = (self._buffer + data).split(b"\n")
+		for request in requests:
+			response = self._answers.get(request)
+			if response is None:
+				raise LookupError("no recording of the response to the request", _decode(request))
+			self._respond(response)
+
+	def close(self):
+		super().close()
+		self.closed.set()
+
+
+async def _communicate(p, input): # pylint: disable=redefined-builtin
+	async def feed_stdin():
+		if p.stdin is None:
+			return
+		if input:
+			p.stdin.write(input)
+		try:
+			await p.stdin.drain()
+		except (BrokenPipeError, ConnectionResetError):
+			pass
+		p.stdin.close()
+	_, stdout, stderr = await asyncio.gather(feed_stdin(), p.stdout.read(), p.stderr.read())
+	await p.wait()
+	return stdout, stderr
@@ -0,0 +1,86 @@
+import asyncio, contextlib, pathlib
+from . import configuration, scheduling
+from .cli.status import Status
+
+
+# The library interface to what `rgit status` does, for programs that would otherwise run
+# `rgit status --json` and parse its output.
+#
+#	session = rgit.api.Session(await rgit.api.load_config())
+#	async for status in session.iter_status():
+#		if status:
+#			print(status.path, status.to_dict())
+#
+# The results are `rgit.repostatus.RepoStatus` records, the same ones the table is rendered from.
+# Commits are looked up by `git cat-file` processes kept running for a few seconds, await
+# `rgit.catfile.close_pool()` before the event loop is closed to stop them right away.
+
+
+async def load_config(path=None):
+	"""
+	Loads the configuration from `path`, or from where `rgit` finds it by default.
+	"""
+	return await configuration.load(config_file_path=path if path is not None else configuration.find_default_path())
+
+
+class Session(object):
+	"""
+	Inspects repositories like `rgit status` does. Limits on the number of repositories inspected at
+	once are shared by all calls of `iter_status()`, and the commit walks already made by the
+	concurrent ones, so a long-lived program should keep using one session. It can only be used from
+	one event loop. The cache `rgit prompt` reads is only updated if `write_prompt_entries` is set.
+	"""
+
+	def __init__(self, config, *, jobs=None, device_jobs=None, quick=False, repo_timeout=None,
+		write_prompt_entries=False,
+	):
+		self._config = config
+		self._status = Status()
+		self._status.prepare(config, quick=quick, prompt_entries=write_prompt_entries)
+		self._limiter = scheduling.DeviceLimiter(
+			jobs=jobs if jobs is not None else config.jobs,
+			device_jobs=device_jobs,
+			configured_device_jobs=config.device_jobs,
+		)
+		self._repo_timeout = repo_timeout
+		# The number of calls of `iter_status()` not done yet.
+		self._iterating = 0
+
+	async def iter_status(self, repos=None):
+		"""
+		Yields the `RepoStatus` of each of `repos`, all configured repositories by default, in the
+		order they are done. Repositories still being inspected when the iteration is stopped are
+		cancelled.
+		"""
+		repos = [pathlib.Path(r) for r in (repos if repos is not None else self._config.repositories)]
+		self._iterating += 1
+		tasks = []
+		try:
+			await self._limiter.prepare()
+			tasks = [
+				asyncio.ensure_future(self._status.inspect_repo(repo, self._limiter, timeout=self._repo_timeout))
+				for repo in repos
+			]
+			for task in asyncio.as_completed(tasks):
+				status, _ = await task
+				yield status
+		finally:
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(*tasks, return_exceptions=True)
+			self._iterating -= 1
+			if not self._iterating:
+				# Nothing is left to share the walks with, keeping them would only grow the memo.
+				self._status._commit_walks.clear() # pylint: disable=protected-access
+
+
+async def iter_status(repos=None, *, config=None, **kwargs):
+	"""
+	Yields the `RepoStatus` of each of `repos` in a new `Session`, see `Session.iter_status()`.
+	`config` is loaded with `load_config()` if not passed, other arguments are passed to `Session`.
+	"""
+	if config is None:
+		config = await load_config()
+	async with contextlib.aclosing(Session(config, **kwargs).iter_status(repos)) as statuses:
+		async for status in statuses:
+			yield status
@@ -0,0 +1,223 @@
+import asyncio, collections, os
+from . import _gitcli
+
+
+# Long-running `git cat-file --batch` and `--batch-check` processes, shared by all lookups in the
+# same repository. Requests are written as they come and the responses are read in the same order,
+# so many lookups, also concurrent ones, cost one process per repository instead of one per object.
+
+DEFAULT_MAX_PROCESSES = 16
+DEFAULT_IDLE_TIMEOUT = 5.0
+
+GitObject = collections.namedtuple("GitObject", ("oid", "type", "size", "data"))
+
+
+class UnexpectedOutputError(Exception):
+	"""
+	The output of `git cat-file` doesn't answer the request it's read for.
+	"""
+
+# The pool shared by `rgit.git.get_objects()` and the event loop it was created for.
+_pool = None
+_pool_loop = None
+
+
+def get_pool():
+	global _pool, _pool_loop # pylint: disable=global-statement
+	loop = asyncio.get_running_loop()
+	if _pool is None or _pool_loop is not loop:
+		_pool = CatFilePool()
+		_pool_loop = loop
+	return _pool
+
+
+async def close_pool():
+	"""
+	Stops the processes of the shared pool, if any. Must be called before the event loop is closed.
+	"""
+	global _pool # pylint: disable=global-statement
+	if _pool is not None:
+		pool, _pool = _pool, None
+		await pool.close()
+
+
+class CatFilePool(object):
+	"""
+	At most `max_processes` processes are kept running, those with no requests in flight are
+	stopped after `idle_timeout` seconds or when another repository needs one. Can only be used
+	from one event loop.
+	"""
+
+	def __init__(self, *, max_processes=DEFAULT_MAX_PROCESSES, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+		self._max_processes = max_processes
+		self._idle_timeout = idle_timeout
+		# `(gitdir, mode)` to `_CatFile`, least recently used first.
+		self._processes = collections.OrderedDict()
+		# Keys of the processes being started.
+		self._starting = set()
+		self._changed = asyncio.Condition()
+
+	async def get_objects(self, gitdir, oids, *, contents=True):
+		"""
+		Returns a `GitObject` for each of the object names (anything `git rev-parse` understands) in
+		the same order, or `None` for those that don't exist. `data` is `None` unless `contents`.
+		"""
+		oids = list(oids)
+		if not oids:
+			return []
+		process = await self._acquire((os.fspath(gitdir), "--batch" if contents else "--batch-check"))
+		try:
+			return await process.request(oids)
+		finally:
+			await self._release(process)
+
+	async def close(self):
+		processes = list(self._processes.values())
+		self._processes.clear()
+		await asyncio.gather(*(p.stop() for p in processes))
+
+	async def _acquire(self, key):
+		async with self._changed:
+			while True:
+				process = self._processes.get(key)
+				if process is not None and not process.failed:
+					self._processes.move_to_end(key)
+					process.users += 1
+					return process
+				if process is not None:
+					del self._processes[key]
+					asyncio.ensure_future(process.stop())
+				if key in self._starting:
+					# Another lookup is starting a process for the repo already.
+					await self._changed.wait()
+					continue
+				if len(self._processes) + len(self._starting) < self._max_processes:
+					break
+				idle = next((k for k, p in self._processes.items() if not p.users), None)
+				if idle is not None:
+					asyncio.ensure_future(self._processes.pop(idle).stop())
+					break
+				await self._changed.wait()
+			self._starting.add(key)
+		process = None
+		try:
+			gitdir, mode = key
+			process = await _CatFile.start(gitdir, mode, self._idle_timeout, self._on_idle)
+		finally:
+			async with self._changed:
+				self._starting.discard(key)
+				if process is not None:
+					self._processes[key] = process
+					process.users += 1
+				self._changed.notify_all()
+		return process
+
+	async def _release(self, process):
+		async with self._changed:
+			process.users -= 1
+			if not process.users:
+				process.schedule_idle_stop()
+				self._changed.notify_all()
+
+	def _on_idle(self, process):
+		key = process.key
+		if self._processes.get(key) is process and not process.users:
+			del self._processes[key]
+			asyncio.ensure_future(process.stop())
+
+
+class _CatFile(object):
+	def __init__(self, key, p, idle_timeout, on_idle):
+		self.key = key
+		self.users = 0
+		self.failed = False
+		self._p = p
+		self._idle_timeout = idle_timeout
+		self._on_idle = on_idle
+		self._idle_handle = None
+		# Object names and futures of the requests written and not yet answered, in order.
+		self._pending = collections.deque()
+		self._reader = asyncio.ensure_future(self._read())
+
+	@classmethod
+	async def start(cls, gitdir, mode, idle_timeout, on_idle):
+		p = await _gitcli.start_async("git", "--git-dir", gitdir, "cat-file", mode)
+		return cls((gitdir, mode), p, idle_timeout, on_idle)
+
+	async def request(self, oids):
+		if self._idle_handle is not None:
+			self._idle_handle.cancel()
+			self._idle_handle = None
+		loop = asyncio.get_running_loop()
+		futures = []
+		for oid in oids:
+			if self.failed:
+				raise BrokenPipeError("git cat-file exited")
+			if "\n" in oid:
+				raise ValueError("object names can't contain newlines", oid)
+			self._p.stdin.write(f"{oid}\n".encode("utf_8"))
+			future = loop.create_future()
+			self._pending.append((oid, future))
+			futures.append(future)
+		await self._p.stdin.drain()
+		return await asyncio.gather(*futures)
+
+	def schedule_idle_stop(self):
+		if self._idle_handle is not None:
+			self._idle_handle.cancel()
+		self._idle_handle = asyncio.get_running_loop().call_later(self._idle_timeout, self._on_idle, self)
+
+	async def stop(self):
+		if self._idle_handle is not None:
+			self._idle_handle.cancel()
+		await _gitcli.stop_async(self._p)
+		self._reader.cancel()
+		await asyncio.gather(self._reader, return_exceptions=True)
+
+	async def _read(self):
+		stdout = self._p.stdout
+		# The future of the request being answered.
+		future = None
+		try:
+			while True:
+				header = await stdout.readline()
+				if not header:
+					raise BrokenPipeError("git cat-file exited")
+				header = header.decode("utf_8").rstrip("\n")
+				if not self._pending:
+					raise UnexpectedOutputError("git cat-file output with no request for it", header)
+				name, future = self._pending.popleft()
+				missing_name, _, missing = header.rpartition(" ")
+				if missing in ("missing", "ambiguous"):
+					# The name is echoed back as it was written.
+					if missing_name != name:
+						raise UnexpectedOutputError("git cat-file answered another request", name, header)
+					result = None
+				else:
+					oid, object_type, size = header.split(" ")
+					if _is_full_oid(name) and oid != name.lower():
+						raise UnexpectedOutputError("git cat-file answered another request", name, header)
+					if self.key[1] == "--batch":
+						data = await stdout.readexactly(int(size) + 1)
+						result = GitObject(oid, object_type, int(size), data[:-1])
+					else:
+						result = GitObject(oid, object_type, int(size), None)
+				if not future.done():
+					future.set_result(result)
+		except BaseException as e:
+			self.failed = True
+			if isinstance(e, UnexpectedOutputError) and future is not None and not future.done():
+				future.set_exception(e)
+			while self._pending:
+				_, future = self._pending.popleft()
+				if not future.done():
+					if isinstance(e, asyncio.CancelledError):
+						future.cancel()
+					else:
+						future.set_exception(e if isinstance(e, (OSError, UnexpectedOutputError)) else BrokenPipeError(str(e)))
+			if not isinstance(e, (OSError, asyncio.IncompleteReadError, asyncio.CancelledError, UnexpectedOutputError)):
+				raise
+
+
+def _is_full_oid(name):
+	return len(name) in (40, 64) and all(c in "0123456789abcdefABCDEF" for c in name)
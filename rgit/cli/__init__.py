@@ -1,6 +1,21 @@
 import argparse, pathlib, sys
-from .. import configuration, constants
-from . import registry, scan, status, ignored, version
+from .. import _gitcli, catfile, completion, configuration, constants, scheduling
+from . import registry
+
+
+registry.declare("scan", ".scan", description="walk the filesystem to discover new repositories")
+registry.declare("status", ".status", description="display statuses for all repositories")
+registry.declare("ignored", ".ignored", description="show and manipulate ignored files in repositories")
+registry.declare("version", ".version", description="print version")
+registry.declare("prompt", ".prompt",
+	description="print a short summary of the current repository as of the last status for shell prompts",
+)
+registry.declare("history", ".history", description="query the results of previous status runs")
+registry.declare("complete", ".complete", description="print candidates for completing the command line in shells")
+registry.declare("add", ".status", disabled=True)
+registry.declare("remove", ".status", "rm", disabled=True)
+registry.declare("cleanup", ".status", disabled=True)
+registry.declare("foreach", ".status", disabled=True)
 
 
 async def main(args):
@@ -8,30 +23,56 @@ async def main(args):
 	if opts.command is None:
 		parser.print_usage()
 		return
-	config_path = find_config_file(opts)
-	config = await configuration.load(config_file_path=config_path)
-	handler = registry.get_command_handler(opts.command)
-	if handler is not None:
-		handler_instance = handler()
-		await handler_instance.execute(opts=opts, config=config)
-	else:
-		print("external commands are not supported yet")
+	_gitcli.set_launcher(opts.launcher)
+	if opts.background:
+		scheduling.enter_background()
+	try:
+		config_path = find_config_file(opts)
+		config = await configuration.load(config_file_path=config_path)
+		update_completion_index(config)
+		handler = registry.get_command_handler(opts.command)
+		if handler is not None:
+			handler_instance = handler()
+			return await handler_instance.execute(opts=opts, config=config)
+		else:
+			print("external commands are not supported yet")
+	finally:
+		await catfile.close_pool()
+		await _gitcli.close_launcher()
+
+
+def update_completion_index(config):
+	commands = []
+	for name, aliases, _, disabled in registry.enumerate_commands():
+		if not disabled:
+			commands.extend((name, *aliases))
+	try:
+		completion.update_index(
+			command=commands,
+			repository=map(str, config.repositories),
+			folder=map(str, (*config.destination_folders, *config.scan_folders)),
+		)
+	except OSError as e:
+		sys.stderr.write(f"WARNING: failed to update the completion index: {e}\n")
 
 
 def find_config_file(opts):
 	if opts.config_path:
 		return pathlib.Path(opts.config_path)
+	return configuration.find_default_path()
+
 
-	candidates = [
-		(pathlib.Path.home() / ("." + constants.SELF_NAME + ".json")),
-		(pathlib.Path.home() / ".config" / constants.SELF_NAME / "config.json"),
-	]
+class _VersionAction(argparse.Action):
+	"""
+	Like the "version" action, but only finds out the version, which runs `git describe`, if used.
+	"""
 
-	for c in candidates:
-		if c.exists():
-			return c
+	def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help=None): # pylint: disable=redefined-builtin
+		super().__init__(option_strings=option_strings, dest=dest, default=default, nargs=0, help=help)
 
-	return None
+	def __call__(self, parser, namespace, values, option_string=None):
+		from .version import Version # pylint: disable=import-outside-toplevel
+		parser.exit(message=Version.get_version() + "\n")
 
 
 def _parse_args(args=None):
@@ -43,9 +84,8 @@ def _parse_args(args=None):
 
 	parser.add_argument(
 		"-v", "--version",
-		action="version",
-		version=version.Version.get_version(),
-		help=version.Version.short_description(),
+		action=_VersionAction,
+		help="print version",
 	)
 
 	parser.add_argument(
@@ -64,20 +104,54 @@ def _parse_args(args=None):
 		help="do not display display intermediary messages while executing",
 	)
 
+	parser.add_argument(
+		"--launcher",
+		dest="launcher",
+		choices=_gitcli.LAUNCHERS,
+		default=None,
+		help=(
+			f"how git processes are started, defaults to ${_gitcli.LAUNCHER_ENV_VAR} or "
+			f"{_gitcli.DEFAULT_LAUNCHER}; spawn and forkserver start processes faster from a "
+			"large rgit process; record and replay save the output of git to $RGIT_FIXTURE and "
+			"serve it from there"
+		),
+	)
+	parser.add_argument(
+		"--background",
+		dest="background",
+		action="store_true",
+		default=False,
+		help=(
+			"run git at the lowest CPU and I/O priority and process fewer repositories at once while "
+			"the system is busy, e.g. for runs from cron"
+		),
+	)
+
 	subparsers = parser.add_subparsers(
 		title=None,
 		dest="command",
 		metavar="COMMAND",
 	)
 
-	for name, aliases, handler, disabled in registry.enumerate_command_handlers():
+	# The arguments of a command are only defined once it's known to be the selected one, which
+	# needs the module implementing it. Until then, its parser has no "--help" either.
+	command_parsers = {}
+	for name, aliases, description, disabled in registry.enumerate_commands():
 		if disabled:
 			continue
-		handler.define_arguments(subparsers.add_parser(
+		command_parsers[name] = subparsers.add_parser(
 			name,
 			aliases=aliases,
-			help=handler.short_description()
-		))
+			help=description,
+			add_help=False,
+		)
+
+	opts, _ = parser.parse_known_args(args)
+	if opts.command is not None:
+		handler = registry.get_command_handler(opts.command)
+		command_parser = command_parsers[registry.resolve_alias(opts.command)]
+		command_parser.add_argument("-h", "--help", action="help", help="show this help message and exit")
+		handler.define_arguments(command_parser)
 
 	opts = parser.parse_args(args)
 
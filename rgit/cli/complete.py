@@ -0,0 +1,29 @@
+from .registry import command
+from .. import completion
+
+
+@command("complete")
+class Complete(object):
+	@classmethod
+	def define_arguments(cls, parser):
+		parser.add_argument(
+			"--script",
+			dest="script",
+			choices=sorted(completion.SCRIPTS),
+			default=None,
+			help="print the shell function calling this command for completing the command line of rgit",
+		)
+		parser.add_argument(
+			"words",
+			nargs="*",
+			metavar="WORD",
+			help="the words of the command line after \"rgit\", up to the one being completed",
+		)
+
+	def __init__(self):
+		pass
+
+	async def execute(self, *, opts, config):
+		# This is only reached if global options are passed, otherwise `rgit complete` is dispatched
+		# straight to `completion.main()` without loading the rest of rgit.
+		return completion.main(["--script", opts.script] if opts.script is not None else ["--", *opts.words])
@@ -0,0 +1,100 @@
+import json, pathlib, sys, time
+from .registry import command
+from .. import history
+from ..tools import draw_table
+
+
+_DAY = 24 * 60 * 60
+_INTERVALS = {"hour": 60 * 60, "day": _DAY, "week": 7 * _DAY}
+
+
+@command("history")
+class History(object):
+	@classmethod
+	def define_arguments(cls, parser):
+		parser.add_argument(
+			"--json",
+			dest="output_json",
+			action="store_true",
+			default=False,
+			help="output the result in JSON format instead of a rendered table view",
+		)
+		queries = parser.add_subparsers(dest="query", metavar="QUERY", required=True)
+		unclean = queries.add_parser("unclean", help="repositories that have been unclean for a while")
+		unclean.add_argument(
+			"--days",
+			dest="days",
+			type=float,
+			default=7,
+			help="only repositories unclean for at least this many days (default: 7)",
+		)
+		trend = queries.add_parser("trend", help="numbers of unclean repositories and unpushed commits over time")
+		trend.add_argument(
+			"--days",
+			dest="days",
+			type=float,
+			default=30,
+			help="how far back to go (default: 30)",
+		)
+		trend.add_argument(
+			"--every",
+			dest="interval",
+			choices=_INTERVALS,
+			default="day",
+			help="show the last run of every hour, day (default) or week",
+		)
+		repo = queries.add_parser("repo", help="runs that found a repository unclean")
+		repo.add_argument(
+			"--limit",
+			dest="limit",
+			type=int,
+			default=20,
+			help="show at most this many runs, the most recent ones (default: 20)",
+		)
+		repo.add_argument(
+			"path",
+			metavar="GITDIR",
+			help="the repository, as listed by `rgit status`, or its worktree",
+		)
+
+	def __init__(self):
+		pass
+
+	async def execute(self, *, opts, config):
+		now = time.time()
+		with history.History() as h:
+			if opts.query == "unclean":
+				rows = [["Path", "Unclean Since", "Days", "Unpushed Since", "Commits", "Columns"]]
+				for path, unclean_since, unpushed_since, commits, columns in h.get_unclean(now - opts.days * _DAY):
+					rows.append([
+						path, _format_time(unclean_since), round((now - unclean_since) / _DAY, 1),
+						_format_time(unpushed_since), commits, columns,
+					])
+				title = f"Unclean for at least {opts.days:g} days"
+			elif opts.query == "trend":
+				rows = [["Time", "Repositories", "Unclean", "Commits", "Changes"]]
+				for t, *values in h.get_trend(now - opts.days * _DAY, _INTERVALS[opts.interval]):
+					rows.append([_format_time(t), *values])
+				title = f"Last run of every {opts.interval}"
+			else:
+				path = pathlib.Path(opts.path).resolve()
+				if (path / ".git").is_dir():
+					path = path / ".git"
+				records, last_seen = h.get_repo(path, opts.limit)
+				rows = [["Time", "Columns"]]
+				rows.extend([_format_time(t), columns] for t, columns in records)
+				title = f"{path}, last inspected {_format_time(last_seen)}"
+
+		if opts.output_json:
+			json.dump([dict(zip(rows[0], row)) for row in rows[1:]], sys.stdout, indent="\t")
+			sys.stdout.write("\n")
+			return
+		for row in rows[1:]:
+			row[-1] = ", ".join(f"{k}: {v}" for k, v in row[-1].items()) if isinstance(row[-1], dict) else row[-1]
+		draw_table(rows, fo=sys.stdout, title=title, has_header=True)
+
+
+def _format_time(t):
+	if t is None:
+		return "-"
+	return time.strftime("%Y-%m-%d %H:%M", time.localtime(t))
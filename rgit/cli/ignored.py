@@ -1,6 +1,6 @@
-import re, os, sys, pathlib
+import re, os, sys, pathlib, asyncio, contextlib
 from .registry import command
-from .. import git
+from .. import completion, git, scheduling
 from ..tools import is_path_in, path_relative_to_or_unchanged, strict_int, add_status_msg, set_status_msg, draw_table
 
 
@@ -42,15 +42,13 @@ class Ignored(object):
 			choices=["groups", "sources", "files"],
 			help="only show the specified lists"
 		)
+		scheduling.define_arguments(parser)
 		parser.add_argument(
 			"folders",
 			nargs="*",
 			metavar="FOLDER",
 			help="only inspect repositories worktrees of which are in one of specified folders"
 		)
-	@classmethod
-	def short_description(cls):
-		return "show and manipulate ignored files in repositories"
 
 	def __init__(self):
 		self._config = None
@@ -63,66 +61,21 @@ class Ignored(object):
 		opts.not_in_groups = set(opts.not_in_groups)
 
 		ignore_group_reader = IgnoreGroupReader()
+		limiter = scheduling.DeviceLimiter.from_opts(opts, config)
+		await limiter.prepare()
 
-		results = {}
-		for repo in self._config.repositories:
-			if await git.is_bare(repo):
-				add_status_msg(".")
-				continue
-
-			worktree_path = await git.toplevel(repo)
-			worktree_fspath = os.fspath(worktree_path)
-
-			if opts.folders and not any(is_path_in(f, worktree_path) for f in opts.folders):
-				add_status_msg("-")
-				continue
-
-			add_status_msg("*")
+		async def process_repo(repo):
+			async with limiter.acquire(await limiter.get_devices(repo)):
+				return await self.get_repo_ignored(repo, opts, ignore_group_reader)
 
-			ignored_files = [
-				path
-				for _, path in filter(
-					lambda x: x[0] == "ignored",
-					await git.status(repo, "--ignored=matching")
-				)
-			]
-			if not ignored_files:
-				continue
-			stdout = await git.git(repo,
-				"check-ignore", "-z", "--verbose", "--non-matching", "--stdin",
-				stdin="\0".join(ignored_files),
-				returncode_ok=lambda returncode: returncode in (0, 1),
-				worktree=git.TOPLEVEL,
-				# Ignored files are reported relative to repo work-tree, which check-ignore will
-				# resolve using the current folder, so it must be the work-tree.
-				cwd=git.WORKTREE,
-			)
-			stdout = stdout.split("\0")
-			assert len(stdout) == 4 * len(ignored_files) + 1, (len(ignored_files), len(stdout))
-			assert stdout.pop(-1) == ""
-			ignored = map(lambda i: stdout[(i*4):(i*4+4)], range(len(stdout) // 4))
-
-			for ignore_file, ignore_file_line, ignore_pattern, path in ignored:
-				ignore_file = None if ignore_file == "" else worktree_path / ignore_file
-				ignore_file_line = None if ignore_file_line == "" else strict_int(ignore_file_line)
-				assert (ignore_file is None) == (ignore_file_line is None)
-				groups = ignore_group_reader.get_groups(ignore_file, ignore_file_line)
-				if groups is None:
-					group = "<failed to identify matching ignore pattern>"
-				elif len(groups) < 1:
-					group = "-"
-				else:
-					assert len(groups) <= 1
-					group = groups[0]
-				if opts.groups and group not in opts.groups:
-					continue
-				if group in opts.not_in_groups:
-					continue
-				ignore_file_fspath = os.fspath(ignore_file) if ignore_file is not None else None
-				results.setdefault(group, {}).setdefault(worktree_fspath, {})[path] = [
-					ignore_file_fspath, ignore_file_line, ignore_pattern
-				]
+		results = {}
+		repos_ignored = await asyncio.gather(*(process_repo(repo) for repo in self._config.repositories))
+		# Merged in the configuration order to keep the output independent of completion order.
+		for worktree_fspath, repo_ignored in repos_ignored:
+			for group, path, entry in repo_ignored:
+				results.setdefault(group, {}).setdefault(worktree_fspath, {})[path] = entry
 		set_status_msg(None)
+		self.update_completion_index(results.keys(), replace=not (opts.folders or opts.groups or opts.not_in_groups))
 
 		if opts.show_lists_only is not None:
 			lists_to_show = set(opts.show_lists_only)
@@ -203,7 +156,97 @@ class Ignored(object):
 				raise ValueError(f"unsupported output format {repr(opts.format)}")
 
 
+	@staticmethod
+	def update_completion_index(groups, *, replace):
+		"""
+		Adds the groups found to the ones offered for completing "--group", or replaces them if all
+		repositories and groups were looked at.
+		"""
+		groups = {g for g in groups if IgnoreGroupReader.group_name_pattern.match(g)}
+		if not replace:
+			groups.update(completion.read_index()["group"])
+		try:
+			completion.update_index(group=sorted(groups))
+		except OSError as e:
+			sys.stderr.write(f"WARNING: failed to update the completion index: {e}\n")
+
+	async def get_repo_ignored(self, repo, opts, ignore_group_reader):
+		"""
+		Returns the worktree path of the repo and a list of `(group, path, [ignore_file,
+		ignore_file_line, ignore_pattern])` for its ignored files.
+		"""
+		result = []
+		if await git.is_bare(repo):
+			add_status_msg(".")
+			return (None, result)
+
+		worktree_path = await git.toplevel(repo)
+		worktree_fspath = os.fspath(worktree_path)
+
+		if opts.folders and not any(is_path_in(f, worktree_path) for f in opts.folders):
+			add_status_msg("-")
+			return (worktree_fspath, result)
+
+		add_status_msg("*")
+
+		ignored_files = [
+			path
+			for _, path in filter(
+				lambda x: x[0] == "ignored",
+				await git.status(repo, "--ignored=matching")
+			)
+		]
+		if not ignored_files:
+			return (worktree_fspath, result)
+		check_ignore = git.git_stream(repo,
+			"check-ignore", "-z", "--verbose", "--non-matching", "--stdin",
+			delimiter=b"\0",
+			# Written in batches as check-ignore reads it, rather than joined into one string.
+			stdin=(
+				"".join(f"{path}\0" for path in ignored_files[i:i + 1000])
+				for i in range(0, len(ignored_files), 1000)
+			),
+			returncode_ok=lambda returncode: returncode in (0, 1),
+			worktree=git.TOPLEVEL,
+			# Ignored files are reported relative to repo work-tree, which check-ignore will
+			# resolve using the current folder, so it must be the work-tree.
+			cwd=git.WORKTREE,
+		)
+		ignored = []
+		record = []
+		async with contextlib.aclosing(check_ignore):
+			# Four fields for every path - the ignore file, the line, the pattern and the path.
+			async for field in check_ignore:
+				record.append(field)
+				if len(record) == 4:
+					ignored.append(record)
+					record = []
+		assert not record and len(ignored) == len(ignored_files), (len(ignored_files), len(ignored), record)
+
+		for ignore_file, ignore_file_line, ignore_pattern, path in ignored:
+			ignore_file = None if ignore_file == "" else worktree_path / ignore_file
+			ignore_file_line = None if ignore_file_line == "" else strict_int(ignore_file_line)
+			assert (ignore_file is None) == (ignore_file_line is None)
+			groups = ignore_group_reader.get_groups(ignore_file, ignore_file_line)
+			if groups is None:
+				group = "<failed to identify matching ignore pattern>"
+			elif len(groups) < 1:
+				group = "-"
+			else:
+				assert len(groups) <= 1
+				group = groups[0]
+			if opts.groups and group not in opts.groups:
+				continue
+			if group in opts.not_in_groups:
+				continue
+			ignore_file_fspath = os.fspath(ignore_file) if ignore_file is not None else None
+			result.append((group, path, [ignore_file_fspath, ignore_file_line, ignore_pattern]))
+		return (worktree_fspath, result)
+
+
 class IgnoreGroupReader(object):
+	group_name_pattern = re.compile(r"^[a-z0-9_]+$")
+
 	def __init__(self):
 		self._cache = {}
 
@@ -221,14 +264,13 @@ class IgnoreGroupReader(object):
 		result = []
 		start_marker = "#{{{"
 		end_marker = "#}}}"
-		group_name_pattern = re.compile(r"^[a-z0-9_]+$")
 		group_stack = []
 		with path.open("r") as fo:
 			for line_num, line in enumerate(fo, start=1):
 				if line.startswith(start_marker):
 					# TODO Instead of converting to lowercase, use case-insensitive mapping and report any inconsistencies.
 					group = line[len(start_marker):].strip().lower()
-					if not group_name_pattern.match(group):
+					if not IgnoreGroupReader.group_name_pattern.match(group):
 						raise ValueError(f"invalid group name - {repr(group)} in {repr(os.fspath(path))}")
 					group_stack.append(group)
 				elif line.startswith(end_marker):
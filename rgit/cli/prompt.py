@@ -0,0 +1,46 @@
+from .registry import command
+from .. import prompt
+
+
+@command("prompt")
+class Prompt(object):
+	@classmethod
+	def define_arguments(cls, parser):
+		parser.add_argument(
+			"--budget-ms",
+			dest="budget_ms",
+			metavar="MS",
+			type=float,
+			default=prompt.DEFAULT_BUDGET_MS,
+			help="mark the summary stale instead of verifying it if that would take longer than this",
+		)
+		parser.add_argument(
+			"--max-age",
+			dest="max_age",
+			metavar="SECONDS",
+			type=float,
+			default=prompt.DEFAULT_MAX_AGE,
+			help="mark the summary stale if the last `status` that processed the repository was earlier than this",
+		)
+		parser.add_argument(
+			"--stale-marker",
+			dest="stale_marker",
+			metavar="TEXT",
+			default=prompt.DEFAULT_STALE_MARKER,
+			help="appended to the summary if it's not up to date",
+		)
+		parser.add_argument(
+			"path",
+			nargs="?",
+			metavar="PATH",
+			default=None,
+			help="summarize the repository containing this path instead of the current directory",
+		)
+
+	def __init__(self):
+		pass
+
+	async def execute(self, *, opts, config):
+		# This is only reached if global options are passed, otherwise `rgit prompt` is dispatched
+		# straight to `prompt.main()` without loading the rest of rgit.
+		prompt.show(opts.path, budget_ms=opts.budget_ms, max_age=opts.max_age, stale_marker=opts.stale_marker)
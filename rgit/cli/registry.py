@@ -1,22 +1,54 @@
+import importlib
+
+
+# Commands are declared up front with everything needed to list them, and the module implementing
+# a command is only imported once it's selected, which keeps the dependencies of the other commands
+# (e.g. pygit2 or PyYAML) from slowing down the startup.
+
+# Names to `(module, aliases, short description, disabled)`.
+_commands = {}
+# Aliases to names.
+_aliases = {}
+# Names to handlers, filled in by `command()` when the modules are imported.
 _command_handlers = {}
 
 
-def command(*names, disabled=False):
+def declare(name, module, *aliases, description="", disabled=False):
+	"""
+	Declares a command implemented by a handler class in `module`, relative to this package, that is
+	registered with `@command(name)`.
+	"""
+	if name in _commands:
+		raise ValueError("command already declared", name)
+	_commands[name] = (module, aliases, description, disabled)
+	for alias in aliases:
+		_aliases[alias] = name
+
+
+def command(name):
 	def decorator(handler):
-		name = names[0]
+		if name not in _commands:
+			raise ValueError("command not declared", name)
 		if name in _command_handlers:
 			raise ValueError("command already registered")
-		_command_handlers[name] = (names[1:], handler, disabled)
+		_command_handlers[name] = handler
 		return handler
 	return decorator
 
 
-def enumerate_command_handlers():
-	for name, (aliases, handler, disabled) in _command_handlers.items():
-		yield (name, aliases, handler, disabled)
+def enumerate_commands():
+	for name, (_, aliases, description, disabled) in _commands.items():
+		yield (name, aliases, description, disabled)
+
+
+def resolve_alias(name):
+	return _aliases.get(name, name)
 
 
 def get_command_handler(name):
-	if name not in _command_handlers:
+	name = resolve_alias(name)
+	if name not in _commands:
 		return None
-	return _command_handlers[name][1]
+	if name not in _command_handlers:
+		importlib.import_module(_commands[name][0], __package__)
+	return _command_handlers[name]
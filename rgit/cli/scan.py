@@ -58,10 +58,6 @@ class Scan(object):
 			help="do not traverse into worktrees of discovered repos"
 		)
 
-	@classmethod
-	def short_description(cls):
-		return "walk the filesystem to discover new repositories"
-
 	def __init__(self):
 		pass
 
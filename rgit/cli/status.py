@@ -1,7 +1,8 @@
-import sys, os, pathlib, re, collections, shlex, itertools, json, asyncio, subprocess, urllib.parse
-from ..tools import draw_table, ProgressDisplay, url_starts_with, gen_sort_index, is_path_in
+import sys, os, pathlib, re, collections, contextlib, shlex, itertools, json, asyncio, subprocess, functools, sqlite3, time, urllib.parse, multiprocessing, threading, traceback
+from ..tools import draw_table, format_size, ProgressDisplay, gen_sort_index, is_path_in, run_in_daemon_thread
 from .registry import command
-from .. import git
+from .. import _gitcli, catfile, dirsize, git, gitdir, history, metrics, prefetch, prompt, refspec, scheduling, storage
+from ..repostatus import RepoStatus, MISSING_REMOTE
 
 
 # TODO Implement detection of repositories in working copies of other repositories without proper submodule references.
@@ -12,9 +13,7 @@ from .. import git
 # TODO Fix broken `rgit status --sh`
 # TODO Use `git check-attr` to find all unconfigured filters.
 # TODO Implement email address consistency checks in the history.
-# TODO If a repo has more than one destination remote, chances are they have a same set of refs.
 # TODO Implement worktree support.
-# TODO Detect if the worktree is in the middle of merge, rebase, or anything like that.
 # TODO Detect if the repo is missing and report that instead of crashing.
 # TODO Reconsider semantics of the "Commits" column. Maybe having it show commits that do not exist in any/all of destination remotes would be better. Tracking references that are head of or diverged from upsteam could be done in the "Refs" column or a new column.
 # TODO git ls-files --eol && file --mime-encoding
@@ -71,6 +70,91 @@ class Status(object):
 			default="status",
 			help="sort repositories by status (default) or path",
 		)
+		scheduling.define_arguments(parser)
+		parser.add_argument(
+			"--workers",
+			dest="workers",
+			metavar="N",
+			type=int,
+			default=1,
+			help=(
+				"split the repositories between N processes, each with its share of the job limits, "
+				"for when a single one is busy parsing the output of git (default 1)"
+			),
+		)
+		parser.add_argument(
+			"--any-unclean",
+			dest="any_unclean",
+			action="store_true",
+			default=False,
+			help=(
+				"do not display anything, exit with status 1 as soon as any repository is found "
+				"unclean and with 0 if none is"
+			),
+		)
+		parser.add_argument(
+			"--timings",
+			dest="show_timings",
+			action="store_true",
+			default=False,
+			help="report the slowest repositories on stderr after the run",
+		)
+		parser.add_argument(
+			"--prefetch",
+			dest="prefetch",
+			action="store_true",
+			default=False,
+			help=(
+				"read files git needs for all repositories into the page cache from a pool of threads "
+				"while repositories are processed, which is faster when the cache is cold"
+			),
+		)
+		parser.add_argument(
+			"--quick",
+			dest="quick",
+			action="store_true",
+			default=False,
+			help=(
+				"tell clean worktrees from the index and file system metadata without running "
+				"`git status`, which is only run for worktrees that may be dirty; only works for "
+				"repositories with `core.untrackedCache` enabled"
+			),
+		)
+		parser.add_argument(
+			"--untracked-size",
+			dest="untracked_size",
+			action="store_true",
+			default=False,
+			help=(
+				"add the \"Untracked Size\" column with the total size of untracked files, which are "
+				"walked once and then only where directories changed since the previous run"
+			),
+		)
+		parser.add_argument(
+			"--metrics-out",
+			dest="metrics_out",
+			metavar="FILE",
+			default=None,
+			help=(
+				"write per-repository and run metrics to the file in the OpenMetrics text format, "
+				"e.g. for the textfile collector of the Prometheus node_exporter"
+			),
+		)
+		parser.add_argument(
+			"--no-history",
+			dest="record_history",
+			action="store_false",
+			default=True,
+			help="do not add the results to the history queried with `rgit history`",
+		)
+		parser.add_argument(
+			"--repo-timeout",
+			dest="repo_timeout",
+			metavar="SECONDS",
+			type=float,
+			default=None,
+			help="give up on a repository that takes longer than this and report it as timed out",
+		)
 		parser.add_argument(
 			"folders",
 			nargs="*",
@@ -78,18 +162,45 @@ class Status(object):
 			help="only inspect repositories that are in one of specified folders"
 		)
 
-	@classmethod
-	def short_description(cls):
-		return "display statuses for all repositories"
-
 	def __init__(self):
 		self._config = None
 		self._relativize_paths = False
 		self._shell_quote_paths = False
 		self._zsh_named_dirs = []
+		# Shared by all repos of the run, so mirrored remotes and worktrees of one repo are walked once.
+		self._commit_walks = git.ObjectDatabaseMemo()
+		self._quick = False
+		# A `dirsize.DirectorySizes` if the size of untracked files is reported.
+		self._untracked_sizes = None
+		# The number of worktrees found clean by the quick check and of those that weren't.
+		self._quick_checks = collections.Counter()
+		# The longest any of the workers was throttled by the system load.
+		self._throttled_seconds = 0.0
+		# Whether `inspect_repo()` updates the cache `rgit prompt` reads.
+		self._prompt_entries = True
+
+	def prepare(self, config, *, quick=False, untracked_sizes=None, prompt_entries=True):
+		"""
+		Sets what `inspect_repo()` needs, for using it without `execute()` (see `rgit.api`).
+		"""
+		self._config = config
+		self._quick = quick
+		self._untracked_sizes = untracked_sizes
+		self._prompt_entries = prompt_entries
 
 	async def execute(self, *, opts, config):
-		self._config = config
+		try:
+			return await self._execute(opts=opts, config=config)
+		finally:
+			# The walks are only shared within a run, a long-lived process would otherwise keep them all.
+			self._commit_walks.clear()
+
+	async def _execute(self, *, opts, config):
+		untracked_sizes = None
+		if opts.untracked_size:
+			untracked_sizes = dirsize.DirectorySizes()
+			await run_in_daemon_thread(untracked_sizes.load)
+		self.prepare(config, quick=opts.quick, untracked_sizes=untracked_sizes)
 		self._output_json = opts.output_json
 		self._relativize_paths = opts.relative
 		self._shell_quote_paths = opts.quote_for_shell
@@ -99,7 +210,8 @@ class Status(object):
 		opts.folders = [pathlib.Path(f).resolve() for f in opts.folders]
 
 		statistics_table = []
-		semaphore = asyncio.Semaphore(32)
+		limiter = scheduling.DeviceLimiter.from_opts(opts, config)
+		await limiter.prepare()
 		progress = ProgressDisplay() if opts.show_progress else None
 
 		status_char_awaiting = "·"
@@ -107,103 +219,133 @@ class Status(object):
 		status_char_finished = "◉"
 		status_char_excluded = "✕"
 
-		async def process_repo(repo):
+		timing_history = scheduling.TimingHistory()
+		timing_history.load()
+		durations = {}
+		run_started = time.monotonic()
+
+		def on_started(repo):
 			if progress is not None:
-				idx = progress.add(status_char_awaiting)
-			async with semaphore:
-				if progress is not None:
-					progress.update(idx, status_char_underway)
-				statistics = {}
-				gitdir_exists, worktree_exists = await git.exists(repo)
-				if (gitdir_exists, worktree_exists) in ((True, True), (True, None)):
-					await self.get_repo_remotes(repo, statistics)
-					await self.get_repo_commit_statistics(repo, statistics)
-					await self.get_repo_status_stats(repo, statistics)
-				elif (gitdir_exists, worktree_exists) in ((True, False),):
-					statistics["Notes"] = "missing worktree"
-				else:
-					statistics["Notes"] = "missing repo"
-				if progress is not None:
-					progress.update(idx, status_char_finished)
-				return (repo, statistics)
+				progress.update(progress_indexes[repo], status_char_underway)
+
+		def on_finished(repo, duration):
+			if duration is not None:
+				durations[repo] = duration
+				timing_history.record(repo, duration)
+			if progress is not None:
+				progress.update(progress_indexes[repo], status_char_finished)
 
-		coros = []
+		async def process_repo(repo):
+			status, duration = await self.inspect_repo(repo, limiter,
+				timeout=opts.repo_timeout, on_started=functools.partial(on_started, repo),
+			)
+			on_finished(repo, duration)
+			return status
+
+		repos = []
 		for repo in self._config.repositories:
 			if opts.folders and not any(is_path_in(f, repo) for f in opts.folders):
 				if progress is not None:
 					progress.add(status_char_excluded)
 				continue
+			repos.append((repo, progress.add(status_char_awaiting) if progress is not None else None))
+
+		progress_indexes = dict(repos)
+		repo_positions = {repo: i for i, (repo, _) in enumerate(repos)}
+		repo_estimates = {repo: timing_history.get(repo) for repo, _ in repos}
+		await timing_history.find_index_sizes([r for r, _ in repos])
+		repos_scheduled = timing_history.order([r for r, _ in repos])
+		# The slowest go first, whatever order their devices are found in.
+		limiter.set_order(repos_scheduled)
+		run_kind = timing_history.get_run_kind()
+
+		if opts.any_unclean:
+			# The cheapest repos first, the answer is most likely found before reaching the others.
+			unclean_repo = await self.find_unclean_repo(list(reversed(repos_scheduled)), limiter, opts)
+			if progress is not None:
+				progress.clear()
+			return 0 if unclean_repo is None else 1
+
+		prefetcher = None
+		if opts.prefetch:
+			prefetcher = prefetch.Prefetcher()
+			prefetcher.start(repos_scheduled)
+		if opts.workers > 1:
+			shards = await run_in_daemon_thread(timing_history.split, repos_scheduled, opts.workers, gitdir.common_dir)
+			results = await self.inspect_in_workers(shards, opts,
+				on_started=on_started if progress is not None else None, on_finished=on_finished,
+			)
+		else:
+			results = await asyncio.gather(*(process_repo(repo) for repo in repos_scheduled))
+		if prefetcher is not None:
+			# What it hasn't got to by now is of no use to anyone.
+			prefetcher.stop()
+		results.sort(key=lambda status: repo_positions[status.path])
+		run_duration = time.monotonic() - run_started
+		if not opts.folders:
+			# A run over some of the repos says nothing about how long all of them take, nor does it
+			# read what the others need into the page cache.
+			timing_history.record_run(run_duration, run_kind)
 
-			coros.append(process_repo(repo))
-
-		results = await asyncio.gather(*coros)
+		try:
+			timing_history.save(repos=self._config.repositories)
+		except OSError as e:
+			sys.stderr.write(f"WARNING: failed to save timing history: {e}\n")
+		if not opts.folders:
+			try:
+				await run_in_daemon_thread(prompt.prune_entries, self._config.repositories)
+			except OSError as e:
+				sys.stderr.write(f"WARNING: failed to prune the prompt cache: {e}\n")
+		if untracked_sizes is not None:
+			try:
+				await run_in_daemon_thread(untracked_sizes.save)
+			except OSError as e:
+				sys.stderr.write(f"WARNING: failed to save untracked sizes: {e}\n")
 
 		if progress is not None:
 			progress.clear()
 
-		for repo, statistics in results:
-			await self.render_statistics_row(statistics_table, repo, statistics)
+		if opts.record_history:
+			await run_in_daemon_thread(self.record_history, results, run_duration, bool(opts.folders))
 
-		STATUS_CODES = "?MADRCUT!"
+		throttled_seconds = None
+		if limiter.throttle is not None:
+			throttled_seconds = max(limiter.throttle.throttled_seconds, self._throttled_seconds)
+
+		if opts.metrics_out is not None:
+			self.write_metrics(opts.metrics_out, results, durations, run_duration, throttled_seconds)
+
+		if opts.show_timings:
+			self.report_timings(run_duration, durations, repo_estimates,
+				run_kind=run_kind, timing_history=timing_history, prefetcher=prefetcher,
+				quick_checks=self._quick_checks if opts.quick else None, throttled_seconds=throttled_seconds,
+			)
+
+		unclean = [status for status in results if status]
+		paths = {
+			status.path: os.fspath(status.path) if self._output_json else self._decorate_path_for_output(status.path)
+			for status in unclean
+		}
+		if opts.sort == "path":
+			unclean.sort(key=lambda status: paths[status.path])
+		elif opts.sort == "status":
+			unclean.sort(key=self.status_sort_key, reverse=True)
+		statistics_table = self.render_statistics_table(unclean, paths)
 
-		columns_to_sort_rows_by = [
-			"??",
-			*(f"•{c}" for c in STATUS_CODES[1:-1]),
-			*(f"{c}•" for c in STATUS_CODES[1:-1]),
-			"Commits", "Refs",
-		]
-		column_sort_order = [
-			[
-				"#", "Path", "Notes",
-				*columns_to_sort_rows_by,
-				"Remotes", "Other Remotes",
-			],
-			["Unsupported Remote Config"],
-		]
 		def cell_filter(*, row, column, value, width, fill):
 			if row == 0 or column == 1:
 				return str(value).ljust(width, fill)
+			if statistics_table[0][column] == "Untracked Size" and value != "":
+				return format_size(value).rjust(width, fill)
 			if column == 2 and str(value).strip() == "-":
 				return str(value).strip().center(width, fill)
 			if isinstance(value, (int, float)):
 				return str(value).rjust(width, fill)
 			return str(value).ljust(width, fill)
 
-		if statistics_table:
-			statistics_table_sorted = []
-
-			# Sort Columns
-			column_sort_index = gen_sort_index(statistics_table[0], column_sort_order)
-			for row in statistics_table:
-				row_sorted = []
-				for i in column_sort_index:
-					row_sorted.append(row[i] if i < len(row) else "")
-				statistics_table_sorted.append(row_sorted)
-
-			# Sort Rows
-			statistics_table_sorted_columns = statistics_table_sorted[0]
-			if opts.sort == "path":
-				# Sort by path (column index 1)
-				path_column_index = statistics_table_sorted_columns.index("Path")
-				def row_sort_key(row):
-					return (row[path_column_index] or "")
-				statistics_table_sorted[1:] = sorted(statistics_table_sorted[1:], key=row_sort_key)
-			elif opts.sort == "status":
-				columns_indexes = [i for i, c in enumerate(statistics_table_sorted_columns) if c in columns_to_sort_rows_by]
-				columns_indexes.sort(key=lambda i: columns_to_sort_rows_by.index(statistics_table_sorted_columns[i]))
-				def row_sort_key(row):
-					key = tuple((row[i] or 0) for i in columns_indexes)
-					return key
-				# statistics_table_sorted[1:].sort(key=row_sort_key, reverse=True)
-				statistics_table_sorted[1:] = sorted(statistics_table_sorted[1:], key=row_sort_key, reverse=True)
-			num_column_index = statistics_table_sorted[0].index("#")
-			for i, row in enumerate(statistics_table_sorted[1:]):
-				row[num_column_index] = i + 1
-			statistics_table = statistics_table_sorted
-
 		if opts.output_json:
 			result = {}
-			header_row = statistics_table[0]
+			header_row = statistics_table[0] if statistics_table else []
 			num_columns = len(header_row)
 			for row in statistics_table[1:]:
 				r = {header_row[i]:row[i] for i in range(num_columns)}
@@ -219,54 +361,314 @@ class Status(object):
 				cell_filter=cell_filter
 			)
 
-	async def render_statistics_row(self, statistics_table, repo, statistics):
-		if not statistics.keys():
-			return
-		if not statistics_table:
-			statistics_table.append([])
-		column_names = statistics_table[0]
-		statistics["#"] = len(statistics_table)
-		statistics["Path"] = os.fspath(repo) if self._output_json else self._decorate_path_for_output(repo)
-		row = [""] * len(column_names)
-		for column_name in statistics.keys():
-			if column_name in column_names:
-				column_index = column_names.index(column_name)
+	_change_columns_to_sort_rows_by = (
+		"??",
+		*(f"•{c}" for c in "MADRCUT"),
+		*(f"{c}•" for c in "MADRCUT"),
+	)
+	_column_sort_order = (
+		[
+			"#", "Path", "Notes", "State",
+			"??", "Untracked Size", *_change_columns_to_sort_rows_by[1:],
+			"Commits", "Refs",
+			"Remotes", "Other Remotes",
+		],
+		["Unsupported Remote Config"],
+	)
+
+	@classmethod
+	def status_sort_key(cls, status):
+		return (
+			*(status.get_change(c) for c in cls._change_columns_to_sort_rows_by),
+			status.commits, status.refs,
+		)
+
+	def render_statistics_table(self, statuses, paths):
+		"""
+		Returns the rows of the table, the header first, or an empty list if there are no statuses.
+		"""
+		if not statuses:
+			return []
+		rows = [dict(status.columns()) for status in statuses]
+		column_names = list(dict.fromkeys(itertools.chain(["#", "Path"], *rows)))
+		column_names = [column_names[i] for i in gen_sort_index(column_names, self._column_sort_order)]
+		table = [column_names]
+		for i, (status, columns) in enumerate(zip(statuses, rows)):
+			columns["#"] = i + 1
+			columns["Path"] = paths[status.path]
+			table.append([columns.get(column_name, "") for column_name in column_names])
+		return table
+
+	@staticmethod
+	def write_prompt_entries(repo, fingerprint, status):
+		try:
+			prompt.write_entries(repo, fingerprint, status)
+		except OSError as e:
+			sys.stderr.write(f"WARNING: failed to write prompt cache for {os.fspath(repo)!r}: {e}\n")
+
+	@staticmethod
+	def record_history(statuses, run_duration, partial):
+		try:
+			with history.History() as h:
+				h.record_run(statuses, time=time.time(), duration=run_duration, partial=partial)
+		except (OSError, sqlite3.Error, ValueError) as e:
+			sys.stderr.write(f"WARNING: failed to record history: {e}\n")
+
+	def write_metrics(self, path, statuses, durations, run_duration, throttled_seconds=None):
+		run_metrics = metrics.collect(statuses, durations,
+			run_duration=run_duration,
+			timestamp=time.time(),
+			processes_started=_gitcli.processes_started,
+			memo=self._commit_walks,
+			quick_checks=self._quick_checks if self._quick else None,
+			throttled_seconds=throttled_seconds,
+		)
+		try:
+			storage.write_text(path, run_metrics.render())
+		except OSError as e:
+			sys.stderr.write(f"WARNING: failed to write metrics to {path!r}: {e}\n")
+
+	def report_timings(self, run_duration, durations, estimates, *,
+		run_kind=None, timing_history=None, prefetcher=None, quick_checks=None, throttled_seconds=None, count=10,
+		fo=sys.stderr,
+	):
+		rows = [["Run", "Seconds", "Notes"]]
+		rows.append(["this", f"{run_duration:.3f}", run_kind or "cache state unknown"])
+		if timing_history is not None:
+			for kind in ("cold", "warm"):
+				typical = timing_history.get_run(kind)
+				if typical is not None:
+					rows.append([f"typical {kind}", f"{typical:.3f}", ""])
+		if prefetcher is not None:
+			if prefetcher.duration is not None:
+				rows.append(["prefetch", f"{prefetcher.duration:.3f}",
+					f"{prefetcher.files} files, {prefetcher.directories} directories, {prefetcher.bytes} bytes",
+				])
 			else:
-				column_names.append(column_name)
-				column_index = len(column_names) - 1
-			while len(row) <= column_index:
-				row.append("")
-			row[column_index] = statistics[column_name]
-		statistics_table.append(row)
-
-	async def get_repo_status_stats(self, repo, statistics):
+				rows.append(["prefetch", "-", "did not finish"])
+		if quick_checks is not None:
+			rows.append(["quick check", "-",
+				f"{quick_checks['clean']} of {quick_checks.total()} worktrees clean without git status",
+			])
+		if throttled_seconds is not None:
+			rows.append(["throttled", f"{throttled_seconds:.3f}", "waiting for the system load to drop"])
+		draw_table(rows, fo=fo, has_header=True)
+
+		rows = [["Path", "Seconds", "Expected"]]
+		for repo, duration in sorted(durations.items(), key=lambda x: x[1], reverse=True)[:count]:
+			expected = estimates.get(repo)
+			rows.append([
+				self._decorate_path_for_output(repo),
+				f"{duration:.3f}",
+				f"{expected:.3f}" if expected is not None else "-",
+			])
+		draw_table(rows, fo=fo,
+			title=f"{len(durations)} repositories in {run_duration:.3f} seconds",
+			has_header=True,
+		)
+
+	async def inspect_repo(self, repo, limiter, *, timeout=None, on_started=None):
+		"""
+		Returns the `RepoStatus` of the repo and the seconds it took, not counting the wait for the
+		limiter, which is `None` if it timed out before getting past the limiter. `on_started` is
+		called once it does.
+		"""
+		status = RepoStatus(repo)
+		started = None
+		try:
+			async with asyncio.timeout(timeout):
+				devices = await limiter.get_devices(repo)
+			async with limiter.acquire(devices, repo):
+				if on_started is not None:
+					on_started()
+				started = time.monotonic()
+				# Cancelling on timeout kills the git processes the repo is waiting for.
+				async with asyncio.timeout(timeout):
+					fingerprint = None
+					if self._prompt_entries:
+						# Taken before looking at the repo, so that changes made meanwhile make the
+						# entry for `rgit prompt` stale.
+						fingerprint = await run_in_daemon_thread(gitdir.fingerprint, repo)
+					await self.get_repo_statistics(repo, status)
+					if fingerprint is not None:
+						await run_in_daemon_thread(self.write_prompt_entries, repo, fingerprint, status)
+		except TimeoutError:
+			status = RepoStatus(repo, notes=("timed out",))
+		return status, (time.monotonic() - started if started is not None else None)
+
+	async def inspect_in_workers(self, shards, opts, *, on_started=None, on_finished=None):
+		"""
+		Inspects each list of repos in a process of its own and returns their `RepoStatus` in no
+		particular order. `on_started(repo)` and `on_finished(repo, duration)` are called as the
+		workers report them, like `inspect_repo()` does.
+		"""
+		# Forking a process with threads and a running event loop is not safe.
+		context = multiprocessing.get_context("spawn")
+		loop = asyncio.get_running_loop()
+		messages = asyncio.Queue()
+		processes = []
+		results = []
+		try:
+			for i, shard in enumerate(shards):
+				receiver, sender = context.Pipe(duplex=False)
+				process = context.Process(target=_run_worker, args=(sender, self._config, shard), kwargs={
+					"quick": self._quick,
+					"untracked_size": self._untracked_sizes is not None,
+					"timeout": opts.repo_timeout,
+					"jobs": opts.jobs,
+					"device_jobs": opts.device_jobs,
+					"workers": len(shards),
+					"launcher": opts.launcher,
+					"background": opts.background,
+					"report_started": on_started is not None,
+				}, daemon=True)
+				process.start()
+				sender.close()
+				processes.append(process)
+				threading.Thread(target=_forward_messages, args=(receiver, loop, messages, i), daemon=True).start()
+
+			ended = set()
+			while len(ended) < len(shards):
+				i, message = await messages.get()
+				if message is None:
+					if i not in ended:
+						raise RuntimeError("status worker exited unexpectedly", i)
+				elif message[0] == "failed":
+					error = RuntimeError("status worker failed", i, message[1])
+					error.add_note(f"Worker traceback:\n{message[2]}")
+					raise error
+				elif message[0] == "started":
+					on_started(shards[i][message[1]])
+				elif message[0] == "finished":
+					_, j, status, duration = message
+					repo = shards[i][j]
+					results.append(status if status is not None else RepoStatus(repo))
+					if on_finished is not None:
+						on_finished(repo, duration)
+				elif message[0] == "ended":
+					processes_started, hits, misses, quick_checks, untracked_sizes, throttled_seconds = message[1:]
+					_gitcli.processes_started += processes_started
+					self._commit_walks.hits += hits
+					self._commit_walks.misses += misses
+					self._quick_checks.update(quick_checks)
+					if untracked_sizes is not None:
+						self._untracked_sizes.update(untracked_sizes)
+					if throttled_seconds is not None:
+						self._throttled_seconds = max(self._throttled_seconds, throttled_seconds)
+					ended.add(i)
+		finally:
+			for process in processes:
+				if process.is_alive():
+					process.terminate()
+				await run_in_daemon_thread(process.join)
+		return results
+
+	async def find_unclean_repo(self, repos, limiter, opts):
+		"""
+		Returns the first repo found to be unclean, or `None`. Repos are checked in two phases - refs
+		and remotes of all repos first and only then their worktrees, which are much slower to scan.
+		Outstanding checks are cancelled, killing their git processes, as soon as the answer is known.
+		"""
+		async def check_repo(repo, phase):
+			status = RepoStatus(repo)
+			try:
+				async with asyncio.timeout(opts.repo_timeout):
+					devices = await limiter.get_devices(repo)
+				async with limiter.acquire(devices, repo):
+					async with asyncio.timeout(opts.repo_timeout):
+						exists = await phase(repo, status)
+			except TimeoutError:
+				# A repo that can't be checked is reported as unclean, like it's shown in the table.
+				status = RepoStatus(repo, notes=("timed out",))
+				exists = False
+			return (repo, status, exists)
+
+		limiter.set_order(repos)
+		existing_repos = []
+		for phase in (self.get_repo_refs_statistics, self.get_repo_worktree_statistics):
+			tasks = [asyncio.ensure_future(check_repo(repo, phase)) for repo in repos]
+			try:
+				for task in asyncio.as_completed(tasks):
+					repo, status, exists = await task
+					if status:
+						return repo
+					if exists:
+						existing_repos.append(repo)
+			finally:
+				for task in tasks:
+					task.cancel()
+				await asyncio.gather(*tasks, return_exceptions=True)
+			repos, existing_repos = existing_repos, []
+		return None
+
+	async def get_repo_statistics(self, repo, status):
+		if await self.get_repo_refs_statistics(repo, status):
+			await self.get_repo_worktree_statistics(repo, status)
+
+	async def get_repo_refs_statistics(self, repo, status):
+		"""
+		Populates all columns except for the worktree status. Returns whether the repo exists.
+		"""
+		gitdir_exists, worktree_exists = await git.exists(repo)
+		if (gitdir_exists, worktree_exists) in ((True, True), (True, None)):
+			status.state = await git.get_state(repo) or None
+			await self.get_repo_remotes(repo, status)
+			await self.get_repo_commit_statistics(repo, status)
+			return True
+		elif (gitdir_exists, worktree_exists) in ((True, False),):
+			status.add_note("missing worktree")
+		else:
+			status.add_note("missing repo")
+		return False
+
+	async def get_repo_worktree_statistics(self, repo, status):
+		await self.get_repo_status_stats(repo, status)
+		return True
+
+	async def get_repo_status_stats(self, repo, status):
+		if self._quick:
+			if await git.is_worktree_clean_quick(repo):
+				self._quick_checks["clean"] += 1
+				return
+			self._quick_checks["unknown"] += 1
 		if await git.is_bare(repo):
 			return
 		# TODO Switch to using ..git.status() instead of calling the git command directly.
+		untracked = []
 		try:
-			stdout = await git.git(repo, "status", "--porcelain")
+			async with contextlib.aclosing(git.git_stream(repo, "status", "--porcelain")) as lines:
+				async for line in lines:
+					self.count_status_line(status, line)
+					if self._untracked_sizes is not None and line.startswith("?? "):
+						untracked.append(git.unquote_path(line[3:]))
 		except Exception as e:
-			statistics["Error"] = str(e)
-			return
-		if not stdout:
+			status.changes = None
+			status.error = str(e)
 			return
-		for line in stdout.splitlines():
-			m = re.match(self._status_line_pattern, line)
-			index, worktree, dummy_filepath, dummy_renamed_to = m.groups()
-			status_codes = []
-			if (index, worktree) in (("?", "?"), ("!", "!")):
-				status_codes.append(f"{index}{worktree}")
-			else:
-				status_codes.append(f"{index} ")
-				status_codes.append(f" {worktree}")
-			for status_code in status_codes:
-				if not status_code.strip():
-					continue
-				status_code = status_code.replace(" ", "•")
-				statistics.setdefault(status_code, 0)
-				statistics[status_code] += 1
+		if untracked:
+			worktree = repo.parent if repo.name == ".git" else await git.toplevel(repo)
+			size = await run_in_daemon_thread(self._untracked_sizes.measure, [worktree / p for p in untracked])
+			status.set_extra("Untracked Size", size)
 
-	async def get_repo_remotes(self, repo, statistics):
+	@classmethod
+	def count_status_line(cls, status, line):
+		"""
+		Counts a line of `git status --porcelain` in the change columns of the status.
+		"""
+		m = re.match(cls._status_line_pattern, line)
+		index, worktree, dummy_filepath, dummy_renamed_to = m.groups()
+		status_codes = []
+		if (index, worktree) in (("?", "?"), ("!", "!")):
+			status_codes.append(f"{index}{worktree}")
+		else:
+			status_codes.append(f"{index} ")
+			status_codes.append(f" {worktree}")
+		for status_code in status_codes:
+			if not status_code.strip():
+				continue
+			status.count_change(status_code.replace(" ", "•"))
+
+	async def get_repo_remotes(self, repo, status):
 		"""
 		Populates "Remotes" and "Other Remotes" columns.
 		"""
@@ -292,60 +694,40 @@ class Status(object):
 
 		if await self.matching_destination_folder(repo) is not None:
 			if destination_remotes:
-				statistics["Remotes"] = ", ".join(sorted(destination_remotes))
+				status.set_remotes(destination_remotes)
 		else:
 			if not destination_remotes:
-				statistics["Remotes"] = " - "
+				status.set_remotes(MISSING_REMOTE)
 
 		# Any remotes with url not matching prefixes from "destination.remotes" or "destination.remotes.ignore"
 		# will be reported in "Other Remotes" column.
 
 		if other_remotes:
-			statistics["Other Remotes"] = ", ".join(sorted(other_remotes))
+			status.set_other_remotes(other_remotes)
 
 	async def matching_destination_remote(self, url, worktree):
-		url_parts = urllib.parse.urlsplit(url)
-		# If URL is a path (no scheme/netloc), resolve to absolute from worktree
-		if not url_parts.scheme and not url_parts.netloc:
-			url_path = pathlib.Path(url_parts.path)
-			if not url_path.is_absolute():
-				url = os.path.normpath(worktree / url_path)
-		for remote_url_prefix in self._config.destination_remotes:
-			if url_starts_with(url, remote_url_prefix):
-				return remote_url_prefix
-		return None
+		return self._config.matching_destination_remote(self._absolute_url(url, worktree))
 
 	async def matching_destination_folder(self, path):
-		for folder in self._config.destination_folders:
-			if folder.parts == path.parts[:len(folder.parts)]:
-				return folder
-		return None
+		return self._config.matching_destination_folder(path)
 
 	async def matching_ignore_remote(self, url, worktree):
+		return self._config.matching_destination_remote_ignore(self._absolute_url(url, worktree))
+
+	async def matching_ignore_folder(self, path):
+		return self._config.matching_destination_folder_ignore(path)
+
+	@staticmethod
+	def _absolute_url(url, worktree):
 		url_parts = urllib.parse.urlsplit(url)
 		# If URL is a path (no scheme/netloc), resolve to absolute from worktree
 		if not url_parts.scheme and not url_parts.netloc:
 			url_path = pathlib.Path(url_parts.path)
 			if not url_path.is_absolute():
 				url = os.path.normpath(worktree / url_path)
-		for remote_url_prefix in self._config.destination_remotes_ignore:
-			prefix_parts = urllib.parse.urlsplit(remote_url_prefix)
-			# If prefix is a path (no scheme/netloc), resolve to absolute from basedir
-			if not prefix_parts.scheme and not prefix_parts.netloc:
-				prefix_path = pathlib.Path(prefix_parts.path)
-				if not prefix_path.is_absolute():
-					remote_url_prefix = os.path.normpath(self._config.basedir / prefix_path)
-			if url_starts_with(url, remote_url_prefix):
-				return remote_url_prefix
-		return None
+		return url
 
-	async def matching_ignore_folder(self, path):
-		for folder in self._config.destination_folders_ignore:
-			if folder.parts == path.parts[:len(folder.parts)]:
-				return folder
-		return None
-
-	async def get_repo_commit_statistics(self, repo, statistics):
+	async def get_repo_commit_statistics(self, repo, status):
 		remotes = {}
 		other_remotes = {}
 
@@ -393,75 +775,68 @@ class Status(object):
 			else:
 				other_remotes[remote_name] = remote
 		if unsupported_remote_configs:
-			statistics["Unsupported Remote Config"] = unsupported_remote_configs
+			status.set_extra("Unsupported Remote Config", unsupported_remote_configs)
 			return
 
 		if not remotes:
 			return
 
-		remote_refspecs = {}
+		remote_refspecs = refspec.RefspecMap()
 
 		for remote_name, remote_config in itertools.chain(remotes.items(), other_remotes.items()):
-			# https://git-scm.com/book/en/v2/Git-Internals-The-Refspec
-			for refspec in remote_config.fetch:
-				# TODO Extract refspec parsing to a standalone function.
-				non_ff = False
-				if refspec[0] == "+":
-					non_ff = True
-					refspec = refspec[1:]
-				if refspec[0] == "^":
-					#TODO Implement support for negative refspecs.
-					continue
-				src, sep, dst = refspec.partition(":")
-				# assert sep == ":", refspec
-				if sep == ":":
-					remote_refspecs[dst] = (src, remote_name)
-				else:
+			for fetch_refspec in remote_config.fetch:
+				parsed_refspec = refspec.parse(fetch_refspec)
+				if parsed_refspec.dst is None and not parsed_refspec.negative:
 					print("X", end="", file=sys.stderr)
+					continue
+				remote_refspecs.add(remote_name, parsed_refspec)
 
 		local_refs = {}
 		remote_refs = {}
 
-		for ref_str in (await git.git(repo, "show-ref")).splitlines():
-			object_id, ref_name = ref_str.split(" ", maxsplit=1)
-			ref = pathlib.PurePosixPath(ref_name)
+		async with contextlib.aclosing(git.git_stream(repo, "show-ref")) as show_ref:
+			async for ref_str in show_ref:
+				object_id, ref_name = ref_str.split(" ", maxsplit=1)
+				ref = pathlib.PurePosixPath(ref_name)
 
-			for dst, (src, remote_name) in remote_refspecs.items():
-				remote_ref = match_refspec(ref_name, dst, src)
-				if remote_ref is not None:
-					remote_refs[(remote_name, remote_ref)] = (ref_name, object_id)
-					break
-			else:
-				ref = list(ref.parts)
-
-				assert ref[0] == "refs"
-
-				if len(ref) == 4 and ref[1] == "remotes" and ref[3] == "HEAD":
-					pass
-				elif ref[1] == "heads":
-					branch = "/".join(ref[2:])
-					branch_remote = None
-					branch_merge = None
-					async for key, value in git.get_config_branch(repo, branch, returncode_ok=lambda x: True):
-						if key == "remote":
-							branch_remote = value
-						elif key == "merge":
-							branch_merge = value
-						elif key in ("push", "pushremote"):
-							# TODO Shall we do something special if branch push and pushremote are configured?
-							pass
-						elif key in ("vscode-merge-base", "github-pr-owner-number", "github-pr-base-branch"):
-							# TODO Properly configure and monitor ignored branch configurations.
-							pass
-						else:
-							raise ValueError("unrecognized branch config", (repo, key, value))
-					local_refs[ref_name] = (object_id, branch_remote, branch_merge)
-				elif ref[1] in ("tags", "notes", "wip", "stash"):
-					# local_refs[ref_name] = (object_id, None, None)
-					# TODO Implement refs/tags/ and refs/notes/ support.
-					pass
+				mapped = remote_refspecs.lookup(ref_name)
+				if mapped is refspec.EXCLUDED:
+					# Git would not have fetched this ref, it's a leftover from before the negative
+					# refspec was configured.
+					continue
+				if mapped is not None:
+					remote_refs[mapped] = (ref_name, object_id)
 				else:
-					raise ValueError(f"Unrecognized Reference {ref_name} in repo {repo}")
+					ref = list(ref.parts)
+
+					assert ref[0] == "refs"
+
+					if len(ref) == 4 and ref[1] == "remotes" and ref[3] == "HEAD":
+						pass
+					elif ref[1] == "heads":
+						branch = "/".join(ref[2:])
+						branch_remote = None
+						branch_merge = None
+						async for key, value in git.get_config_branch(repo, branch, returncode_ok=lambda x: True):
+							if key == "remote":
+								branch_remote = value
+							elif key == "merge":
+								branch_merge = value
+							elif key in ("push", "pushremote"):
+								# TODO Shall we do something special if branch push and pushremote are configured?
+								pass
+							elif key in ("vscode-merge-base", "github-pr-owner-number", "github-pr-base-branch"):
+								# TODO Properly configure and monitor ignored branch configurations.
+								pass
+							else:
+								raise ValueError("unrecognized branch config", (repo, key, value))
+						local_refs[ref_name] = (object_id, branch_remote, branch_merge)
+					elif ref[1] in ("tags", "notes", "wip", "stash"):
+						# local_refs[ref_name] = (object_id, None, None)
+						# TODO Implement refs/tags/ and refs/notes/ support.
+						pass
+					else:
+						raise ValueError(f"Unrecognized Reference {ref_name} in repo {repo}")
 
 		# The "Refs" column shows number of local git refs that are not tracking a branch from a destination remote.
 
@@ -474,20 +849,36 @@ class Status(object):
 			remote_ref, remote_object_id = remote_refs[(branch_remote, branch_merge)]
 			tracking_refs.append((ref, object_id, remote_ref, remote_object_id))
 
-		if dangling_refs:
-			statistics["Refs"] = len(dangling_refs)
+		status.refs = len(dangling_refs)
 
 		# The "Commits" column shows number of commit objects that are not yet present in the tracked branch of a destination remote.
 
 		revs = []
 		for ref, object_id, remote_ref, remote_object_id in tracking_refs:
-			for rev in (await git.git(repo, "rev-list", object_id, f"^{remote_object_id}")).splitlines():
-				msg = (await git.git(repo, "log", "-1", "--pretty=tformat:%s", rev)).strip()
-				if msg == "TMP" or msg.startswith("TMP:"):
-					continue
-				revs.append(rev)
-		if revs:
-			statistics["Commits"] = len(revs)
+			hidden_object_ids = frozenset((remote_object_id,))
+			revs.extend(await self._commit_walks.get(
+				repo, (object_id, hidden_object_ids),
+				functools.partial(self.get_unpushed_revs, repo, object_id, hidden_object_ids),
+			))
+		status.commits = len(revs)
+
+	@staticmethod
+	async def get_unpushed_revs(repo, object_id, hidden_object_ids):
+		"""
+		Returns commits reachable from `object_id` but none of `hidden_object_ids`, except for
+		temporary commits with the subject "TMP" or starting with "TMP:".
+		"""
+		hidden = [f"^{h}" for h in sorted(hidden_object_ids)]
+		async with contextlib.aclosing(git.git_stream(repo, "rev-list", object_id, *hidden)) as rev_list:
+			revs = [rev async for rev in rev_list]
+		commits = await git.get_objects(repo, revs)
+		result = []
+		for rev, commit in zip(revs, commits):
+			msg = git.commit_subject(commit.data)
+			if msg == "TMP" or msg.startswith("TMP:"):
+				continue
+			result.append(rev)
+		return result
 
 	_status_line_pattern = re.compile(r"^([ ?MADRCUT!])([ ?MADRCUT!]) (.*?)(?: -> (.*?))?$")
 
@@ -569,48 +960,90 @@ class Status(object):
 		return named_dirs
 
 
-def match_refspec(ref, spec, other_spec):
-	# https://git-scm.com/book/en/v2/Git-Internals-The-Refspec
-	spec_pre, spec_asterisk, spec_post = spec.partition("*")
-	other_spec_pre, other_spec_asterisk, other_spec_post = other_spec.partition("*")
-
-	if spec_asterisk == "":
-		assert other_spec_asterisk == ""
-		return other_spec if ref == spec else None
-	else:
-		assert spec_asterisk == "*"
-		assert other_spec_asterisk == "*"
-
-	assert (
-		(other_spec_pre == "" or other_spec_pre[-1] == "/") and
-		(other_spec_post == "" or other_spec_post[0] == "/")
-	)
-	assert (
-		(spec_pre == "" or spec_pre[-1] == "/") and
-		(spec_post == "" or spec_post[0] == "/")
+def _run_worker(sender, config, repos, **kwargs):
+	"""
+	The entry point of the processes started by `Status.inspect_in_workers()`.
+	"""
+	try:
+		asyncio.run(_inspect_shard(sender, config, repos, **kwargs))
+	except KeyboardInterrupt:
+		pass
+	except Exception as e: # pylint: disable=broad-exception-caught
+		# Sent as text, the exception itself may not survive pickling.
+		try:
+			sender.send(("failed", repr(e), traceback.format_exc()))
+		except OSError:
+			pass
+	finally:
+		sender.close()
+
+
+async def _inspect_shard(sender, config, repos, *,
+	quick, untracked_size, timeout, jobs, device_jobs, workers, launcher, background, report_started,
+):
+	# Messages refer to repos by their index in `repos`, and clean ones, almost all of them, are sent
+	# as `None`.
+	_gitcli.set_launcher(launcher)
+	untracked_sizes = None
+	if untracked_size:
+		untracked_sizes = dirsize.DirectorySizes()
+		await run_in_daemon_thread(untracked_sizes.load)
+	status = Status()
+	status.prepare(config, quick=quick, untracked_sizes=untracked_sizes)
+	limiter = scheduling.DeviceLimiter(
+		jobs=jobs if jobs is not None else config.jobs,
+		device_jobs=device_jobs,
+		configured_device_jobs=config.device_jobs,
+		workers=workers,
+		background=background,
 	)
-
-	# TODO Double check this
-	prefix = ref[:len(spec_pre)]
-	infix = ref[len(spec_pre):(len(ref)-len(spec_post))]
-	suffix = ref[(len(ref)-len(spec_post)):]
-
-	if prefix == spec_pre and suffix == spec_post:
-		return other_spec_pre + infix + other_spec_post
-	else:
-		return None
+	await limiter.prepare()
+	limiter.set_order(repos)
+
+	async def inspect(i, repo):
+		on_started = functools.partial(sender.send, ("started", i)) if report_started else None
+		result, duration = await status.inspect_repo(repo, limiter, timeout=timeout, on_started=on_started)
+		sender.send(("finished", i, result if result else None, duration))
+
+	try:
+		await asyncio.gather(*(inspect(i, repo) for i, repo in enumerate(repos)))
+	finally:
+		await catfile.close_pool()
+		await _gitcli.close_launcher()
+	# pylint: disable-next=protected-access
+	memo, quick_checks = status._commit_walks, status._quick_checks
+	sender.send(("ended", _gitcli.processes_started, memo.hits, memo.misses, quick_checks,
+		untracked_sizes.entries() if untracked_sizes is not None else None,
+		limiter.throttle.throttled_seconds if limiter.throttle is not None else None,
+	))
+
+
+def _forward_messages(receiver, loop, queue, key):
+	"""
+	Puts `(key, message)` for each message received on the connection on the asyncio queue, and
+	`(key, None)` once it's closed.
+	"""
+	try:
+		while True:
+			try:
+				message = receiver.recv()
+			except (EOFError, OSError):
+				break
+			loop.call_soon_threadsafe(queue.put_nowait, (key, message))
+		loop.call_soon_threadsafe(queue.put_nowait, (key, None))
+	except RuntimeError:
+		# The event loop is closed, nobody is waiting anymore.
+		pass
+	finally:
+		receiver.close()
 
 
-@command("add", disabled=True)
+@command("add")
 class Add(object):
 	@classmethod
 	def define_arguments(cls, parser):
 		pass
 
-	@classmethod
-	def short_description(cls):
-		return ""
-
 	def __init__(self):
 		pass
 
@@ -618,16 +1051,12 @@ class Add(object):
 		pass
 
 
-@command("remove", "rm", disabled=True)
+@command("remove")
 class Remove(object):
 	@classmethod
 	def define_arguments(cls, parser):
 		pass
 
-	@classmethod
-	def short_description(cls):
-		return ""
-
 	def __init__(self):
 		pass
 
@@ -635,16 +1064,12 @@ class Remove(object):
 		pass
 
 
-@command("cleanup", disabled=True)
+@command("cleanup")
 class Cleanup(object):
 	@classmethod
 	def define_arguments(cls, parser):
 		pass
 
-	@classmethod
-	def short_description(cls):
-		return ""
-
 	def __init__(self):
 		pass
 
@@ -652,16 +1077,12 @@ class Cleanup(object):
 		pass
 
 
-@command("foreach", disabled=True)
+@command("foreach")
 class Foreach(object):
 	@classmethod
 	def define_arguments(cls, parser):
 		pass
 
-	@classmethod
-	def short_description(cls):
-		return ""
-
 	def __init__(self):
 		pass
 
@@ -10,10 +10,6 @@ class Version(object):
 	def define_arguments(cls, parser):
 		pass
 
-	@classmethod
-	def short_description(cls):
-		return "print version"
-
 	def __init__(self):
 		pass
 
@@ -0,0 +1,200 @@
+import os, sys
+from . import constants
+
+
+# `rgit complete` runs on every press of the tab key. Like `rgit prompt`, it's dispatched before the
+# command line parser and the commands are loaded, and this module must not import anything slow to
+# load - pygit2, yaml, asyncio, argparse, json or even pathlib.
+#
+# Candidates are served from an index in the cache directory, rewritten by every other command when
+# the commands or the configured repositories and folders change, and by `rgit ignored` with the
+# ignore groups it found. Each line of the index is a kind and a value separated by a tab.
+#
+# The words of the command line after "rgit", up to and including the one being completed, are
+# passed after "--", and the candidates are printed one per line. Paths are completed a component at
+# a time, like files are. Nothing is printed when there is nothing to suggest, so that shells fall
+# back to completing file names. The shell functions doing that are printed by `--script SHELL`:
+#
+#	eval "$(rgit complete --script bash)"
+#	eval "$(rgit complete --script zsh)"
+
+
+USAGE = "usage: rgit complete [--script bash|zsh] [-- WORD...]\n"
+
+KINDS = ("command", "repository", "folder", "group")
+
+# Options taking a value, whatever follows them is not a positional argument. Kept in sync with the
+# command line parser by the tests.
+GLOBAL_OPTIONS_WITH_VALUES = ("--config-path", "--launcher")
+OPTIONS_WITH_VALUES = {
+	"status": (
+		"--sort", "--jobs", "-j", "--device-jobs", "--workers", "--metrics-out", "--repo-timeout",
+	),
+	"ignored": (
+		"--format", "-f", "--group", "-g", "--not-in-group", "-x", "--list", "-l", "--jobs", "-j",
+		"--device-jobs",
+	),
+	"history": ("--days", "--every", "--limit"),
+}
+GROUP_OPTIONS = ("--group", "-g", "--not-in-group", "-x")
+HISTORY_QUERIES = ("unclean", "trend", "repo")
+
+SCRIPTS = {
+	"bash": (
+		"_rgit() {\n"
+		"\tlocal IFS=$'\\n'\n"
+		"\tCOMPREPLY=($(rgit complete -- \"${COMP_WORDS[@]:1:COMP_CWORD}\"))\n"
+		"\t[[ ${#COMPREPLY[@]} -eq 1 && ${COMPREPLY[0]} == */ ]] && compopt -o nospace\n"
+		"}\n"
+		"complete -o default -F _rgit rgit\n"
+	),
+	"zsh": (
+		"_rgit() {\n"
+		"\tlocal -a candidates\n"
+		"\tcandidates=(${(f)\"$(rgit complete -- \"${(@)words[2,CURRENT]}\")\"})\n"
+		"\tif (( ${#candidates} )); then\n"
+		"\t\tcompadd -Q -S '' -- ${candidates:#*[^/]}\n"
+		"\t\tcompadd -Q -- ${(M)candidates:#*[^/]}\n"
+		"\telse\n"
+		"\t\t_files\n"
+		"\tfi\n"
+		"}\n"
+		"compdef _rgit rgit\n"
+	),
+}
+
+
+def index_path():
+	# The same as `storage.cache_dir()`, which is not used as it imports pathlib.
+	base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+	return os.path.join(base, constants.SELF_NAME, "completion")
+
+
+def read_index():
+	"""
+	Returns lists of values by kind, empty if there is no index.
+	"""
+	index = {kind: [] for kind in KINDS}
+	try:
+		with open(index_path(), "r", encoding="UTF-8", errors="surrogateescape") as fo:
+			lines = fo.read().split("\n")
+	except OSError:
+		return index
+	for line in lines:
+		kind, sep, value = line.partition("\t")
+		if sep and kind in index:
+			index[kind].append(value)
+	return index
+
+
+def update_index(**values_by_kind):
+	"""
+	Replaces the values of the passed kinds in the index, rewriting it only if they changed.
+	"""
+	from . import storage # pylint: disable=import-outside-toplevel
+	index = read_index()
+	updated = {**index, **{kind: list(values) for kind, values in values_by_kind.items()}}
+	if updated != index:
+		storage.write_text(index_path(), "".join(f"{kind}\t{value}\n" for kind in KINDS for value in updated[kind]))
+
+
+def complete(words, index, *, cwd=None):
+	"""
+	Returns the candidates for the last of the words, the one being completed.
+	"""
+	current, before = words[-1], words[:-1]
+	command = None
+	i = 0
+	while i < len(before):
+		if before[i] in GLOBAL_OPTIONS_WITH_VALUES:
+			i += 2
+		elif before[i].startswith("-"):
+			i += 1
+		else:
+			command = before[i]
+			break
+	if command is None:
+		return [] if current.startswith("-") else sorted(c for c in index["command"] if c.startswith(current))
+
+	options_with_values = OPTIONS_WITH_VALUES.get(command, ())
+	positionals = []
+	i += 1
+	while i < len(before):
+		if before[i] == "--":
+			positionals.extend(before[i + 1:])
+			break
+		if before[i] in options_with_values:
+			i += 2
+			continue
+		if not before[i].startswith("-"):
+			positionals.append(before[i])
+		i += 1
+	previous = before[-1] if before else None
+
+	if command == "ignored" and previous in GROUP_OPTIONS:
+		return sorted(g for g in index["group"] if g.startswith(current.lower()))
+	if current.startswith("-") or previous in options_with_values:
+		return []
+	if command in ("status", "ignored"):
+		folders = set(index["folder"])
+		for repo in index["repository"]:
+			folders.add(os.path.dirname(repo) if os.path.basename(repo) == ".git" else repo)
+		return complete_paths(current, folders, cwd=cwd)
+	if command == "history":
+		if not positionals:
+			return [q for q in HISTORY_QUERIES if q.startswith(current)]
+		if positionals == ["repo"]:
+			return complete_paths(current, index["repository"], cwd=cwd)
+	return []
+
+
+def complete_paths(current, paths, *, cwd=None):
+	"""
+	Returns the paths starting with `current`, written the way it is - absolute, relative to the
+	home directory with "~" or relative to `cwd` - up to the component after it.
+	"""
+	home = os.path.expanduser("~")
+	if current.startswith("~"):
+		prefix, shown = home.rstrip(os.sep) + os.sep, "~" + os.sep
+	elif current.startswith(os.sep):
+		prefix, shown = "", ""
+	else:
+		prefix = cwd if cwd is not None else os.getcwd()
+		prefix, shown = prefix.rstrip(os.sep) + os.sep, ""
+	candidates = set()
+	for path in paths:
+		if not path.startswith(prefix):
+			continue
+		path = shown + path[len(prefix):]
+		if not path.startswith(current):
+			continue
+		end = path.find(os.sep, len(current))
+		candidates.add(path[:end + 1] if end != -1 else path)
+	# A folder with more candidates in it is only offered to be continued.
+	return sorted(c for c in candidates if c + os.sep not in candidates)
+
+
+def main(args):
+	"""
+	Parses the arguments without argparse, which takes longer to import than the whole completion.
+	"""
+	args = list(args)
+	if args[:1] in (["-h"], ["--help"]):
+		sys.stdout.write(USAGE)
+		return 0
+	if args[:1] == ["--script"]:
+		if len(args) != 2 or args[1] not in SCRIPTS:
+			sys.stderr.write(USAGE)
+			return 2
+		sys.stdout.write(SCRIPTS[args[1]])
+		return 0
+	if args[:1] == ["--"]:
+		args = args[1:]
+	elif args:
+		sys.stderr.write(USAGE)
+		return 2
+	candidates = complete(args or [""], read_index())
+	if candidates:
+		sys.stdout.write("\n".join(candidates))
+		sys.stdout.write("\n")
+	return 0
@@ -1,4 +1,22 @@
-import json, pathlib
+import json, os, pathlib, sys, urllib.parse
+from . import constants
+from .tools import PathTrie, UrlPrefixMatcher
+
+
+def find_default_path():
+	"""
+	Returns the path of the first configuration file that exists in the default locations, or `None`.
+	"""
+	candidates = [
+		(pathlib.Path.home() / ("." + constants.SELF_NAME + ".json")),
+		(pathlib.Path.home() / ".config" / constants.SELF_NAME / "config.json"),
+	]
+
+	for c in candidates:
+		if c.exists():
+			return c
+
+	return None
 
 
 async def load(*, config_file_path):
@@ -8,57 +26,160 @@ async def load(*, config_file_path):
 
 
 class FileBasedConfiguration(object):
+	"""
+	The configuration, validated and compiled once it's loaded - paths are resolved against
+	`basedir`, lists are frozen to tuples and the lookups done for every repository are indexed.
+	"""
+
 	def __init__(self, path):
 		self._path = pathlib.Path(path) if path is not None else None
 		self._content = {}
+		self._compile()
 
 	async def _load(self):
 		if self._path is None or not self._path.exists():
 			return
 		with self._path.open("r") as fo:
 			config = json.load(fo)
-		# TODO Validate loaded config against a schema.
 		self._content = config
+		self._compile()
 
 	async def _save(self):
 		with self._path.open("w") as fo:
 			json.dump(self._content, fo, indent="\t")
 
+	def _compile(self):
+		content = self._content
+		if not isinstance(content, dict):
+			raise ValueError("the configuration must be a JSON object", self._path)
+		for key, value in content.items():
+			validator = _SCHEMA.get(key)
+			if validator is None:
+				# E.g. a comment or an option of another version of rgit.
+				sys.stderr.write(f"WARNING: ignoring unknown configuration option {key!r} in {os.fspath(self._path)!r}\n")
+				continue
+			error = validator(value)
+			if error is not None:
+				raise ValueError(f"configuration option {key!r} {error}", self._path)
+
+		basedir = self.basedir
+		self._repositories = tuple(basedir / r for r in content.get("repositories", ()))
+		self._destination_remotes = tuple(content.get("destination.remotes", ()))
+		self._destination_folders = tuple(basedir / f for f in content.get("destination.folders", ()))
+		self._destination_remotes_ignore = tuple(content.get("destination.remotes.ignore", ()))
+		self._destination_folders_ignore = tuple(basedir / f for f in content.get("destination.folders.ignore", ()))
+		self._scan_folders_ignore = tuple(basedir / f for f in content.get("scan.folders.ignore", ()))
+		self._scan_folders = tuple(basedir / f for f in content.get("scan.folders", ()))
+		self._jobs = content.get("jobs")
+		self._device_jobs = tuple((basedir / f, jobs) for f, jobs in content.get("jobs.devices", {}).items())
+
+		self._destination_remotes_matcher = UrlPrefixMatcher(self._destination_remotes)
+		self._destination_folders_trie = PathTrie(self._destination_folders)
+		ignored_remotes = []
+		for prefix in self._destination_remotes_ignore:
+			prefix_parts = urllib.parse.urlsplit(prefix)
+			# If prefix is a path (no scheme/netloc), resolve to absolute from basedir
+			if not prefix_parts.scheme and not prefix_parts.netloc:
+				prefix_path = pathlib.Path(prefix_parts.path)
+				if not prefix_path.is_absolute():
+					prefix = os.path.normpath(basedir / prefix_path)
+			ignored_remotes.append(prefix)
+		self._destination_remotes_ignore_matcher = UrlPrefixMatcher(ignored_remotes)
+		self._destination_folders_ignore_trie = PathTrie(self._destination_folders_ignore)
+
 	@property
 	def basedir(self):
 		return pathlib.Path.home()
 
 	@property
 	def repositories(self):
-		for r in self._content.get("repositories", []):
-			yield self.basedir / r
+		return self._repositories
 
 	@property
 	def destination_remotes(self):
-		for r in self._content.get("destination.remotes", []):
-			yield r
+		return self._destination_remotes
 
 	@property
 	def destination_folders(self):
-		for f in self._content.get("destination.folders", []):
-			yield self.basedir / f
+		return self._destination_folders
 
 	@property
 	def destination_remotes_ignore(self):
-		for r in self._content.get("destination.remotes.ignore", []):
-			yield r
+		return self._destination_remotes_ignore
 
 	@property
 	def destination_folders_ignore(self):
-		for f in self._content.get("destination.folders.ignore", []):
-			yield self.basedir / f
+		return self._destination_folders_ignore
 
 	@property
 	def scan_folders_ignore(self):
-		for f in self._content.get("scan.folders.ignore", []):
-			yield self.basedir / f
+		return self._scan_folders_ignore
 
 	@property
 	def scan_folders(self):
-		for f in self._content.get("scan.folders", []):
-			yield self.basedir / f
+		return self._scan_folders
+
+	@property
+	def jobs(self):
+		return self._jobs
+
+	@property
+	def device_jobs(self):
+		return self._device_jobs
+
+	def matching_destination_remote(self, url):
+		"""
+		Returns the prefix in "destination.remotes" the absolute URL starts with, or `None`.
+		"""
+		return self._destination_remotes_matcher.match(url)
+
+	def matching_destination_remote_ignore(self, url):
+		"""
+		Returns the prefix in "destination.remotes.ignore" the absolute URL starts with, with paths
+		resolved against `basedir`, or `None`.
+		"""
+		return self._destination_remotes_ignore_matcher.match(url)
+
+	def matching_destination_folder(self, path):
+		"""
+		Returns the folder in "destination.folders" that contains the path, or `None`.
+		"""
+		return self._destination_folders_trie.find(path)
+
+	def matching_destination_folder_ignore(self, path):
+		"""
+		Returns the folder in "destination.folders.ignore" that contains the path, or `None`.
+		"""
+		return self._destination_folders_ignore_trie.find(path)
+
+
+def _list_of_strings(value):
+	if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+		return "must be a list of strings"
+	return None
+
+
+def _positive_int(value):
+	if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+		return "must be a positive integer"
+	return None
+
+
+def _positive_ints_by_string(value):
+	if not isinstance(value, dict) or any(_positive_int(v) is not None for v in value.values()):
+		return "must be an object with positive integer values"
+	return None
+
+
+# Configuration options and functions returning what's wrong with their values, or `None`.
+_SCHEMA = {
+	"repositories": _list_of_strings,
+	"destination.remotes": _list_of_strings,
+	"destination.folders": _list_of_strings,
+	"destination.remotes.ignore": _list_of_strings,
+	"destination.folders.ignore": _list_of_strings,
+	"scan.folders": _list_of_strings,
+	"scan.folders.ignore": _list_of_strings,
+	"jobs": _positive_int,
+	"jobs.devices": _positive_ints_by_string,
+}
@@ -0,0 +1,146 @@
+import os, queue, threading, time
+from . import storage
+
+
+DEFAULT_THREADS = 8
+# Directories changed this recently may change again within the resolution of their mtime, so what
+# was found in them is not kept for the next run (like git does with "racily clean" index entries).
+RACY_NANOSECONDS = 2_000_000_000
+
+
+def scan_directory(path):
+	"""
+	Returns the total size of the files directly in the directory and the names of its
+	subdirectories, or `(0, ())` for a nested repository, which is inspected on its own. Symlinks are
+	not followed.
+	"""
+	size = 0
+	subdirectories = []
+	with os.scandir(path) as entries:
+		for entry in entries:
+			if entry.name == ".git":
+				return (0, ())
+			try:
+				if entry.is_dir(follow_symlinks=False):
+					subdirectories.append(entry.name)
+				else:
+					# Comes from the scandir call itself on Windows, and is cached by the entry.
+					size += entry.stat(follow_symlinks=False).st_size
+			except OSError:
+				pass
+	return (size, tuple(subdirectories))
+
+
+class DirectorySizes(object):
+	"""
+	Totals the sizes of files and directories, walking directories from a pool of daemon threads.
+	What is found in each directory is kept by its mtime in the cache directory, so only the
+	directories that changed since the previous run are read again. A directory's mtime changes when
+	entries are added, removed or renamed, but not when a file in it is rewritten in place, such a
+	file is counted with its old size until something else in the directory changes.
+	"""
+
+	def __init__(self, path=None, *, threads=DEFAULT_THREADS):
+		self._path = path if path is not None else (storage.cache_dir() / "dirsizes.json")
+		self._threads = threads
+		self._queue = queue.Queue()
+		self._lock = threading.Lock()
+		self._started = False
+		# Paths to `[mtime_ns, size, subdirectories]` from the previous run.
+		self._cached = {}
+		# The same for directories seen in this run, which are not looked at again.
+		self._seen = {}
+
+	def load(self):
+		content = storage.read_json(self._path, {})
+		self._cached = content if isinstance(content, dict) else {}
+
+	def save(self):
+		"""
+		Writes what was found in the directories seen in this run, forgetting all others.
+		"""
+		storage.write_json(self._path, self.entries())
+
+	def entries(self):
+		with self._lock:
+			return {path: entry for path, entry in self._seen.items() if entry[0] is not None}
+
+	def update(self, entries):
+		"""
+		Adds entries of another instance, e.g. of another process, to the ones saved by `save()`.
+		"""
+		with self._lock:
+			self._seen.update(entries)
+
+	def measure(self, paths):
+		"""
+		Returns the total size of the files and of everything in the directories, blocking until all
+		are walked. Missing paths are ignored.
+		"""
+		walk = _Walk()
+		directories = []
+		for path in paths:
+			try:
+				st = os.lstat(path)
+			except OSError:
+				continue
+			if os.path.isdir(path) and not os.path.islink(path):
+				directories.append(os.fspath(path).rstrip(os.sep) or os.sep)
+			else:
+				walk.size += st.st_size
+		if not directories:
+			return walk.size
+		walk.pending = len(directories)
+		self._start_threads()
+		for directory in directories:
+			self._queue.put((directory, walk))
+		walk.done.wait()
+		return walk.size
+
+	def _start_threads(self):
+		with self._lock:
+			if self._started:
+				return
+			self._started = True
+		for _ in range(self._threads):
+			threading.Thread(target=self._worker, daemon=True).start()
+
+	def _worker(self):
+		while True:
+			path, walk = self._queue.get()
+			size, subdirectories = self._scan(path)
+			with walk.lock:
+				walk.size += size
+				# Counted before they are queued, so that the walk is not done before they are.
+				walk.pending += len(subdirectories) - 1
+				done = walk.pending == 0
+			for name in subdirectories:
+				self._queue.put((os.path.join(path, name), walk))
+			if done:
+				walk.done.set()
+
+	def _scan(self, path):
+		with self._lock:
+			entry = self._seen.get(path)
+		if entry is not None:
+			return entry[1], entry[2]
+		try:
+			mtime = os.stat(path, follow_symlinks=False).st_mtime_ns
+			entry = self._cached.get(path)
+			if entry is None or entry[0] != mtime:
+				entry = [mtime, *scan_directory(path)]
+				if time.time_ns() - mtime < RACY_NANOSECONDS:
+					entry[0] = None
+		except OSError:
+			entry = [None, 0, ()]
+		with self._lock:
+			self._seen[path] = entry
+		return entry[1], entry[2]
+
+
+class _Walk(object):
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.done = threading.Event()
+		self.size = 0
+		self.pending = 0
@@ -1,35 +1,14 @@
-import os, pathlib, re, subprocess
+import asyncio, contextlib, os, pathlib, re, subprocess
 import pygit2
-from . import _gitcli
+from . import _gitcli, catfile, gitindex
+from .gitdir import common_dir, probe_state
+from .tools import run_in_daemon_thread
 
 
-async def status(repo, *args):
-	def process_status_porcelain_v2_output(stdout):
-		result = []
-		if stdout:
-			assert stdout[-1] == "\0"
-			stdout = stdout[:-1].split("\0")
-		while stdout:
-			entry = stdout.pop(0)
-			t, sp = entry[:2]
-			status_line = entry[2:]
-			assert sp == " "
-			if t == "#":
-				result.append(process_header(status_line))
-			elif t == "?":
-				result.append(process_untracked(status_line))
-			elif t == "!":
-				result.append(process_ignored(status_line))
-			elif t == "1":
-				result.append(process_ordinary(status_line))
-			elif t == "2":
-				result.append(process_rename(status_line, stdout.pop(0)))
-			elif t == "u":
-				result.append(process_unmerged(status_line))
-			else:
-				raise ValueError(f"unrecognized status line {entry}")
-		return result
-
+async def parse_status_porcelain_v2(entries):
+	"""
+	Parses the NUL separated records of `git status -z --porcelain=v2` from the async iterator.
+	"""
 	def process_header(header):
 		name, sep, value = header.partition(" ")
 		assert sep == " "
@@ -94,16 +73,40 @@ async def status(repo, *args):
 
 		return (xy, sub, mH, mI, mW, hH, hI, status_line)
 
-	return process_status_porcelain_v2_output(
-		await git(repo, "status", *args, "-z", "--porcelain=v2")
-	)
+	result = []
+	async for entry in entries:
+		t, sp = entry[:2]
+		status_line = entry[2:]
+		assert sp == " "
+		if t == "#":
+			result.append(process_header(status_line))
+		elif t == "?":
+			result.append(process_untracked(status_line))
+		elif t == "!":
+			result.append(process_ignored(status_line))
+		elif t == "1":
+			result.append(process_ordinary(status_line))
+		elif t == "2":
+			result.append(process_rename(status_line, await anext(entries)))
+		elif t == "u":
+			result.append(process_unmerged(status_line))
+		else:
+			raise ValueError(f"unrecognized status line {entry}")
+	return result
+
+
+async def status(repo, *args):
+	async with contextlib.aclosing(git_stream(repo, "status", *args, "-z", "--porcelain=v2", delimiter=b"\0")) as entries:
+		return await parse_status_porcelain_v2(entries)
 
 
 async def get_remotes(repo):
 	# Use pygit2 instead of spawning git process
-	try:
+	def get_remotes_pygit2():
 		pygit_repo = pygit2.Repository(str(repo))
 		return list(pygit_repo.remotes.names())
+	try:
+		return await run_in_daemon_thread(get_remotes_pygit2)
 	except pygit2.GitError:
 		# Fall back to git command on error
 		return (await git(repo, "remote")).splitlines()
@@ -163,9 +166,10 @@ async def enumerate_remotes(repo, *, remotes=None):
 		remotes = await get_remotes(repo)
 
 	# Use pygit2 to read config (much faster than spawning git processes)
-	try:
+	def read_remote_configs_pygit2():
 		pygit_repo = pygit2.Repository(str(repo))
 		config = pygit_repo.config
+		result = []
 
 		for remote in remotes:
 			remote_config = {}
@@ -177,8 +181,18 @@ async def enumerate_remotes(repo, *, remotes=None):
 					key = entry.name[len(prefix):]
 					remote_config.setdefault(key, []).append(entry.value)
 
-			yield (remote.strip(), remote_config)
+			result.append((remote.strip(), remote_config))
+		return result
+
+	try:
+		remote_configs = await run_in_daemon_thread(read_remote_configs_pygit2)
 	except pygit2.GitError:
+		remote_configs = None
+
+	if remote_configs is not None:
+		for remote_name, remote_config in remote_configs:
+			yield (remote_name, remote_config)
+	else:
 		# Fall back to original implementation
 		for remote in remotes:
 			remote_config = {}
@@ -209,6 +223,76 @@ async def git(
 	*args,
 	stderr_ok=False, returncode_ok=None, stdin=None, worktree=None, cwd=WORKTREE
 ):
+	return await _gitcli.run_async(
+		*(await _git_command(repo, args, worktree=worktree, cwd=cwd)),
+		cwd=None, stdin=stdin, stderr_ok=stderr_ok, returncode_ok=returncode_ok,
+	)
+
+
+async def git_stream(
+	repo,
+	*args,
+	delimiter=b"\n", encoding="utf_8",
+	stderr_ok=False, returncode_ok=None, stdin=None, worktree=None, cwd=WORKTREE
+):
+	"""
+	Yields records of the output of a git command as they arrive, decoded unless `encoding` is
+	`None`. See `_gitcli.stream_async()`.
+	"""
+	records = _gitcli.stream_async(
+		*(await _git_command(repo, args, worktree=worktree, cwd=cwd)),
+		delimiter=delimiter, stdin=stdin, stderr_ok=stderr_ok, returncode_ok=returncode_ok,
+	)
+	async with contextlib.aclosing(records):
+		async for record in records:
+			yield record.decode(encoding) if encoding is not None else record
+
+
+async def get_objects(repo, oids, *, contents=True):
+	"""
+	Returns a `catfile.GitObject` for each of `oids`, or `None` for those that don't exist, looked up
+	by a `git cat-file` process shared by all worktrees of the repo and kept running for a while.
+	"""
+	gitdir = await run_in_daemon_thread(common_dir, repo)
+	return await catfile.get_pool().get_objects(gitdir, oids, contents=contents)
+
+
+_C_ESCAPES = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13, "\"": 34, "\\": 92}
+
+
+def unquote_path(path):
+	"""
+	Undoes the quoting of paths with unusual characters in the output of git commands without `-z`.
+	"""
+	if not path.startswith("\""):
+		return path
+	result = bytearray()
+	i = 1
+	while i < len(path) - 1:
+		c = path[i]
+		if c != "\\":
+			result += c.encode("utf_8", errors="surrogateescape")
+			i += 1
+		elif path[i + 1] in _C_ESCAPES:
+			result.append(_C_ESCAPES[path[i + 1]])
+			i += 2
+		else:
+			result.append(int(path[i + 1:i + 4], 8))
+			i += 4
+	return result.decode("utf_8", errors="surrogateescape")
+
+
+def commit_subject(data):
+	"""
+	Returns the subject of a raw commit object like `%s` in `git log --pretty` does, the first
+	paragraph of the message with the lines joined.
+	"""
+	_, _, message = data.partition(b"\n\n")
+	paragraph = message.lstrip(b"\n").split(b"\n\n", 1)[0]
+	return " ".join(line.strip() for line in paragraph.decode("utf_8", errors="replace").splitlines()).strip()
+
+
+async def _git_command(repo, args, *, worktree, cwd):
 	if not isinstance(repo, pathlib.Path):
 		repo = pathlib.Path(repo)
 
@@ -228,10 +312,7 @@ async def git(
 	if cwd is not None:
 		extra_args.append("-C")
 		extra_args.append(os.fspath(cwd))
-	return await _gitcli.run_async(
-		"git", *extra_args, *args,
-		cwd=None, stdin=stdin, stderr_ok=stderr_ok, returncode_ok=returncode_ok,
-	)
+	return ["git", *extra_args, *args]
 
 
 
@@ -249,6 +330,11 @@ async def exists(gitdir):
 	Returns a tuple (gitdir_exists, worktree_exists).
 	"""
 
+	# Both the stat calls and pygit2 block, and will block forever on a stale network mount.
+	return await run_in_daemon_thread(exists_sync, gitdir)
+
+
+def exists_sync(gitdir):
 	if not isinstance(gitdir, pathlib.Path):
 		gitdir = pathlib.Path(gitdir)
 
@@ -272,6 +358,90 @@ async def exists(gitdir):
 	return (True, worktree.exists() if worktree is not None else None)
 
 
+async def get_state(repo):
+	"""
+	Returns the operations in progress in the worktree, see `gitdir.probe_state()`.
+	"""
+	return await run_in_daemon_thread(probe_state, repo)
+
+
+async def is_worktree_clean_quick(repo):
+	"""
+	Returns `True` if the worktree is known to be clean without running `git status`, and `False`
+	if `git status` has to tell. See `gitindex.is_clean()`.
+	"""
+	try:
+		return await run_in_daemon_thread(is_worktree_clean_quick_sync, repo)
+	except (OSError, ValueError, pygit2.GitError):
+		return False
+
+
+def is_worktree_clean_quick_sync(repo):
+	pygit_repo = pygit2.Repository(os.fspath(repo))
+	if pygit_repo.is_bare:
+		# There is nothing `git status` would report.
+		return True
+	config = pygit_repo.config
+	if pygit_repo.head_is_unborn or "extensions.objectformat" in config:
+		return False
+	if "core.excludesfile" in config:
+		excludes_file = os.path.expanduser(config["core.excludesfile"])
+	else:
+		xdg_config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+		excludes_file = os.path.join(xdg_config_home, "git", "ignore")
+	head_tree = pygit_repo.head.peel(pygit2.Tree)
+	return gitindex.is_clean(
+		os.path.join(pygit_repo.path, "index"),
+		pygit_repo.workdir,
+		head_tree.id.raw,
+		info_exclude=os.path.join(common_dir(repo), "info", "exclude"),
+		excludes_file=excludes_file,
+		index_matches_tree=lambda: not pygit_repo.index.diff_to_tree(head_tree),
+	)
+
+
+class ObjectDatabaseMemo(object):
+	"""
+	Memoizes results of coroutines that only depend on the object database of the repo and the
+	passed key, e.g. the commits reachable from one oid but not from a set of others. Concurrent
+	requests for the same key share a single computation.
+	"""
+
+	def __init__(self):
+		self._results = {}
+		self.hits = 0
+		self.misses = 0
+
+	async def get(self, repo, key, coro_factory):
+		key = (await run_in_daemon_thread(common_dir, repo), key)
+		entry = self._results.get(key)
+		if entry is None or entry[0].cancelled():
+			self.misses += 1
+			# The computation and the number of callers waiting for it.
+			entry = [asyncio.ensure_future(coro_factory()), 0]
+			self._results[key] = entry
+		else:
+			self.hits += 1
+		task = entry[0]
+		entry[1] += 1
+		try:
+			# Shielded so that a caller that is cancelled (e.g. timed out) doesn't cancel the
+			# computation for the others still waiting.
+			return await asyncio.shield(task)
+		finally:
+			entry[1] -= 1
+			if entry[1] == 0 and not task.done():
+				task.cancel()
+
+	def clear(self):
+		"""
+		Forgets the results, cancelling the computations still running. The counts are kept.
+		"""
+		for task, _ in self._results.values():
+			task.cancel()
+		self._results.clear()
+
+
 class Repo(object):
 	__slots__ = (
 		"_gitdir",
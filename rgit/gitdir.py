@@ -0,0 +1,99 @@
+import os
+
+
+# Routines reading the gitdir directly, without spawning git or loading pygit2. Only `os` is
+# imported, these are used on latency sensitive paths like shell prompts.
+
+
+def resolve(gitdir):
+	"""
+	Follows a gitfile - "gitdir: <path>" - as found in linked worktrees and submodules.
+	"""
+	gitdir = os.fspath(gitdir)
+	if os.path.isfile(gitdir):
+		with open(gitdir, "r", encoding="UTF-8") as fo:
+			text = fo.read()
+		assert text.startswith("gitdir: "), gitdir
+		gitdir = os.path.join(os.path.dirname(gitdir), text[len("gitdir: "):].strip())
+	return gitdir
+
+
+def common_dir(gitdir):
+	"""
+	Returns the directory holding the objects and refs shared by all worktrees of the repo.
+	"""
+	gitdir = resolve(gitdir)
+	try:
+		with open(os.path.join(gitdir, "commondir"), "r", encoding="UTF-8") as fo:
+			commondir = fo.read().strip()
+	except (FileNotFoundError, NotADirectoryError):
+		return os.path.realpath(gitdir)
+	return os.path.realpath(os.path.join(gitdir, commondir))
+
+
+# Rewritten on commits, checkouts, resets, fetches and index updates of a worktree.
+_FINGERPRINT_GITDIR_PATHS = ("HEAD", "index", "ORIG_HEAD", "FETCH_HEAD", os.path.join("logs", "HEAD"))
+# Refs are updated by renaming a lock file, which changes the mtime of the directory they are in.
+_FINGERPRINT_COMMONDIR_PATHS = ("config", "packed-refs", os.path.join("refs", "heads"), os.path.join("refs", "remotes"))
+
+
+def fingerprint(gitdir):
+	"""
+	Returns a string that changes whenever HEAD, the configuration or branches of the repo change,
+	judging by modification times and sizes of the files and directories git updates. Loose refs
+	more than one level below `refs/heads` or `refs/remotes/<remote>` are only covered by the
+	reflog of HEAD and by FETCH_HEAD.
+	"""
+	gitdir = resolve(gitdir)
+	commondir = common_dir(gitdir)
+	paths = [os.path.join(gitdir, p) for p in _FINGERPRINT_GITDIR_PATHS]
+	paths.extend(os.path.join(commondir, p) for p in _FINGERPRINT_COMMONDIR_PATHS)
+	try:
+		with os.scandir(os.path.join(commondir, "refs", "remotes")) as entries:
+			paths.extend(sorted(e.path for e in entries if e.is_dir(follow_symlinks=False)))
+	except OSError:
+		pass
+	result = []
+	for path in paths:
+		try:
+			st = os.stat(path)
+		except OSError:
+			result.append("-")
+			continue
+		result.append(f"{st.st_mtime_ns}:{st.st_size}")
+	return ",".join(result)
+
+
+# Files git leaves in the gitdir of a worktree while an operation is in progress.
+_STATE_PATHS = (
+	("MERGE_HEAD", "merge"),
+	("CHERRY_PICK_HEAD", "cherry-pick"),
+	("REVERT_HEAD", "revert"),
+	("BISECT_LOG", "bisect"),
+)
+
+
+def probe_state(gitdir):
+	"""
+	Returns a tuple of operations in progress in the worktree - "rebase", "am", "merge",
+	"cherry-pick", "revert" and "bisect" - preceded by "detached" if HEAD is detached and it's not
+	because of a rebase, am or bisect in progress.
+	"""
+	gitdir = resolve(gitdir)
+	state = []
+	if os.path.isdir(os.path.join(gitdir, "rebase-merge")):
+		state.append("rebase")
+	elif os.path.isdir(os.path.join(gitdir, "rebase-apply")):
+		state.append("am" if os.path.exists(os.path.join(gitdir, "rebase-apply", "applying")) else "rebase")
+	for path, operation in _STATE_PATHS:
+		if os.path.exists(os.path.join(gitdir, path)):
+			state.append(operation)
+	if not any(o in state for o in ("rebase", "am", "bisect")):
+		try:
+			with open(os.path.join(gitdir, "HEAD"), "rb") as fo:
+				head = fo.read(5)
+		except OSError:
+			head = b"ref: "
+		if head != b"ref: ":
+			state.insert(0, "detached")
+	return tuple(state)
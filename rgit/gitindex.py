@@ -0,0 +1,403 @@
+import collections, mmap, os, stat, struct, threading
+
+
+# Reads the index file of a worktree (see gitformat-index(5)) to tell whether the worktree is clean
+# without running `git status`, the way git itself decides which files it has to look at - by
+# comparing the stat data cached in the index with `lstat` of the files, and the stat data of
+# directories cached in the untracked cache extension with `lstat` of the directories. Anything
+# that would make git look closer (e.g. a file touched but not changed) is reported as possibly
+# dirty, the caller has to run `git status` to find out.
+
+
+SIGNATURE = b"DIRC"
+SUPPORTED_VERSIONS = (2, 3, 4)
+
+FLAG_ASSUME_VALID = 0x8000
+FLAG_EXTENDED = 0x4000
+FLAG_STAGE_MASK = 0x3000
+FLAG_NAME_MASK = 0x0FFF
+EXTENDED_FLAG_SKIP_WORKTREE = 0x4000
+EXTENDED_FLAG_INTENT_TO_ADD = 0x2000
+
+S_IFGITLINK = 0o160000
+
+# The same as git's preload-index - a thread per this many entries, up to `MAX_THREADS`.
+ENTRIES_PER_THREAD = 500
+MAX_THREADS = 20
+
+_header = struct.Struct(">4sII")
+_entry_stat = struct.Struct(">10I")
+_flags = struct.Struct(">H")
+_extension_header = struct.Struct(">4sI")
+# ctime, mtime, dev, ino, uid, gid and size, without mode.
+_stat_data = struct.Struct(">9I")
+_uint32 = struct.Struct(">I")
+
+
+Entry = collections.namedtuple("Entry", [
+	"ctime_s", "ctime_ns", "mtime_s", "mtime_ns", "dev", "ino", "mode", "uid", "gid", "size",
+	"oid", "flags", "extended_flags", "path",
+])
+
+UntrackedDirectory = collections.namedtuple("UntrackedDirectory", ["path", "untracked", "stat_data"])
+
+
+class Index(object):
+	"""
+	A memory mapped index file. Entries and extensions are parsed on demand.
+	"""
+
+	def __init__(self, path, *, hash_size=20):
+		self._hash_size = hash_size
+		with open(path, "rb") as fo:
+			st = os.fstat(fo.fileno())
+			self._mm = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else b""
+		# Entries modified at or after this time are racily clean, see gitformat-index(5).
+		self.mtime_ns = st.st_mtime_ns
+		if len(self._mm) < _header.size + hash_size:
+			raise ValueError("index file is too short", path)
+		signature, self.version, self.count = _header.unpack_from(self._mm, 0)
+		if signature != SIGNATURE:
+			raise ValueError("not an index file", path)
+		if self.version not in SUPPORTED_VERSIONS:
+			raise ValueError("unsupported index version", path, self.version)
+		self._entries_end = None
+		self._extensions = None
+
+	def close(self):
+		if isinstance(self._mm, mmap.mmap):
+			self._mm.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def entries(self):
+		"""
+		Yields an `Entry` for every entry in the index, paths are bytes relative to the worktree.
+		"""
+		mm = self._mm
+		offset = _header.size
+		oid_offset = _entry_stat.size
+		flags_offset = oid_offset + self._hash_size
+		path = b""
+		for _ in range(self.count):
+			values = _entry_stat.unpack_from(mm, offset)
+			oid = mm[offset + oid_offset:offset + flags_offset]
+			flags, = _flags.unpack_from(mm, offset + flags_offset)
+			path_offset = offset + flags_offset + _flags.size
+			extended_flags = 0
+			if flags & FLAG_EXTENDED:
+				extended_flags, = _flags.unpack_from(mm, path_offset)
+				path_offset += _flags.size
+			if self.version == 4:
+				strip, path_offset = _decode_varint(mm, path_offset)
+				end = mm.find(b"\0", path_offset)
+				if end < 0 or strip > len(path):
+					raise ValueError("corrupt index entry", offset)
+				path = path[:len(path) - strip] + mm[path_offset:end]
+				offset = end + 1
+			else:
+				length = flags & FLAG_NAME_MASK
+				end = path_offset + length if length < FLAG_NAME_MASK else mm.find(b"\0", path_offset)
+				if end < 0:
+					raise ValueError("corrupt index entry", offset)
+				path = mm[path_offset:end]
+				# Entries are padded with 1-8 NULs to a multiple of 8 bytes.
+				offset += (end - offset + 8) & ~7
+			yield Entry(*values, oid, flags, extended_flags, path)
+		self._entries_end = offset
+
+	def extensions(self):
+		"""
+		Returns a dict of extension data by signature.
+		"""
+		if self._extensions is None:
+			if self._entries_end is None:
+				for _ in self.entries():
+					pass
+			extensions = {}
+			offset = self._entries_end
+			end = len(self._mm) - self._hash_size
+			while offset + _extension_header.size <= end:
+				signature, size = _extension_header.unpack_from(self._mm, offset)
+				offset += _extension_header.size
+				if offset + size > end:
+					raise ValueError("corrupt index extension", signature)
+				extensions[signature] = self._mm[offset:offset + size]
+				offset += size
+			self._extensions = extensions
+		return self._extensions
+
+	def cache_tree_root(self):
+		"""
+		Returns the oid of the tree the whole index would be written as, or `None` if it's not
+		known, e.g. because entries were added or changed since it was last computed.
+		"""
+		data = self.extensions().get(b"TREE")
+		if not data:
+			return None
+		# The root is the first entry - an empty path, the number of entries it covers (-1 if
+		# invalidated) and the number of subtrees, followed by the oid if it's valid.
+		path_end = data.find(b"\0")
+		line_end = data.find(b"\n", path_end)
+		if path_end != 0 or line_end < 0:
+			return None
+		entry_count, _, _ = data[path_end + 1:line_end].partition(b" ")
+		if int(entry_count) != self.count:
+			return None
+		return data[line_end + 1:line_end + 1 + self._hash_size]
+
+	def untracked_cache(self):
+		"""
+		Returns the parsed untracked cache extension, or `None` if there is none.
+		"""
+		data = self.extensions().get(b"UNTR")
+		if data is None:
+			return None
+		return UntrackedCache(data, hash_size=self._hash_size)
+
+
+class UntrackedCache(object):
+	"""
+	The untracked cache extension, written when `core.untrackedCache` is enabled.
+	"""
+
+	def __init__(self, data, *, hash_size=20):
+		ident_size, offset = _decode_varint(data, 0)
+		self.idents = [i.decode("utf_8", "surrogateescape") for i in data[offset:offset + ident_size].split(b"\0")[:-1]]
+		offset += ident_size
+		self.info_exclude_stat_data = _stat_data.unpack_from(data, offset)
+		offset += _stat_data.size
+		self.excludes_file_stat_data = _stat_data.unpack_from(data, offset)
+		offset += _stat_data.size
+		self.dir_flags, = _uint32.unpack_from(data, offset)
+		offset += _uint32.size
+		# Hashes of info/exclude and of core.excludesFile.
+		offset += 2 * hash_size
+		end = data.index(b"\0", offset)
+		self.exclude_per_dir = data[offset:end]
+		offset = end + 1
+
+		self.directories = []
+		count, offset = _decode_varint(data, offset) if offset < len(data) else (0, offset)
+		if not count:
+			return
+		names = []
+		offset = self._read_directory(data, offset, b"", names)
+		if len(names) != count:
+			raise ValueError("corrupt untracked cache", count, len(names))
+		valid, offset = _read_ewah(data, offset)
+		_, offset = _read_ewah(data, offset)
+		_, offset = _read_ewah(data, offset)
+		stat_data = {}
+		for i in valid:
+			stat_data[i] = _stat_data.unpack_from(data, offset)
+			offset += _stat_data.size
+		self.directories = [
+			UntrackedDirectory(path, untracked, stat_data.get(i))
+			for i, (path, untracked) in enumerate(names)
+		]
+
+	@classmethod
+	def _read_directory(cls, data, offset, parent, result):
+		untracked_count, offset = _decode_varint(data, offset)
+		directory_count, offset = _decode_varint(data, offset)
+		end = data.index(b"\0", offset)
+		path = parent + data[offset:end] + b"/" if end > offset else parent
+		offset = end + 1
+		untracked = []
+		for _ in range(untracked_count):
+			end = data.index(b"\0", offset)
+			untracked.append(data[offset:end])
+			offset = end + 1
+		result.append((path, untracked))
+		for _ in range(directory_count):
+			offset = cls._read_directory(data, offset, path, result)
+		return offset
+
+
+def _decode_varint(data, offset):
+	"""
+	Decodes the variable width integer git uses in index files. Returns `(value, next_offset)`.
+	"""
+	c = data[offset]
+	offset += 1
+	value = c & 0x7F
+	while c & 0x80:
+		c = data[offset]
+		offset += 1
+		value = ((value + 1) << 7) | (c & 0x7F)
+	return value, offset
+
+
+def _read_ewah(data, offset):
+	"""
+	Reads an EWAH compressed bitmap. Returns `(positions_of_set_bits, next_offset)`.
+	"""
+	_bit_count, word_count = struct.unpack_from(">II", data, offset)
+	offset += 8
+	words = struct.unpack_from(f">{word_count}Q", data, offset)
+	offset += 8 * word_count
+	# The position of the last run length word.
+	offset += _uint32.size
+	positions = []
+	position = 0
+	i = 0
+	while i < word_count:
+		# A run length word - a bit repeated for a number of words, followed by literal words.
+		rlw = words[i]
+		i += 1
+		running_bit = rlw & 1
+		running_words = (rlw >> 1) & 0xFFFFFFFF
+		literal_words = rlw >> 33
+		if running_bit:
+			positions.extend(range(position, position + 64 * running_words))
+		position += 64 * running_words
+		for word in words[i:i + literal_words]:
+			while word:
+				low = word & -word
+				positions.append(position + low.bit_length() - 1)
+				word ^= low
+			position += 64
+		i += literal_words
+	return positions, offset
+
+
+def _stat_data_matches(stat_data, st, racy_after_ns):
+	"""
+	Compares the stat data cached by git with `lstat` results, treating anything modified at or
+	after `racy_after_ns` as changed.
+	"""
+	ctime_s, ctime_ns, mtime_s, mtime_ns, _dev, ino, uid, gid, size = stat_data
+	if mtime_s * 1_000_000_000 + mtime_ns >= racy_after_ns:
+		return False
+	# Stat data is truncated to 32 bits in the index. The device is not compared, like git does by
+	# default, as it's not stable on network file systems.
+	return (
+		(mtime_s, mtime_ns, ctime_s, ctime_ns) == (
+			int(st.st_mtime) & 0xFFFFFFFF, st.st_mtime_ns % 1_000_000_000,
+			int(st.st_ctime) & 0xFFFFFFFF, st.st_ctime_ns % 1_000_000_000,
+		) and
+		ino == st.st_ino & 0xFFFFFFFF and
+		uid == st.st_uid & 0xFFFFFFFF and
+		gid == st.st_gid & 0xFFFFFFFF and
+		size == st.st_size & 0xFFFFFFFF
+	)
+
+
+def _entry_matches(worktree, entry, racy_after_ns):
+	try:
+		st = os.lstat(worktree + entry.path)
+	except OSError:
+		return False
+	if stat.S_IFMT(entry.mode) == stat.S_IFLNK:
+		if not stat.S_ISLNK(st.st_mode):
+			return False
+	elif not stat.S_ISREG(st.st_mode) or (entry.mode ^ st.st_mode) & 0o100:
+		return False
+	stat_data = (*entry[:4], entry.dev, entry.ino, entry.uid, entry.gid, entry.size)
+	return _stat_data_matches(stat_data, st, racy_after_ns)
+
+
+def _find_changed_entries(worktree, entries, racy_after_ns, threads):
+	"""
+	Returns whether any of the entries doesn't match the worktree. The worktree is split between
+	threads, which all stop as soon as one of them finds a mismatch.
+	"""
+	found = threading.Event()
+	def check(chunk):
+		for entry in chunk:
+			if found.is_set():
+				return
+			if not _entry_matches(worktree, entry, racy_after_ns):
+				found.set()
+				return
+	threads = max(1, min(threads, len(entries) // ENTRIES_PER_THREAD))
+	if threads == 1:
+		check(entries)
+		return found.is_set()
+	chunk_size = -(-len(entries) // threads)
+	workers = [
+		threading.Thread(target=check, args=(entries[i:i + chunk_size],), daemon=True)
+		for i in range(0, len(entries), chunk_size)
+	]
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+	return found.is_set()
+
+
+def _file_matches(stat_data, path, racy_after_ns):
+	try:
+		st = os.stat(path)
+	except OSError:
+		# Missing files are recorded with zeroed stat data.
+		return not any(stat_data)
+	return _stat_data_matches(stat_data, st, racy_after_ns)
+
+
+def is_clean(index_path, worktree, head_tree_oid, *,
+	info_exclude, excludes_file, index_matches_tree=None, hash_size=20, threads=MAX_THREADS,
+):
+	"""
+	Returns `True` if the worktree is known to be clean - the index matches `head_tree_oid`, files
+	match the index and there are no untracked files - and `False` if `git status` is needed to
+	tell. Blocks on file system calls.
+
+	The cached tree of the index is only valid until entries change and is not recomputed by
+	`git status`. When it's not valid, `index_matches_tree()` is called if passed.
+	"""
+	worktree = os.fsencode(worktree)
+	if not worktree.endswith(b"/"):
+		worktree += b"/"
+	with Index(index_path, hash_size=hash_size) as index:
+		extensions = index.extensions()
+		# Split and sparse indexes, and any other extension git requires to understand the index.
+		if any(not signature[:1].isupper() for signature in extensions):
+			return False
+		# Staged changes.
+		cache_tree_root = index.cache_tree_root()
+		if cache_tree_root is None and index_matches_tree is not None:
+			if not index_matches_tree():
+				return False
+		elif cache_tree_root != head_tree_oid:
+			return False
+
+		untracked_cache = index.untracked_cache()
+		if untracked_cache is None:
+			return False
+		ident = f"Location {os.fsdecode(worktree[:-1])}, system {os.uname().sysname}"
+		if ident not in untracked_cache.idents:
+			return False
+		if not _file_matches(untracked_cache.info_exclude_stat_data, info_exclude, index.mtime_ns):
+			return False
+		if excludes_file is not None and not _file_matches(untracked_cache.excludes_file_stat_data, excludes_file, index.mtime_ns):
+			return False
+		if not untracked_cache.directories:
+			return False
+		for directory in untracked_cache.directories:
+			if directory.untracked or directory.stat_data is None:
+				return False
+			try:
+				st = os.lstat(worktree + directory.path)
+			except OSError:
+				return False
+			if not _stat_data_matches(directory.stat_data, st, index.mtime_ns):
+				return False
+
+		entries = []
+		for entry in index.entries():
+			if entry.flags & FLAG_STAGE_MASK or entry.extended_flags & EXTENDED_FLAG_INTENT_TO_ADD:
+				# Conflicts and `git add -N`.
+				return False
+			if entry.flags & FLAG_ASSUME_VALID or entry.extended_flags & EXTENDED_FLAG_SKIP_WORKTREE:
+				continue
+			if stat.S_IFMT(entry.mode) == S_IFGITLINK:
+				# Submodules are dirty if their worktrees are.
+				return False
+			entries.append(entry)
+		return not _find_changed_entries(worktree, entries, index.mtime_ns, threads)
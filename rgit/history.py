@@ -0,0 +1,186 @@
+import json, os, sqlite3
+from . import storage
+
+
+# The version of the schema below, kept in `PRAGMA user_version`.
+SCHEMA_VERSION = 1
+
+# Runs that only inspected some repositories (`rgit status FOLDER...`) are kept, but are not used
+# for the trends of the whole fleet.
+#
+# Records are only stored for repositories that were unclean, which is a small part of them in
+# every run. Whether a repository is clean and since when is kept in `repos`, updated by every
+# run that inspected it, so that the repositories unclean for a long time are found with an index
+# instead of by going through the records.
+_SCHEMA = """
+CREATE TABLE runs (
+	id INTEGER PRIMARY KEY,
+	time REAL NOT NULL,
+	duration REAL NOT NULL,
+	partial INTEGER NOT NULL,
+	repositories INTEGER NOT NULL,
+	unclean INTEGER NOT NULL,
+	commits INTEGER NOT NULL,
+	changes INTEGER NOT NULL
+);
+CREATE INDEX runs_time ON runs (partial, time);
+
+CREATE TABLE repos (
+	id INTEGER PRIMARY KEY,
+	path TEXT NOT NULL UNIQUE,
+	last_run INTEGER NOT NULL,
+	unclean_since REAL,
+	unpushed_since REAL
+);
+CREATE INDEX repos_unclean_since ON repos (unclean_since);
+
+CREATE TABLE records (
+	repo INTEGER NOT NULL,
+	run INTEGER NOT NULL,
+	commits INTEGER NOT NULL,
+	refs INTEGER NOT NULL,
+	changes INTEGER NOT NULL,
+	error INTEGER NOT NULL,
+	columns TEXT NOT NULL,
+	PRIMARY KEY (repo, run)
+) WITHOUT ROWID;
+"""
+
+
+class History(object):
+	"""
+	Results of previous `rgit status` runs, stored in an SQLite database in the data directory.
+	"""
+
+	def __init__(self, path=None):
+		self._path = path if path is not None else (storage.data_dir() / "history.sqlite3")
+		self._db = None
+
+	def __enter__(self):
+		self.open()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def open(self):
+		self._path.parent.mkdir(parents=True, exist_ok=True)
+		db = sqlite3.connect(self._path, timeout=30)
+		try:
+			# Readers, e.g. `rgit history`, are never blocked by a run that is being recorded.
+			db.execute("PRAGMA journal_mode = WAL")
+			db.execute("PRAGMA synchronous = NORMAL")
+			version = db.execute("PRAGMA user_version").fetchone()[0]
+			if version == 0:
+				db.executescript(f"BEGIN; {_SCHEMA} PRAGMA user_version = {SCHEMA_VERSION}; COMMIT;")
+			elif version != SCHEMA_VERSION:
+				raise ValueError("unsupported version of the history database", os.fspath(self._path), version)
+		except BaseException:
+			db.close()
+			raise
+		self._db = db
+
+	def close(self):
+		if self._db is not None:
+			self._db.close()
+			self._db = None
+
+	def record_run(self, statuses, *, time, duration, partial=False):
+		"""
+		Stores the `RepoStatus` records of a run in a single transaction.
+		"""
+		unclean = [status for status in statuses if status]
+		with self._db as db:
+			run = db.execute(
+				"INSERT INTO runs (time, duration, partial, repositories, unclean, commits, changes) "
+				"VALUES (?, ?, ?, ?, ?, ?, ?)",
+				(
+					time, duration, int(partial), len(statuses), len(unclean),
+					sum(s.commits for s in unclean), sum(_count_changes(s) for s in unclean),
+				),
+			).lastrowid
+			db.executemany(
+				"INSERT OR IGNORE INTO repos (path, last_run) VALUES (?, ?)",
+				((os.fspath(s.path), run) for s in statuses),
+			)
+			repo_ids = dict(db.execute("SELECT path, id FROM repos"))
+			db.executemany(
+				"UPDATE repos SET last_run = ?, "
+				"unclean_since = CASE WHEN ? THEN coalesce(unclean_since, ?) END, "
+				"unpushed_since = CASE WHEN ? THEN coalesce(unpushed_since, ?) END "
+				"WHERE id = ?",
+				(
+					(run, bool(s), time, s.commits > 0, time, repo_ids[os.fspath(s.path)])
+					for s in statuses
+				),
+			)
+			db.executemany(
+				"INSERT INTO records (repo, run, commits, refs, changes, error, columns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+				(
+					(
+						repo_ids[os.fspath(s.path)], run, s.commits, s.refs, _count_changes(s),
+						int(s.error is not None), json.dumps(s.to_dict(), separators=(",", ":"), default=str),
+					)
+					for s in unclean
+				),
+			)
+		return run
+
+	def get_unclean(self, before):
+		"""
+		Returns `(path, unclean_since, unpushed_since, commits, columns)` of repositories that have been
+		unclean since `before` or earlier, as of the last run that inspected them, oldest first.
+		Repositories that were not inspected since the last full run, e.g. removed from the
+		configuration, are left out.
+		"""
+		return [
+			(path, unclean_since, unpushed_since, commits, json.loads(columns))
+			for path, unclean_since, unpushed_since, commits, columns in self._db.execute(
+				"SELECT repos.path, repos.unclean_since, repos.unpushed_since, records.commits, records.columns "
+				"FROM repos JOIN records ON records.repo = repos.id AND records.run = repos.last_run "
+				"WHERE repos.unclean_since <= ? "
+				"AND repos.last_run >= (SELECT coalesce(max(id), 0) FROM runs WHERE partial = 0) "
+				"ORDER BY repos.unclean_since",
+				(before,),
+			)
+		]
+
+	def get_trend(self, since, interval):
+		"""
+		Returns `(time, repositories, unclean, commits, changes)` of the last full run in every
+		`interval` seconds long period since `since`.
+		"""
+		# Columns that are not aggregated come from the row with the maximum, a feature of SQLite.
+		return [
+			tuple(row) for row in self._db.execute(
+				"SELECT max(time), repositories, unclean, commits, changes FROM runs "
+				"WHERE partial = 0 AND time >= ? GROUP BY CAST(time / ? AS INTEGER) ORDER BY time",
+				(since, interval),
+			)
+		]
+
+	def get_repo(self, path, limit):
+		"""
+		Returns `(time, columns)` of up to `limit` most recent runs that found the repository unclean,
+		the most recent first, and the time of the last run that inspected it, if any.
+		"""
+		row = self._db.execute(
+			"SELECT repos.id, runs.time FROM repos JOIN runs ON runs.id = repos.last_run WHERE repos.path = ?",
+			(os.fspath(path),),
+		).fetchone()
+		if row is None:
+			return [], None
+		repo_id, last_seen = row
+		records = [
+			(time, json.loads(columns))
+			for time, columns in self._db.execute(
+				"SELECT runs.time, records.columns FROM records JOIN runs ON runs.id = records.run "
+				"WHERE records.repo = ? ORDER BY records.run DESC LIMIT ?",
+				(repo_id, limit),
+			)
+		]
+		return records, last_seen
+
+
+def _count_changes(status):
+	return sum(status.changes) if status.changes is not None else 0
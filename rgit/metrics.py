@@ -0,0 +1,104 @@
+import math, os
+from .repostatus import CHANGE_COLUMNS
+
+
+# Metrics of a `rgit status` run in the OpenMetrics text format, for the textfile collector of
+# the Prometheus node_exporter (see `rgit status --metrics-out`).
+
+PREFIX = "rgit_"
+
+
+class Metrics(object):
+	"""
+	Metric families in the order they were first added, rendered with `render()`.
+	"""
+
+	def __init__(self):
+		# Name to `[type, help, samples]`, samples being `(labels, value)`.
+		self._families = {}
+
+	def add(self, name, value, help_text, labels=None, metric_type="gauge"):
+		family = self._families.get(name)
+		if family is None:
+			family = self._families[name] = [metric_type, help_text, []]
+		family[2].append((labels or {}, value))
+
+	def render(self):
+		lines = []
+		for name, (metric_type, help_text, samples) in self._families.items():
+			name = PREFIX + name
+			lines.append(f"# TYPE {name} {metric_type}")
+			lines.append(f"# HELP {name} {_escape(help_text)}")
+			for labels, value in samples:
+				if labels:
+					label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+					lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+				else:
+					lines.append(f"{name} {_format_value(value)}")
+		lines.append("# EOF")
+		return "\n".join(lines) + "\n"
+
+
+def collect(statuses, durations, *, run_duration, timestamp, processes_started, memo=None, quick_checks=None,
+	throttled_seconds=None,
+):
+	"""
+	Returns the metrics of a run. Repositories get a series for every per-repository gauge so that
+	alerts can tell "zero" from "not scanned", except for counts of changed paths, which are only
+	present for the statuses that occur.
+	"""
+	m = Metrics()
+	for status in statuses:
+		repo = {"repo": os.fspath(status.path)}
+		m.add("repo_unclean", int(bool(status)), "1 if there is anything to report about the repository", repo)
+		m.add("repo_unpushed_commits", status.commits, "Commits not in any destination remote", repo)
+		m.add("repo_dangling_refs", status.refs, "Refs not matching any ref of a destination remote", repo)
+		m.add("repo_error", int(status.error is not None), "1 if inspecting the repository failed", repo)
+		m.add("repo_timed_out", int("timed out" in (status.notes or ())), "1 if the repository took too long", repo)
+		m.add("repo_operation_in_progress", int(bool(status.state)),
+			"1 if HEAD is detached or a merge, rebase or similar is in progress", repo,
+		)
+		if status.path in durations:
+			m.add("repo_duration_seconds", durations[status.path], "Time spent inspecting the repository", repo)
+		for column in CHANGE_COLUMNS:
+			count = status.get_change(column)
+			if count:
+				m.add("repo_changed_paths", count, "Paths by `git status --porcelain` code, . for unmodified",
+					{**repo, "status": column.replace("•", ".")},
+				)
+	m.add("run_timestamp_seconds", timestamp, "When the run finished")
+	m.add("run_duration_seconds", run_duration, "Duration of the run")
+	m.add("run_repositories", len(statuses), "Repositories scanned")
+	m.add("run_unclean_repositories", sum(1 for s in statuses if s), "Repositories with anything to report")
+	m.add("run_processes_started", processes_started, "Processes started to run git")
+	m.add("run_slowest_repository_seconds", max(durations.values(), default=0),
+		"Time spent inspecting the slowest repository",
+	)
+	if memo is not None:
+		lookups = memo.hits + memo.misses
+		m.add("run_commit_walk_cache_hit_ratio", memo.hits / lookups if lookups else math.nan,
+			"Share of commit walks answered from the ones already made for another repository of the run",
+		)
+	if quick_checks is not None:
+		m.add("run_quick_check_clean_ratio",
+			quick_checks["clean"] / quick_checks.total() if quick_checks.total() else math.nan,
+			"Share of worktrees found clean without `git status`",
+		)
+	if throttled_seconds is not None:
+		m.add("run_throttled_seconds", throttled_seconds,
+			"Time repositories waited for the system load to drop in `--background` runs",
+		)
+	return m
+
+
+def _escape(text):
+	return text.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+	if isinstance(value, float):
+		if math.isnan(value):
+			return "NaN"
+		if math.isinf(value):
+			return "+Inf" if value > 0 else "-Inf"
+	return repr(value)
@@ -0,0 +1,168 @@
+import os, pathlib, queue, threading, time
+from .gitdir import common_dir, resolve as resolve_gitdir
+
+
+DEFAULT_THREADS = 16
+
+
+def get_repo_paths(repo):
+	"""
+	Returns the files and directories the git commands that `status` runs read first - HEAD, the
+	index, the config, refs, pack indexes and the top of the worktree. Blocks on `stat` calls.
+	"""
+	files = []
+	directories = []
+	try:
+		gitdir = pathlib.Path(resolve_gitdir(repo))
+		commondir = pathlib.Path(common_dir(repo))
+	except OSError:
+		return files, directories
+	for path in (gitdir / "HEAD", gitdir / "index", commondir / "config", commondir / "packed-refs"):
+		files.append(path)
+	try:
+		with os.scandir(commondir / "objects" / "pack") as entries:
+			for entry in entries:
+				if entry.name.endswith(".idx"):
+					files.append(entry.path)
+	except OSError:
+		pass
+	if repo.name == ".git":
+		directories.append(repo.parent)
+	return files, directories
+
+
+def prefetch_file(path):
+	"""
+	Asks the kernel to start reading the file into the page cache and returns its size, without
+	waiting for the read to finish.
+	"""
+	try:
+		fd = os.open(path, os.O_RDONLY)
+	except OSError:
+		return 0
+	try:
+		size = os.fstat(fd).st_size
+		if hasattr(os, "posix_fadvise"):
+			os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+		else:
+			# Without fadvise (e.g. on macOS) the only way to warm the cache is to read the file.
+			while os.read(fd, 1 << 20):
+				pass
+		return size
+	except OSError:
+		return 0
+	finally:
+		os.close(fd)
+
+
+def prefetch_directory(path):
+	"""
+	Reads the directory and the inodes of its entries, and the same for its immediate subdirectories.
+	"""
+	try:
+		with os.scandir(path) as entries:
+			subdirectories = []
+			for entry in entries:
+				if entry.is_dir(follow_symlinks=False):
+					if entry.name != ".git":
+						subdirectories.append(entry.path)
+				else:
+					entry.stat(follow_symlinks=False)
+		for subdirectory in subdirectories:
+			with os.scandir(subdirectory) as entries:
+				for entry in entries:
+					entry.stat(follow_symlinks=False)
+	except OSError:
+		pass
+
+
+class Prefetcher(object):
+	"""
+	Issues reads of the files git will need for all selected repos from a pool of threads, so the
+	disks get many requests queued at once instead of the few each git process issues in sequence.
+	The threads are daemon threads, a prefetch stuck on a stale mount doesn't keep rgit running.
+	"""
+
+	def __init__(self, *, threads=DEFAULT_THREADS):
+		self._threads = threads
+		self._queue = queue.Queue()
+		self._lock = threading.Lock()
+		self._pending = 0
+		self._done = threading.Event()
+		self._stopped = False
+		self._started = None
+		self.duration = None
+		self.files = 0
+		self.directories = 0
+		self.bytes = 0
+
+	def start(self, repos):
+		self._started = time.monotonic()
+		repos = list(repos)
+		self._pending = len(repos)
+		if not repos:
+			self._finish()
+			return
+		for repo in repos:
+			self._queue.put((self._prefetch_repo, repo))
+		for _ in range(min(self._threads, len(repos))):
+			threading.Thread(target=self._worker, daemon=True).start()
+
+	def wait(self, timeout=None):
+		return self._done.wait(timeout)
+
+	def stop(self):
+		"""
+		Drops the reads not issued yet, once git no longer needs them. Those underway still finish,
+		but the prefetch is not counted as done.
+		"""
+		with self._lock:
+			self._stopped = True
+		while True:
+			try:
+				self._queue.get_nowait()
+			except queue.Empty:
+				return
+
+	def _worker(self):
+		while True:
+			if self._stopped:
+				return
+			try:
+				func, arg = self._queue.get_nowait()
+			except queue.Empty:
+				return
+			func(arg)
+
+	def _prefetch_repo(self, repo):
+		files, directories = get_repo_paths(repo)
+		# In the order git reads them, the small files every command starts with come first.
+		for path in files:
+			size = prefetch_file(path)
+			with self._lock:
+				self.files += 1
+				self.bytes += size
+		# Directories are fanned out back to the queue so that a large worktree doesn't hold up the
+		# remaining repos.
+		with self._lock:
+			if self._stopped:
+				return
+			self._pending += len(directories) - 1
+			done = self._pending == 0
+		for directory in directories:
+			self._queue.put((self._prefetch_directory, directory))
+		if done:
+			self._finish()
+
+	def _prefetch_directory(self, path):
+		prefetch_directory(path)
+		with self._lock:
+			self.directories += 1
+			self._pending -= 1
+			done = self._pending == 0 and not self._stopped
+		if done:
+			self._finish()
+
+	def _finish(self):
+		self.duration = time.monotonic() - self._started
+		self._done.set()
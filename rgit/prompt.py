@@ -0,0 +1,192 @@
+import os, sys, time, zlib
+from . import constants
+from .gitdir import fingerprint as get_fingerprint, probe_state
+
+
+# `rgit prompt` runs on every shell prompt. It's dispatched before the command line parser and the
+# commands are loaded, and this module must not import anything slow to load - pygit2, yaml,
+# asyncio, argparse, json or even pathlib.
+#
+# `rgit status` leaves an entry for every repository it processes, keyed by the real paths of the
+# gitdir and the worktree. Each entry has a ready to print summary and a fingerprint of the gitdir
+# (see `gitdir.fingerprint()`) taken before the repository was processed. The summary is considered
+# fresh while the fingerprint is unchanged and the entry is not older than the maximum age. The
+# operations in progress (see `gitdir.probe_state()`) are not cached, they are cheap to probe.
+
+
+DEFAULT_BUDGET_MS = 5
+DEFAULT_MAX_AGE = 24 * 60 * 60
+DEFAULT_STALE_MARKER = "?"
+
+# Unchanged entries are rewritten when they get older than this, keeping them below the max age.
+REFRESH_AGE = 60 * 60
+
+USAGE = "usage: rgit prompt [--budget-ms MS] [--max-age SECONDS] [--stale-marker TEXT] [PATH]\n"
+
+
+def cache_dir():
+	# The same as `storage.cache_dir()`, which is not used as it imports pathlib.
+	base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+	return os.path.join(base, constants.SELF_NAME, "prompt")
+
+
+def entry_path(path):
+	data = path.encode("utf_8", "surrogateescape")
+	return os.path.join(cache_dir(), f"{zlib.crc32(data):08x}{zlib.adler32(data):08x}")
+
+
+def summarize(status):
+	"""
+	Returns the summary of the columns of a `repostatus.RepoStatus` that depend on refs and
+	configuration only - the worktree status is out of scope as it can change without the
+	fingerprint changing.
+	"""
+	parts = []
+	if status.commits:
+		parts.append(f"↑{status.commits}")
+	if status.refs:
+		parts.append(f"⚑{status.refs}")
+	# Compared by value, not to `repostatus.MISSING_REMOTE`, which would need importing `array`.
+	if status.remotes == " - ":
+		parts.append("⊘")
+	if status.notes or status.extra:
+		parts.append("!")
+	return " ".join(parts)
+
+
+def read_entry(path):
+	"""
+	Returns `(gitdir, time, fingerprint, summary)` or `None`.
+	"""
+	try:
+		with open(entry_path(path), "r", encoding="UTF-8", errors="surrogateescape") as fo:
+			lines = fo.read().split("\n")
+	except OSError:
+		return None
+	# A different path with the same hash.
+	if len(lines) < 5 or lines[0] != path:
+		return None
+	try:
+		entry_time = float(lines[2])
+	except ValueError:
+		return None
+	return (lines[1], entry_time, lines[3], lines[4])
+
+
+def write_entries(repo, fingerprint, status):
+	"""
+	Writes entries for the gitdir and the worktree of the repo, unless identical ones younger than
+	`REFRESH_AGE` are already there.
+	"""
+	from . import storage # pylint: disable=import-outside-toplevel
+	gitdir = os.path.realpath(repo)
+	paths = [gitdir]
+	if os.path.basename(gitdir) == ".git":
+		paths.append(os.path.dirname(gitdir))
+	summary = summarize(status)
+	now = time.time()
+	for path in paths:
+		entry = read_entry(path)
+		if entry is not None and entry[0] == gitdir and entry[2:] == (fingerprint, summary) and now - entry[1] < REFRESH_AGE:
+			continue
+		storage.write_text(entry_path(path), "\n".join((path, gitdir, repr(now), fingerprint, summary, "")))
+
+
+def prune_entries(repos):
+	"""
+	Removes the entries of gitdirs other than `repos`, e.g. of repositories not in the configuration
+	anymore.
+	"""
+	keep = {os.path.realpath(r) for r in repos}
+	directory = cache_dir()
+	try:
+		names = os.listdir(directory)
+	except FileNotFoundError:
+		return
+	for name in names:
+		# Entries only, not the temporary files of those being written.
+		if len(name) != 16 or name.startswith("."):
+			continue
+		path = os.path.join(directory, name)
+		try:
+			with open(path, "r", encoding="UTF-8", errors="surrogateescape") as fo:
+				lines = fo.read().split("\n")
+		except OSError:
+			continue
+		if len(lines) < 2 or lines[1] not in keep:
+			try:
+				os.unlink(path)
+			except FileNotFoundError:
+				pass
+
+
+def show(path=None, *, budget_ms=DEFAULT_BUDGET_MS, max_age=DEFAULT_MAX_AGE, stale_marker=DEFAULT_STALE_MARKER, fo=sys.stdout):
+	started = time.perf_counter()
+	try:
+		path = os.path.realpath(path) if path is not None else os.getcwd()
+	except OSError:
+		return
+	while (entry := read_entry(path)) is None:
+		parent = os.path.dirname(path)
+		if parent == path:
+			# Not in a repository `rgit status` has processed.
+			return
+		path = parent
+	gitdir, entry_time, fingerprint, summary = entry
+
+	stale = (time.time() - entry_time) > max_age
+	budget = budget_ms / 1000
+	if not stale and (time.perf_counter() - started) < budget:
+		stale = get_fingerprint(gitdir) != fingerprint
+	parts = [summary] if summary else []
+	if (time.perf_counter() - started) < budget:
+		parts.extend(probe_state(gitdir))
+	if (time.perf_counter() - started) >= budget:
+		stale = True
+
+	if stale:
+		parts.append(stale_marker)
+	if parts:
+		fo.write(" ".join(parts))
+		fo.write("\n")
+		fo.flush()
+
+
+def main(args):
+	"""
+	Parses the arguments without argparse, which takes longer to import than the whole prompt.
+	"""
+	kwargs = {}
+	path = None
+	options = {
+		"--budget-ms": ("budget_ms", float),
+		"--max-age": ("max_age", float),
+		"--stale-marker": ("stale_marker", str),
+	}
+	args = list(args)
+	try:
+		while args:
+			arg = args.pop(0)
+			name, sep, value = arg.partition("=")
+			if arg in ("-h", "--help"):
+				sys.stdout.write(USAGE)
+				return 0
+			elif name in options:
+				if not sep:
+					value = args.pop(0)
+				key, convert = options[name]
+				kwargs[key] = convert(value)
+			elif arg == "--":
+				if len(args) > 1:
+					raise ValueError(args)
+				path = args[0] if args else path
+				args = []
+			elif arg.startswith("-") or path is not None:
+				raise ValueError(arg)
+			else:
+				path = arg
+	except (IndexError, ValueError):
+		sys.stderr.write(USAGE)
+		return 2
+	show(path, **kwargs)
+	return 0
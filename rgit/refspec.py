@@ -0,0 +1,168 @@
+import collections
+
+
+# https://git-scm.com/book/en/v2/Git-Internals-The-Refspec
+# https://git-scm.com/docs/git-fetch#_configured_remote_tracking_branches
+
+
+Refspec = collections.namedtuple("Refspec", ["src", "dst", "force", "negative"])
+
+
+# Returned by `RefspecMap.lookup()` for refs that a positive refspec maps but a negative refspec of
+# the same remote excludes.
+EXCLUDED = object()
+
+
+def parse(refspec):
+	"""
+	Parses a single fetch refspec string into a `Refspec` tuple. The `dst` is `None` if the refspec
+	has no destination.
+	"""
+	force = False
+	negative = False
+	if refspec.startswith("+"):
+		force = True
+		refspec = refspec[1:]
+	if refspec.startswith("^"):
+		negative = True
+		refspec = refspec[1:]
+	if force and negative:
+		raise ValueError("negative refspecs can not be forced", refspec)
+	src, sep, dst = refspec.partition(":")
+	if negative and sep:
+		raise ValueError("negative refspecs can not have a destination", refspec)
+	if src.count("*") > 1 or dst.count("*") > 1:
+		raise ValueError("refspec can have at most one asterisk per side", refspec)
+	if sep and ("*" in src) != ("*" in dst):
+		raise ValueError("refspec must have an asterisk on both sides or on neither", refspec)
+	return Refspec(src, dst if sep else None, force, negative)
+
+
+class _Pattern(object):
+	__slots__ = ("pre", "post", "other_pre", "other_post", "remote", "order")
+
+	def __init__(self, spec, other_spec, remote, order):
+		self.pre, _, self.post = spec.partition("*")
+		self.other_pre, _, self.other_post = other_spec.partition("*")
+		self.remote = remote
+		self.order = order
+
+	def match(self, ref):
+		if len(ref) < len(self.pre) + len(self.post):
+			return None
+		if not ref.startswith(self.pre) or not ref.endswith(self.post):
+			return None
+		infix = ref[len(self.pre):len(ref) - len(self.post)]
+		return self.other_pre + infix + self.other_post
+
+
+class _PatternIndex(object):
+	"""
+	Glob refspec sides grouped by the part before the asterisk. Prefixes ending at a "/" (the
+	overwhelmingly common case) are found with one dict probe per path component of the ref; the
+	rest are kept in a list and checked linearly.
+	"""
+
+	__slots__ = ("_by_prefix", "_other")
+
+	def __init__(self):
+		self._by_prefix = {}
+		self._other = []
+
+	def add(self, pattern):
+		if pattern.pre == "" or pattern.pre.endswith("/"):
+			self._by_prefix.setdefault(pattern.pre, []).append(pattern)
+		else:
+			self._other.append(pattern)
+
+	def candidates(self, ref):
+		by_prefix = self._by_prefix
+		if by_prefix:
+			if "" in by_prefix:
+				yield from by_prefix[""]
+			slash = ref.find("/")
+			while slash != -1:
+				patterns = by_prefix.get(ref[:slash + 1])
+				if patterns is not None:
+					yield from patterns
+				slash = ref.find("/", slash + 1)
+		yield from self._other
+
+	def __bool__(self):
+		return bool(self._by_prefix or self._other)
+
+
+class RefspecMap(object):
+	"""
+	Fetch refspecs of all remotes of a repo compiled once into a structure that maps a local ref
+	(the destination side) back to the remote name and the remote ref (the source side).
+	"""
+
+	def __init__(self):
+		self._exact = {}
+		self._patterns = _PatternIndex()
+		self._negative_exact = {}
+		self._negative_patterns = {}
+		self._order = 0
+
+	def add(self, remote, refspec):
+		if isinstance(refspec, str):
+			refspec = parse(refspec)
+		if refspec.negative:
+			if "*" in refspec.src:
+				self._negative_patterns.setdefault(remote, _PatternIndex()).add(
+					_Pattern(refspec.src, "", remote, self._order)
+				)
+			else:
+				self._negative_exact.setdefault(remote, set()).add(refspec.src)
+		elif refspec.dst is None:
+			raise ValueError("refspec without a destination can not be mapped", refspec)
+		elif "*" in refspec.dst:
+			self._patterns.add(_Pattern(refspec.dst, refspec.src, remote, self._order))
+		else:
+			self._exact.setdefault(refspec.dst, (self._order, remote, refspec.src))
+		self._order += 1
+
+	def is_excluded(self, remote, src_ref):
+		if src_ref in self._negative_exact.get(remote, ()):
+			return True
+		negative_patterns = self._negative_patterns.get(remote)
+		if negative_patterns:
+			for pattern in negative_patterns.candidates(src_ref):
+				if pattern.match(src_ref) is not None:
+					return True
+		return False
+
+	def lookup(self, ref):
+		"""
+		Returns a `(remote_name, remote_ref)` tuple for the first refspec (in the order they were
+		added) the ref is a destination of, `EXCLUDED` if all such refspecs are negated, or `None`.
+		"""
+		matches = []
+		exact = self._exact.get(ref)
+		if exact is not None:
+			matches.append(exact)
+		if self._patterns:
+			for pattern in self._patterns.candidates(ref):
+				src_ref = pattern.match(ref)
+				if src_ref is not None:
+					matches.append((pattern.order, pattern.remote, src_ref))
+		if not matches:
+			return None
+		if len(matches) > 1:
+			matches.sort(key=lambda m: m[0])
+		for _, remote, src_ref in matches:
+			if not self.is_excluded(remote, src_ref):
+				return (remote, src_ref)
+		return EXCLUDED
+
+
+def match_refspec(ref, spec, other_spec):
+	"""
+	Maps a single ref matching one side of a refspec to the other side, or returns `None`.
+	"""
+	if ("*" in spec) != ("*" in other_spec):
+		raise ValueError("refspec must have an asterisk on both sides or on neither", spec, other_spec)
+	if "*" not in spec:
+		return other_spec if ref == spec else None
+	return _Pattern(spec, other_spec, None, 0).match(ref)
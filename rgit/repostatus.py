@@ -0,0 +1,134 @@
+import array, sys
+
+
+STATUS_CODES = "MADRCUT"
+
+# Columns counting paths by their `git status --porcelain` code, in the order of `RepoStatus.changes`.
+CHANGE_COLUMNS = (
+	"??",
+	"!!",
+	*(f"{c}•" for c in STATUS_CODES),
+	*(f"•{c}" for c in STATUS_CODES),
+)
+_CHANGE_COLUMN_INDEXES = {c: i for i, c in enumerate(CHANGE_COLUMNS)}
+
+# The value of the "Remotes" column of repositories outside of destination folders that have no
+# destination remote.
+MISSING_REMOTE = " - "
+
+
+class RepoStatus(object):
+	"""
+	The outcome of inspecting a single repository.
+
+	Almost all repositories are clean, so everything is `None` or zero unless there is something to
+	report, and the counters of changed paths are only allocated for repositories that have them.
+	Columns that are rarely present (e.g. "Unsupported Remote Config") are kept in `extra`.
+	"""
+
+	__slots__ = (
+		"path",
+		"notes",
+		"state",
+		"error",
+		"commits",
+		"refs",
+		"remotes",
+		"other_remotes",
+		"changes",
+		"extra",
+	)
+
+	def __init__(self, path, *, notes=None):
+		self.path = path
+		# A tuple of strings.
+		self.notes = notes
+		# A tuple of operations in progress, see `gitdir.probe_state()`.
+		self.state = None
+		self.error = None
+		self.commits = 0
+		self.refs = 0
+		# A tuple of interned remote names, or `MISSING_REMOTE`.
+		self.remotes = None
+		# A tuple of interned remote names.
+		self.other_remotes = None
+		# An array of counts by `CHANGE_COLUMNS`.
+		self.changes = None
+		self.extra = None
+
+	def __repr__(self):
+		return f"<RepoStatus {self.path} {self.to_dict()}>"
+
+	def __bool__(self):
+		"""
+		A repository is clean (false) if there is nothing to report about it.
+		"""
+		return bool(
+			self.notes or self.state or self.error or self.commits or self.refs or self.remotes or
+			self.other_remotes or self.changes is not None or self.extra
+		)
+
+	def __getstate__(self):
+		return tuple(getattr(self, s) for s in self.__slots__)
+
+	def __setstate__(self, state):
+		for s, v in zip(self.__slots__, state):
+			setattr(self, s, v)
+		# Unpickled strings are neither interned nor `MISSING_REMOTE` itself, which is compared by
+		# identity.
+		if self.remotes is not None:
+			self.remotes = MISSING_REMOTE if isinstance(self.remotes, str) else tuple(sys.intern(r) for r in self.remotes)
+		if self.other_remotes is not None:
+			self.other_remotes = tuple(sys.intern(r) for r in self.other_remotes)
+
+	def add_note(self, note):
+		self.notes = (*(self.notes or ()), note)
+
+	def set_remotes(self, remotes):
+		self.remotes = remotes if remotes is MISSING_REMOTE else tuple(sys.intern(r) for r in sorted(remotes))
+
+	def set_other_remotes(self, remotes):
+		self.other_remotes = tuple(sys.intern(r) for r in sorted(remotes))
+
+	def set_extra(self, column, value):
+		if self.extra is None:
+			self.extra = {}
+		self.extra[column] = value
+
+	def count_change(self, column):
+		if self.changes is None:
+			self.changes = array.array("L", bytes(array.array("L").itemsize * len(CHANGE_COLUMNS)))
+		self.changes[_CHANGE_COLUMN_INDEXES[column]] += 1
+
+	def get_change(self, column):
+		if self.changes is None:
+			return 0
+		return self.changes[_CHANGE_COLUMN_INDEXES[column]]
+
+	def columns(self):
+		"""
+		Yields `(column, value)` for all non-empty columns, as displayed in the table.
+		"""
+		if self.notes:
+			yield ("Notes", ", ".join(self.notes))
+		if self.state:
+			yield ("State", ", ".join(self.state))
+		if self.error:
+			yield ("Error", self.error)
+		if self.remotes:
+			yield ("Remotes", self.remotes if self.remotes is MISSING_REMOTE else ", ".join(self.remotes))
+		if self.other_remotes:
+			yield ("Other Remotes", ", ".join(self.other_remotes))
+		if self.extra:
+			yield from self.extra.items()
+		if self.refs:
+			yield ("Refs", self.refs)
+		if self.commits:
+			yield ("Commits", self.commits)
+		if self.changes is not None:
+			for column, count in zip(CHANGE_COLUMNS, self.changes):
+				if count:
+					yield (column, count)
+
+	def to_dict(self):
+		return dict(self.columns())
@@ -0,0 +1,445 @@
+import asyncio, contextlib, functools, os, pathlib, subprocess, sys, time
+from . import storage
+from .tools import run_in_daemon_thread
+
+
+DEFAULT_JOBS = 32
+
+# Concurrent repositories per device when not configured explicitly.
+DEFAULT_DEVICE_JOBS_ROTATIONAL = 2
+DEFAULT_DEVICE_JOBS_SOLID_STATE = 16
+# Network and other virtual filesystems that have no block device to ask.
+DEFAULT_DEVICE_JOBS_UNKNOWN = 8
+
+# The niceness of `rgit --background`, the lowest CPU priority there is.
+BACKGROUND_NICENESS = 19
+
+
+def define_arguments(parser):
+	parser.add_argument(
+		"--jobs", "-j",
+		dest="jobs",
+		metavar="N",
+		type=int,
+		default=None,
+		help=f"maximum number of repositories to process at once (default {DEFAULT_JOBS})",
+	)
+	parser.add_argument(
+		"--device-jobs",
+		dest="device_jobs",
+		metavar="N",
+		type=int,
+		default=None,
+		help=(
+			"maximum number of repositories on the same device to process at once (default "
+			f"{DEFAULT_DEVICE_JOBS_ROTATIONAL} for rotational disks, {DEFAULT_DEVICE_JOBS_SOLID_STATE} "
+			f"for solid-state ones and {DEFAULT_DEVICE_JOBS_UNKNOWN} for everything else)"
+		),
+	)
+
+
+def is_rotational(device):
+	"""
+	Returns whether the block device with the `st_dev` number is a spinning disk, or `None` if it
+	can't be determined, e.g. for network filesystems or on platforms other than Linux.
+	"""
+	sysfs_device = pathlib.Path("/sys/dev/block") / f"{os.major(device)}:{os.minor(device)}"
+	# Partitions don't have a queue of their own, the whole disk they belong to does.
+	for queue in (sysfs_device / "queue", sysfs_device / ".." / "queue"):
+		try:
+			return (queue / "rotational").read_text(encoding="ascii").strip() == "1"
+		except OSError:
+			continue
+	return None
+
+
+def default_device_jobs(device):
+	rotational = is_rotational(device)
+	if rotational is None:
+		return DEFAULT_DEVICE_JOBS_UNKNOWN
+	return DEFAULT_DEVICE_JOBS_ROTATIONAL if rotational else DEFAULT_DEVICE_JOBS_SOLID_STATE
+
+
+def get_devices(repo):
+	"""
+	Returns the sorted tuple of `st_dev` numbers of the gitdir and the worktree of a repo.
+	"""
+	paths = [repo]
+	if repo.name == ".git":
+		paths.append(repo.parent)
+	devices = set()
+	for path in paths:
+		try:
+			devices.add(os.stat(path).st_dev)
+		except OSError:
+			pass
+	return tuple(sorted(devices))
+
+
+def get_boot_time():
+	"""
+	Returns the time the system booted as seconds since the epoch, or `None` if unknown.
+	"""
+	if not hasattr(time, "CLOCK_BOOTTIME"):
+		return None
+	return time.time() - time.clock_gettime(time.CLOCK_BOOTTIME)
+
+
+def enter_background():
+	"""
+	Lowers the CPU priority of this process to the lowest and, on Linux, its I/O priority to the idle
+	class, so that it only gets what other processes leave unused. Git processes and threads started
+	afterwards inherit both, threads already running keep theirs.
+	"""
+	if hasattr(os, "setpriority"):
+		os.setpriority(os.PRIO_PROCESS, 0, BACKGROUND_NICENESS)
+	if sys.platform.startswith("linux"):
+		# The ioprio_set system call has no wrapper in Python, and its number differs between
+		# architectures.
+		try:
+			subprocess.run(["ionice", "-c", "3", "-p", str(os.getpid())],
+				stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False,
+			)
+		except OSError:
+			pass
+
+
+def get_load():
+	"""
+	Returns the number of processes running or waiting to run, averaged over the last minute, or
+	`None` if it's unknown, e.g. on Windows.
+	"""
+	try:
+		return os.getloadavg()[0]
+	except (AttributeError, OSError):
+		return None
+
+
+class LoadThrottle(object):
+	"""
+	Limits the number of repositories processed at once to the number of CPUs the rest of the system
+	leaves idle, checking the load again as repositories finish and every few seconds while any are
+	waiting, and keeps the time spent with repositories held back in `throttled_seconds`.
+	"""
+
+	POLL_SECONDS = 2
+
+	def __init__(self, jobs, *, workers=1, cpus=None, get_load=get_load): # pylint: disable=redefined-outer-name
+		"""
+		Never lets more than `jobs` through. With `workers`, the idle CPUs are split evenly between
+		this many processes, each with a throttle of its own.
+		"""
+		self._jobs = jobs
+		self._workers = workers
+		self._cpus = cpus or os.cpu_count() or 1
+		self._get_load = get_load
+		self._running = 0
+		self._waiting = 0
+		self._waiting_since = None
+		self._changed = asyncio.Condition()
+		self.throttled_seconds = 0.0
+
+	def limit(self):
+		load = self._get_load()
+		if load is None:
+			return self._jobs
+		# The load average follows the load with a delay of about a minute, so the git processes of this
+		# run are not taken out of it, a run long enough to show up in it slows itself down as well.
+		idle = int(self._cpus - load)
+		return max(1, min(self._jobs, -(-idle // self._workers)))
+
+	@contextlib.asynccontextmanager
+	async def acquire(self):
+		if self._running >= self.limit():
+			self._waiting += 1
+			if self._waiting == 1:
+				self._waiting_since = time.monotonic()
+			try:
+				async with self._changed:
+					while self._running >= self.limit():
+						with contextlib.suppress(TimeoutError):
+							await asyncio.wait_for(self._changed.wait(), self.POLL_SECONDS)
+			finally:
+				self._waiting -= 1
+				if self._waiting == 0:
+					self.throttled_seconds += time.monotonic() - self._waiting_since
+		self._running += 1
+		try:
+			yield
+		finally:
+			self._running -= 1
+			async with self._changed:
+				self._changed.notify_all()
+
+
+class DeviceLimiter(object):
+	"""
+	Limits the number of repositories processed at once, both overall and per device, so that
+	repositories on a fast disk don't wait behind the ones piling up on a slow one.
+	"""
+
+	def __init__(self, *, jobs=None, device_jobs=None, configured_device_jobs=(), workers=1, background=False):
+		"""
+		With `workers`, the limits are split evenly between this many processes, each with a limiter
+		of its own. With `background`, repositories also wait for the system load to leave a CPU idle
+		(see `LoadThrottle`).
+		"""
+		self._workers = workers
+		self._semaphore = asyncio.Semaphore(self._share(jobs or DEFAULT_JOBS))
+		self.throttle = LoadThrottle(self._share(jobs or DEFAULT_JOBS), workers=workers) if background else None
+		self._device_jobs = device_jobs
+		self._configured_device_jobs = list(configured_device_jobs)
+		self._device_jobs_overrides = None
+		self._device_semaphores = {}
+		self._preparing = asyncio.Lock()
+		# Device lookups wait for a thread like the repos they are for would, and no more of them
+		# run at once than repos would.
+		self._lookups = asyncio.Semaphore(self._share(jobs or DEFAULT_JOBS))
+		# Repos to their place in the order set with `set_order()`, whether their devices were looked
+		# up, how many were up to the first not looked up yet, and the futures the repos after it wait
+		# for before getting in line for the semaphores.
+		self._ranks = {}
+		self._looked_up = []
+		self._frontier = 0
+		self._turns = {}
+
+	@classmethod
+	def from_opts(cls, opts, config):
+		return cls(
+			jobs=opts.jobs if opts.jobs is not None else config.jobs,
+			device_jobs=opts.device_jobs,
+			configured_device_jobs=config.device_jobs,
+			background=opts.background,
+		)
+
+	async def prepare(self):
+		"""
+		Finds the devices the configured limits are for, once. Awaited before the repos are looked up
+		with `get_devices()`, which does it otherwise.
+		"""
+		async with self._preparing:
+			if self._device_jobs_overrides is None:
+				self._device_jobs_overrides = await run_in_daemon_thread(self._resolve_configured_device_jobs)
+
+	def set_order(self, repos):
+		"""
+		Makes the repos get in line for their slots in this order, e.g. the slowest first, and not in
+		the order their devices are found in. A repo waits in `acquire()` until the devices of those
+		before it are found, or the lookups fail or time out. Other repos don't wait.
+		"""
+		self._ranks = {repo: i for i, repo in enumerate(repos)}
+		self._looked_up = [False] * len(self._ranks)
+		self._frontier = 0
+		self._turns = {}
+
+	async def get_devices(self, repo):
+		try:
+			if self._device_jobs_overrides is None:
+				await self.prepare()
+			async with self._lookups:
+				return await run_in_daemon_thread(get_devices, repo)
+		finally:
+			self._set_looked_up(repo)
+
+	def _set_looked_up(self, repo):
+		rank = self._ranks.get(repo)
+		if rank is None:
+			return
+		self._looked_up[rank] = True
+		while self._frontier < len(self._looked_up) and self._looked_up[self._frontier]:
+			# The repos resume in the order their turns come, and get in line in that order.
+			turn = self._turns.pop(self._frontier, None)
+			if turn is not None and not turn.done():
+				turn.set_result(None)
+			self._frontier += 1
+
+	async def _wait_for_turn(self, repo):
+		rank = self._ranks.get(repo)
+		if rank is None or rank < self._frontier:
+			return
+		turn = self._turns.get(rank)
+		if turn is None:
+			turn = self._turns[rank] = asyncio.get_running_loop().create_future()
+		await turn
+
+	def _resolve_configured_device_jobs(self):
+		result = {}
+		for path, jobs in self._configured_device_jobs:
+			try:
+				result[os.stat(path).st_dev] = jobs
+			except OSError:
+				pass
+		return result
+
+	def _get_device_semaphore(self, device):
+		semaphore = self._device_semaphores.get(device)
+		if semaphore is None:
+			jobs = self._device_jobs
+			if jobs is None:
+				jobs = self._device_jobs_overrides.get(device)
+			if jobs is None:
+				jobs = default_device_jobs(device)
+			semaphore = self._device_semaphores[device] = asyncio.Semaphore(self._share(jobs))
+		return semaphore
+
+	def _share(self, jobs):
+		return max(1, -(-jobs // self._workers))
+
+	@contextlib.asynccontextmanager
+	async def acquire(self, devices, repo=None):
+		"""
+		Waits for a slot on each of the devices (as returned by `get_devices()`) and an overall one,
+		after the repos before `repo` in the order set with `set_order()`.
+		"""
+		if repo is not None:
+			await self._wait_for_turn(repo)
+		async with contextlib.AsyncExitStack() as stack:
+			# Always acquired in the same order to avoid deadlocks between repos that span devices.
+			for device in devices:
+				await stack.enter_async_context(self._get_device_semaphore(device))
+			await stack.enter_async_context(self._semaphore)
+			if self.throttle is not None:
+				await stack.enter_async_context(self.throttle.acquire())
+			yield
+
+
+class TimingHistory(object):
+	"""
+	Durations of processing each repository in previous runs, stored in the cache directory. Used to
+	start the most expensive repositories first (longest processing time first scheduling), so a
+	single slow repository doesn't start last and alone set the duration of the whole run.
+	"""
+
+	# Weight of the latest duration in the moving average kept for every repository.
+	SMOOTHING = 0.5
+	# Estimate for repositories without history - a fixed cost of spawning a few git processes and
+	# the cost of `git status` that roughly grows with the number of entries in the index.
+	ESTIMATE_BASE_SECONDS = 0.05
+	ESTIMATE_SECONDS_PER_INDEX_BYTE = 5e-8
+	# The longest the run waits for the sizes of the indexes, repos whose index isn't found by then
+	# are estimated without it.
+	ESTIMATE_TIMEOUT_SECONDS = 1
+
+	def __init__(self, path=None):
+		self._path = path if path is not None else (storage.cache_dir() / "timings.json")
+		self._durations = {}
+		self._runs = {}
+		self._last_run = None
+		self._index_sizes = {}
+
+	def load(self):
+		content = storage.read_json(self._path, {})
+		if not isinstance(content, dict):
+			content = {}
+		self._durations = content.get("repositories", {})
+		self._runs = content.get("runs", {})
+		self._last_run = content.get("last_run")
+
+	def save(self, repos=None):
+		"""
+		Writes the history keeping only the passed repos, e.g. to forget the ones that are not in the
+		configuration anymore.
+		"""
+		durations = self._durations
+		if repos is not None:
+			keys = {os.fspath(r) for r in repos}
+			durations = {k: v for k, v in durations.items() if k in keys}
+		storage.write_json(self._path, {
+			"repositories": durations,
+			"runs": self._runs,
+			"last_run": self._last_run,
+		})
+
+	def get_run_kind(self):
+		"""
+		Returns "cold" for the first run since the system booted, when files git reads are unlikely
+		to be in the page cache, "warm" for subsequent runs, or `None` if the boot time is unknown.
+		"""
+		boot_time = get_boot_time()
+		if boot_time is None:
+			return None
+		return "cold" if self._last_run is None or self._last_run < boot_time else "warm"
+
+	def record_run(self, seconds, kind):
+		if kind is not None:
+			previous = self._runs.get(kind)
+			if previous is not None:
+				seconds = self.SMOOTHING * seconds + (1 - self.SMOOTHING) * previous
+			self._runs[kind] = seconds
+		self._last_run = time.time()
+
+	def get_run(self, kind):
+		return self._runs.get(kind)
+
+	def record(self, repo, seconds):
+		key = os.fspath(repo)
+		previous = self._durations.get(key)
+		if previous is not None:
+			seconds = self.SMOOTHING * seconds + (1 - self.SMOOTHING) * previous
+		self._durations[key] = seconds
+
+	def get(self, repo):
+		return self._durations.get(os.fspath(repo))
+
+	async def find_index_sizes(self, repos):
+		"""
+		Finds the sizes of the indexes of the repos without history, for `estimate()`, in parallel.
+		Waits at most `ESTIMATE_TIMEOUT_SECONDS`, lookups still running then, e.g. on a slow disk with
+		a cold cache, are left to finish in the background.
+		"""
+		def on_found(key, task):
+			if not task.cancelled():
+				self._index_sizes[key] = task.result()
+		tasks = []
+		for repo in repos:
+			key = os.fspath(repo)
+			if key in self._durations or key in self._index_sizes:
+				continue
+			task = asyncio.ensure_future(run_in_daemon_thread(_get_index_size, repo))
+			task.add_done_callback(functools.partial(on_found, key))
+			tasks.append(task)
+		if tasks:
+			await asyncio.wait(tasks, timeout=self.ESTIMATE_TIMEOUT_SECONDS)
+
+	def estimate(self, repo):
+		duration = self.get(repo)
+		if duration is not None:
+			return duration
+		index_size = self._index_sizes.get(os.fspath(repo), 0)
+		return self.ESTIMATE_BASE_SECONDS + index_size * self.ESTIMATE_SECONDS_PER_INDEX_BYTE
+
+	def order(self, repos):
+		"""
+		Returns the repos sorted by the expected duration, longest first.
+		"""
+		return sorted(repos, key=self.estimate, reverse=True)
+
+	def split(self, repos, count, group=None):
+		"""
+		Splits the repos into `count` lists with about the same total expected duration, keeping the
+		order of the repos within each. Repos with the same `group(repo)`, e.g. worktrees of one repo,
+		end up in the same list.
+		"""
+		groups = {}
+		for repo in repos:
+			groups.setdefault(group(repo) if group is not None else repo, []).append(repo)
+		estimates = {repo: self.estimate(repo) for repo in repos}
+		totals = [0.0] * count
+		assigned = {}
+		# Longest processing time first, each group to the list expected to be done the soonest.
+		for members in sorted(groups.values(), key=lambda g: sum(estimates[r] for r in g), reverse=True):
+			i = totals.index(min(totals))
+			totals[i] += sum(estimates[r] for r in members)
+			for repo in members:
+				assigned[repo] = i
+		shards = [[] for _ in range(count)]
+		for repo in repos:
+			shards[assigned[repo]].append(repo)
+		return shards
+
+
+def _get_index_size(repo):
+	try:
+		return os.stat(repo / "index").st_size
+	except OSError:
+		return 0
@@ -0,0 +1,68 @@
+import json, os, pathlib, stat, tempfile
+from . import constants
+
+
+def _get_umask():
+	# There is no way to read the umask without setting it, which is done once, before any threads
+	# creating files are started.
+	umask = os.umask(0o022)
+	os.umask(umask)
+	return umask
+
+
+_UMASK = _get_umask()
+
+
+def cache_dir():
+	"""
+	Returns the directory for data that can be regenerated at any time, like timing statistics and
+	results of previous runs.
+	"""
+	base = os.environ.get("XDG_CACHE_HOME")
+	base = pathlib.Path(base) if base else (pathlib.Path.home() / ".cache")
+	return base / constants.SELF_NAME
+
+
+def data_dir():
+	"""
+	Returns the directory for data that can't be regenerated, like the history of previous runs.
+	"""
+	base = os.environ.get("XDG_DATA_HOME")
+	base = pathlib.Path(base) if base else (pathlib.Path.home() / ".local" / "share")
+	return base / constants.SELF_NAME
+
+
+def read_json(path, default=None):
+	try:
+		with open(path, "r", encoding="UTF-8") as fo:
+			return json.load(fo)
+	except (FileNotFoundError, NotADirectoryError, ValueError):
+		return default
+
+
+def write_json(path, obj):
+	write_text(path, json.dumps(obj, separators=(",", ":")))
+
+
+def write_text(path, text):
+	"""
+	Replaces the file atomically, so concurrent readers never see it partially written. The file keeps
+	the mode of the one it replaces, or gets the one `open()` would give a new file, and not the
+	0600 of temporary files, e.g. for other users to read metrics written with `--metrics-out`.
+	"""
+	path = pathlib.Path(path)
+	path.parent.mkdir(parents=True, exist_ok=True)
+	try:
+		mode = stat.S_IMODE(os.stat(path).st_mode)
+	except OSError:
+		mode = 0o666 & ~_UMASK
+	fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+	try:
+		with os.fdopen(fd, "w", encoding="UTF-8") as fo:
+			if hasattr(os, "fchmod"):
+				os.fchmod(fo.fileno(), mode)
+			fo.write(text)
+		os.replace(tmp_path, path)
+	except BaseException:
+		os.unlink(tmp_path)
+		raise
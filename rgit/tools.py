@@ -1,4 +1,4 @@
-import sys, functools, os, pathlib, unicodedata, urllib.parse, re
+import sys, collections, functools, os, pathlib, unicodedata, urllib.parse, re, asyncio, threading
 
 
 # TODO Consider moving console output routines to a separate python package (can be named termtools).
@@ -211,7 +211,7 @@ class ProgressDisplay:
 			self._width = os.get_terminal_size(fo.fileno()).columns
 		except OSError:
 			self._width = None  # fall back to plain stream; see also: SIGWINCH
-		if self._width <= 0:
+		if self._width is not None and self._width <= 0:
 			self._width = None
 
 	def add(self, char):
@@ -288,34 +288,53 @@ def url_starts_with(url, prefix):
 	prefix_parts = urllib.parse.urlsplit(prefix)
 	assert len(url_parts) == 5, url_parts
 	assert len(prefix_parts) == 5, prefix_parts
+	return _url_parts_start_with(url_parts, None, prefix_parts, None)
+
+
+class UrlPrefixMatcher(object):
+	"""
+	Finds the first of the prefixes a URL starts with, as `url_starts_with()` tells it, with the
+	prefixes split once instead of for every URL.
+	"""
+
+	def __init__(self, prefixes):
+		self._prefixes = []
+		for prefix in prefixes:
+			prefix_parts = urllib.parse.urlsplit(prefix)
+			assert len(prefix_parts) == 5, prefix_parts
+			self._prefixes.append((prefix, prefix_parts, pathlib.PurePosixPath(prefix_parts.path)))
+
+	def __bool__(self):
+		return bool(self._prefixes)
+
+	def match(self, url):
+		if not self._prefixes:
+			return None
+		url_parts = urllib.parse.urlsplit(url)
+		assert len(url_parts) == 5, url_parts
+		url_path = pathlib.PurePosixPath(url_parts.path)
+		for prefix, prefix_parts, prefix_path in self._prefixes:
+			if _url_parts_start_with(url_parts, url_path, prefix_parts, prefix_path):
+				return prefix
+		return None
+
+
+def _url_parts_start_with(url_parts, url_path, prefix_parts, prefix_path):
+	"""
+	The paths are made from the parts if `None`.
+	"""
 	# If prefix has no scheme and no netloc, treat it as a path
 	if not prefix_parts.scheme and not prefix_parts.netloc:
 		if url_parts.scheme or url_parts.netloc:
 			# The prefix is a path but the url has a scheme or netloc, so it cannot match.
 			return False
-		url_path = pathlib.PurePosixPath(url_parts.path)
-		prefix_path = pathlib.PurePosixPath(prefix_parts.path)
-		if prefix_path.is_absolute() != url_path.is_absolute():
-			return False
-		prefix_path_parts = prefix_path.parts
-		url_path_parts = url_path.parts
-		if len(prefix_path_parts) > len(url_path_parts):
-			return False
-		return prefix_path_parts == url_path_parts[:len(prefix_path_parts)]
+		return _url_path_starts_with(url_parts, url_path, prefix_parts, prefix_path)
 	if prefix_parts.scheme != url_parts.scheme:
 		return False
 	if prefix_parts.netloc != url_parts.netloc:
 		return prefix_parts[1:] == ("", "", "", "")
 	if prefix_parts.path or url_parts.path:
-		url_path = pathlib.PurePosixPath(url_parts.path)
-		prefix_path = pathlib.PurePosixPath(prefix_parts.path)
-		if prefix_path.is_absolute() != url_path.is_absolute():
-			return False
-		prefix_path_parts = prefix_path.parts
-		url_path_parts = url_path.parts
-		if len(prefix_path_parts) > len(url_path_parts):
-			return False
-		if prefix_path_parts != url_path_parts[:len(prefix_path_parts)]:
+		if not _url_path_starts_with(url_parts, url_path, prefix_parts, prefix_path):
 			return False
 	if prefix_parts.query and prefix_parts.query != url_parts.query:
 		return False
@@ -324,6 +343,55 @@ def url_starts_with(url, prefix):
 	return True
 
 
+def _url_path_starts_with(url_parts, url_path, prefix_parts, prefix_path):
+	if url_path is None:
+		url_path = pathlib.PurePosixPath(url_parts.path)
+	if prefix_path is None:
+		prefix_path = pathlib.PurePosixPath(prefix_parts.path)
+	if prefix_path.is_absolute() != url_path.is_absolute():
+		return False
+	prefix_path_parts = prefix_path.parts
+	url_path_parts = url_path.parts
+	if len(prefix_path_parts) > len(url_path_parts):
+		return False
+	return prefix_path_parts == url_path_parts[:len(prefix_path_parts)]
+
+
+class PathTrie(object):
+	"""
+	A set of paths that finds the ones containing a path in the time it takes to walk its parts,
+	however many paths there are.
+	"""
+
+	def __init__(self, paths=()):
+		self._root = {}
+		for path in paths:
+			self.add(path)
+
+	def __bool__(self):
+		return bool(self._root)
+
+	def add(self, path):
+		node = self._root
+		for part in pathlib.PurePath(path).parts:
+			node = node.setdefault(part, {})
+		# Parts are strings, `None` marks the end of a path.
+		node.setdefault(None, path)
+
+	def find(self, path):
+		"""
+		Returns the shortest of the paths that is `path` or contains it, or `None`.
+		"""
+		node = self._root
+		for part in pathlib.PurePath(path).parts:
+			node = node.get(part)
+			if node is None:
+				return None
+			if None in node:
+				return node[None]
+		return None
+
+
 def gen_sort_index(values, sort_order):
 	values_len = len(values)
 	sort_first, sort_last = sort_order
@@ -340,6 +408,19 @@ def gen_sort_index(values, sort_order):
 	return sort_index
 
 
+def format_size(size):
+	"""
+	Formats a number of bytes like `du -h` does, e.g. "512B", "1.5K" or "30G".
+	"""
+	if size < 1024:
+		return f"{size}B"
+	for unit in "KMGTPE":
+		size /= 1024
+		if size < 1024 or unit == "E":
+			break
+	return f"{size:.1f}{unit}" if size < 10 else f"{size:.0f}{unit}"
+
+
 def strict_int(x):
 	assert re.match(r"^\d+$", x), repr(x)
 	return int(x)
@@ -354,3 +435,119 @@ def path_relative_to_or_unchanged(root_path, target_path):
 		return pathlib.Path(target_path).relative_to(root_path)
 	except ValueError:
 		return target_path
+
+
+# The most threads `run_in_daemon_thread()` runs calls in at once, not counting the ones abandoned.
+DAEMON_THREADS = 32
+
+
+async def run_in_daemon_thread(func, *args):
+	"""
+	Runs a blocking call in a pool of daemon threads. Unlike `asyncio.to_thread()`, a call stuck in
+	the kernel (e.g. a `stat` on a stale NFS mount) can be abandoned by cancelling the awaiting task
+	without keeping the interpreter from exiting, and the thread stuck with it is replaced.
+	"""
+	loop = asyncio.get_running_loop()
+	call = _DaemonThreadCall(func, args, loop, loop.create_future())
+	_daemon_thread_pool.submit(call)
+	try:
+		return await call.future
+	except asyncio.CancelledError:
+		_daemon_thread_pool.abandon(call)
+		raise
+
+
+class _DaemonThreadCall(object):
+	def __init__(self, func, args, loop, future):
+		self.func = func
+		self.args = args
+		self.loop = loop
+		self.future = future
+		# Changed under the lock of the pool.
+		self.started = False
+		self.finished = False
+		self.abandoned = False
+
+	def run(self):
+		result, exception = None, None
+		try:
+			result = self.func(*self.args)
+		except BaseException as e: # pylint: disable=broad-except
+			exception = e
+		try:
+			self.loop.call_soon_threadsafe(self._resolve, result, exception)
+		except RuntimeError:
+			# The loop is closed, nobody is waiting for the result anymore.
+			pass
+
+	def _resolve(self, result, exception):
+		if self.future.done():
+			return
+		if exception is not None:
+			self.future.set_exception(exception)
+		else:
+			self.future.set_result(result)
+
+
+class _DaemonThreadPool(object):
+	"""
+	Threads started as calls are queued and none is idle, up to `max_threads`, that run the calls
+	in the order they were queued. A thread whose call is abandoned stops counting towards the limit
+	and exits once the call returns, if it ever does.
+	"""
+
+	def __init__(self, max_threads):
+		self._max_threads = max_threads
+		self._lock = threading.Lock()
+		self._ready = threading.Condition(self._lock)
+		self._calls = collections.deque()
+		self._threads = 0
+		self._idle = 0
+
+	@property
+	def threads(self):
+		return self._threads
+
+	def submit(self, call):
+		with self._lock:
+			self._calls.append(call)
+			if self._idle > len(self._calls) - 1:
+				self._ready.notify()
+			else:
+				self._start_thread()
+
+	def abandon(self, call):
+		with self._lock:
+			if call.abandoned or call.finished:
+				return
+			call.abandoned = True
+			if call.started:
+				self._threads -= 1
+				if self._calls and self._idle < len(self._calls):
+					self._start_thread()
+
+	def _start_thread(self):
+		if self._threads < self._max_threads:
+			self._threads += 1
+			threading.Thread(target=self._worker, daemon=True).start()
+
+	def _worker(self):
+		while True:
+			with self._lock:
+				while not self._calls:
+					self._idle += 1
+					self._ready.wait()
+					self._idle -= 1
+				call = self._calls.popleft()
+				if call.abandoned:
+					continue
+				call.started = True
+			call.run()
+			with self._lock:
+				call.finished = True
+				if call.abandoned:
+					# Replaced when the call was abandoned.
+					return
+
+
+_daemon_thread_pool = _DaemonThreadPool(DAEMON_THREADS)
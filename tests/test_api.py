@@ -0,0 +1,73 @@
+import asyncio, json, os, pathlib, subprocess, tempfile, unittest, unittest.mock, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.api, rgit.prompt # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestApi(unittest.TestCase):
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(self._tmp.cleanup)
+		self.tmp = pathlib.Path(os.path.realpath(self._tmp.name))
+		patcher = unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": os.fspath(self.tmp / "cache")})
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.gitdirs = []
+		for name in ("clean", "dirty"):
+			worktree = self.tmp / name
+			subprocess.run(["git", "init", "-q", os.fspath(worktree)], check=True)
+			self.gitdirs.append(worktree / ".git")
+		(self.tmp / "dirty" / "file").write_text("")
+		self.config_path = self.tmp / "config.json"
+		self.config_path.write_text(json.dumps({
+			"repositories": [os.fspath(g) for g in self.gitdirs],
+			"destination.folders": [os.fspath(self.tmp)],
+		}))
+
+	def test_iter_status(self):
+		async def run():
+			config = await rgit.api.load_config(self.config_path)
+			return {s.path: s.to_dict() async for s in rgit.api.iter_status(config=config)}
+		self.assertEqual(asyncio.run(run()), {
+			self.gitdirs[0]: {},
+			self.gitdirs[1]: {"??": 1},
+		})
+
+	def test_session(self):
+		async def run():
+			session = rgit.api.Session(await rgit.api.load_config(self.config_path), jobs=1)
+			first = [s.path async for s in session.iter_status([self.gitdirs[1]])]
+			statuses = session.iter_status()
+			second = await anext(statuses)
+			await statuses.aclose()
+			return first, second
+		first, second = asyncio.run(run())
+		self.assertEqual(first, [self.gitdirs[1]])
+		self.assertIn(second.path, self.gitdirs)
+
+	def test_prompt_entries(self):
+		async def run(**kwargs):
+			session = rgit.api.Session(await rgit.api.load_config(self.config_path), **kwargs)
+			return [s async for s in session.iter_status()]
+		asyncio.run(run())
+		self.assertIsNone(rgit.prompt.read_entry(os.fspath(self.gitdirs[0])))
+		asyncio.run(run(write_prompt_entries=True))
+		for gitdir in self.gitdirs:
+			self.assertEqual(rgit.prompt.read_entry(os.fspath(gitdir))[0], os.fspath(gitdir))
+
+	def test_commit_walks_forgotten(self):
+		async def run():
+			session = rgit.api.Session(await rgit.api.load_config(self.config_path))
+			walks = session._status._commit_walks # pylint: disable=protected-access
+			with unittest.mock.patch.object(walks, "clear", wraps=walks.clear) as clear:
+				first = session.iter_status()
+				await anext(first)
+				# Still shared with the first iteration.
+				async for _ in session.iter_status():
+					pass
+				calls = clear.call_count
+				await first.aclose()
+				return calls, clear.call_count
+		self.assertEqual(asyncio.run(run()), (0, 1))
@@ -0,0 +1,130 @@
+import asyncio, os, pathlib, subprocess, tempfile, unittest, unittest.mock, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit._gitcli, rgit.catfile, rgit.git # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestCatFilePool(unittest.TestCase):
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(self._tmp.cleanup)
+		self.gitdirs = []
+		self.commits = []
+		for name in ("a", "b"):
+			worktree = pathlib.Path(self._tmp.name) / name
+			subprocess.run(["git", "init", "-q", os.fspath(worktree)], check=True)
+			subprocess.run(
+				["git", "-C", os.fspath(worktree), "-c", "user.name=T", "-c", "user.email=t@example.com",
+				"commit", "-q", "--allow-empty", "-m", f"First line of {name}\nsecond line\n\nbody"],
+				check=True,
+			)
+			self.gitdirs.append(worktree / ".git")
+			self.commits.append(subprocess.run(
+				["git", "-C", os.fspath(worktree), "rev-parse", "HEAD"], check=True, capture_output=True, text=True,
+			).stdout.strip())
+
+	def test_get_objects(self):
+		async def run():
+			pool = rgit.catfile.CatFilePool()
+			try:
+				return (
+					await pool.get_objects(self.gitdirs[0], [self.commits[0], "0" * 40, "HEAD"]),
+					await pool.get_objects(self.gitdirs[0], [self.commits[0]], contents=False),
+				)
+			finally:
+				await pool.close()
+		(commit, missing, head), (checked,) = asyncio.run(run())
+		self.assertEqual((commit.oid, commit.type, commit.size), (self.commits[0], "commit", len(commit.data)))
+		self.assertEqual(rgit.git.commit_subject(commit.data), "First line of a second line")
+		self.assertIsNone(missing)
+		self.assertEqual(head, commit)
+		self.assertEqual(checked, (self.commits[0], "commit", commit.size, None))
+
+	def test_one_process_per_repo(self):
+		async def run():
+			pool = rgit.catfile.CatFilePool()
+			try:
+				started = rgit._gitcli.processes_started
+				results = await asyncio.gather(*(
+					pool.get_objects(self.gitdirs[i % 2], [self.commits[i % 2]]) for i in range(20)
+				))
+				return results, rgit._gitcli.processes_started - started
+			finally:
+				await pool.close()
+		results, started = asyncio.run(run())
+		self.assertEqual([r[0].oid for r in results], [self.commits[i % 2] for i in range(20)])
+		self.assertEqual(started, 2)
+
+	def test_max_processes(self):
+		async def run():
+			pool = rgit.catfile.CatFilePool(max_processes=1)
+			try:
+				results = await asyncio.gather(*(
+					pool.get_objects(self.gitdirs[i % 2], [self.commits[i % 2]]) for i in range(6)
+				))
+				return results, len(pool._processes) # pylint: disable=protected-access
+			finally:
+				await pool.close()
+		results, running = asyncio.run(run())
+		self.assertEqual([r[0].oid for r in results], [self.commits[i % 2] for i in range(6)])
+		self.assertEqual(running, 1)
+
+	def test_idle_timeout(self):
+		async def run():
+			pool = rgit.catfile.CatFilePool(idle_timeout=0.05)
+			try:
+				await pool.get_objects(self.gitdirs[0], [self.commits[0]])
+				running = len(pool._processes) # pylint: disable=protected-access
+				await asyncio.sleep(0.3)
+				return running, len(pool._processes) # pylint: disable=protected-access
+			finally:
+				await pool.close()
+		self.assertEqual(asyncio.run(run()), (1, 0))
+
+
+class _FakeProcess(object):
+	def __init__(self):
+		self.stdin = unittest.mock.Mock()
+		self.stdin.drain = unittest.mock.AsyncMock()
+		self.stdout = asyncio.StreamReader()
+
+
+class TestUnexpectedOutput(unittest.TestCase):
+	def start(self):
+		p = _FakeProcess()
+		process = rgit.catfile._CatFile(("gitdir", "--batch-check"), p, 5, lambda _: None) # pylint: disable=protected-access
+		return p, process
+
+	def test_answer_for_another_object(self):
+		async def run():
+			p, process = self.start()
+			request = asyncio.ensure_future(process.request(["a" * 40, "b" * 40]))
+			await asyncio.sleep(0)
+			p.stdout.feed_data(f"{'b' * 40} commit 10\n{'a' * 40} commit 10\n".encode())
+			with self.assertRaisesRegex(rgit.catfile.UnexpectedOutputError, "answered another request"):
+				await request
+			self.assertTrue(process.failed)
+			await process._reader # pylint: disable=protected-access
+		asyncio.run(run())
+
+	def test_missing_object_answered(self):
+		async def run():
+			p, process = self.start()
+			request = asyncio.ensure_future(process.request(["HEAD", "HEAD:some file"]))
+			await asyncio.sleep(0)
+			p.stdout.feed_data(f"{'a' * 40} commit 10\nHEAD:some file missing\n".encode())
+			return await request
+		head, missing = asyncio.run(run())
+		self.assertEqual(head, ("a" * 40, "commit", 10, None))
+		self.assertIsNone(missing)
+
+	def test_output_with_no_request(self):
+		async def run():
+			p, process = self.start()
+			p.stdout.feed_data(f"{'a' * 40} commit 10\n".encode())
+			# Only a reader that failed on it, and not with an IndexError, lets this finish.
+			await process._reader # pylint: disable=protected-access
+			self.assertTrue(process.failed)
+		asyncio.run(run())
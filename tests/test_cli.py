@@ -0,0 +1,26 @@
+import subprocess, unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.cli # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestCli(unittest.TestCase):
+	def test_parse_args(self):
+		_, opts = rgit.cli._parse_args(["--launcher", "spawn", "status", "--json", "--jobs", "3"]) # pylint: disable=protected-access
+		self.assertEqual((opts.command, opts.launcher, opts.output_json, opts.jobs), ("status", "spawn", True, 3))
+		_, opts = rgit.cli._parse_args(["history", "trend", "--every", "week"]) # pylint: disable=protected-access
+		self.assertEqual((opts.command, opts.query, opts.interval), ("history", "trend", "week"))
+
+	def test_startup_imports(self):
+		# Only the modules of the selected command are imported, and the version is not looked up.
+		result = subprocess.run([sys.executable, "-c", "\n".join([
+			"import sys, rgit.cli",
+			"rgit.cli._parse_args(['prompt'])",
+			"print(' '.join(sorted(sys.modules)))",
+		])], cwd=get_toplevel(), check=True, capture_output=True, text=True)
+		modules = set(result.stdout.split())
+		self.assertIn("rgit.cli.prompt", modules)
+		for module in ("pygit2", "yaml", "sqlite3", "importlib.metadata", "rgit.git", "rgit.cli.status", "rgit.cli.version"):
+			self.assertNotIn(module, modules)
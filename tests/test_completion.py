@@ -0,0 +1,70 @@
+import argparse, os, subprocess, tempfile, unittest, unittest.mock, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.cli, rgit.cli.registry, rgit.completion # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestCompletion(unittest.TestCase):
+	index = {
+		"command": ["history", "ignored", "status"],
+		"repository": ["/home/u/src/a/.git", "/home/u/src/b/.git", "/home/u/mirrors/c.git"],
+		"folder": ["/home/u/src", "/home/u/work"],
+		"group": ["build", "ide"],
+	}
+
+	def complete(self, *words, cwd="/home/u"):
+		with unittest.mock.patch.dict(os.environ, {"HOME": "/home/u"}):
+			return rgit.completion.complete(list(words), self.index, cwd=cwd)
+
+	def test_commands(self):
+		self.assertEqual(self.complete(""), ["history", "ignored", "status"])
+		self.assertEqual(self.complete("--config-path", "x", "st"), ["status"])
+
+	def test_folders(self):
+		self.assertEqual(self.complete("status", "/home/u/"), ["/home/u/mirrors/", "/home/u/src/", "/home/u/work"])
+		self.assertEqual(self.complete("status", "--json", "~/src/"), ["~/src/a", "~/src/b"])
+		self.assertEqual(self.complete("ignored", "s"), ["src/"])
+		self.assertEqual(self.complete("status", "a", cwd="/home/u/src"), ["a"])
+		self.assertEqual(self.complete("status", "--jobs", ""), [])
+
+	def test_groups_and_history(self):
+		self.assertEqual(self.complete("ignored", "--group", "I"), ["ide"])
+		self.assertEqual(self.complete("history", "--json", "r"), ["repo"])
+		self.assertEqual(self.complete("history", "repo", "--limit", "3", "/home/u/m"), ["/home/u/mirrors/"])
+
+	def test_update_index(self):
+		with tempfile.TemporaryDirectory() as tmp, unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": tmp}):
+			rgit.completion.update_index(command=["status"], group=["b", "a"])
+			rgit.completion.update_index(group=["c"])
+			index = rgit.completion.read_index()
+		self.assertEqual(index, {"command": ["status"], "repository": [], "folder": [], "group": ["c"]})
+
+	def test_options_with_values(self):
+		for name, expected in [*rgit.completion.OPTIONS_WITH_VALUES.items(), (None, rgit.completion.GLOBAL_OPTIONS_WITH_VALUES)]:
+			if name is None:
+				parser, _ = rgit.cli._parse_args([]) # pylint: disable=protected-access
+			else:
+				parser = argparse.ArgumentParser()
+				rgit.cli.registry.get_command_handler(name).define_arguments(parser)
+			actions = [parser._actions] # pylint: disable=protected-access
+			options = set()
+			while actions:
+				for action in actions.pop():
+					if isinstance(action, argparse._SubParsersAction): # pylint: disable=protected-access
+						actions.extend(p._actions for p in action.choices.values()) # pylint: disable=protected-access
+					elif action.option_strings and action.nargs != 0 and not isinstance(action, rgit.cli._VersionAction): # pylint: disable=protected-access
+						options.update(action.option_strings)
+			with self.subTest(command=name):
+				self.assertEqual(options, set(expected))
+
+	def test_startup_imports(self):
+		result = subprocess.run([sys.executable, "-c", "\n".join([
+			"import sys, rgit.__main__",
+			"rgit.__main__._smain(['complete', '--', 'st'])",
+			"print(' '.join(sorted(sys.modules)))",
+		])], cwd=get_toplevel(), check=True, capture_output=True, text=True)
+		modules = set(result.stdout.split())
+		for module in ("argparse", "asyncio", "json", "pathlib", "pygit2", "yaml", "rgit.cli", "rgit.storage"):
+			self.assertNotIn(module, modules)
@@ -1,4 +1,4 @@
-import asyncio, json, pathlib, tempfile, unittest, sys
+import asyncio, io, json, pathlib, tempfile, unittest, unittest.mock, sys
 from . import get_toplevel
 
 
@@ -21,3 +21,52 @@ class TestConfiguration(unittest.TestCase):
 			f.flush()
 			config = asyncio.run(rgit.configuration.load(config_file_path=pathlib.Path(f.name)))
 		self.assertEqual(list(config.repositories), [pathlib.Path.home() / "foo/bar"])
+
+	def load(self, content):
+		with tempfile.TemporaryDirectory() as tmp:
+			path = pathlib.Path(tmp) / "config.json"
+			path.write_text(json.dumps(content))
+			return asyncio.run(rgit.configuration.load(config_file_path=path))
+
+	def test_validation(self):
+		for content in (
+			[],
+			{"repositories": "foo"},
+			{"repositories": ["foo", 1]},
+			{"jobs": 0},
+			{"jobs": True},
+			{"jobs.devices": {"foo": "2"}},
+		):
+			with self.subTest(content=content), self.assertRaises(ValueError):
+				self.load(content)
+		config = self.load({"jobs": 4, "jobs.devices": {"mnt/disk": 2}})
+		self.assertEqual(config.jobs, 4)
+		self.assertEqual(config.device_jobs, ((pathlib.Path.home() / "mnt/disk", 2),))
+
+	def test_unknown_options(self):
+		with unittest.mock.patch("sys.stderr", new_callable=io.StringIO) as stderr:
+			config = self.load({"$comment": "x", "repository": ["foo"], "repositories": ["bar"]})
+		self.assertEqual(config.repositories, (pathlib.Path.home() / "bar",))
+		self.assertIn("'$comment'", stderr.getvalue())
+		self.assertIn("'repository'", stderr.getvalue())
+
+	def test_matching(self):
+		home = pathlib.Path.home()
+		config = self.load({
+			"destination.remotes": ["https://github.com/me/", "git@github.com:me/"],
+			"destination.remotes.ignore": ["https://github.com/", "mirrors"],
+			"destination.folders": ["src/mine", "src/mine/deeper", "/opt/mine"],
+			"destination.folders.ignore": ["src/vendor"],
+		})
+		self.assertEqual(config.matching_destination_remote("https://github.com/me/x.git"), "https://github.com/me/")
+		self.assertEqual(config.matching_destination_remote("git@github.com:me/x.git"), "git@github.com:me/")
+		self.assertIsNone(config.matching_destination_remote("https://github.com/other/x.git"))
+		self.assertEqual(config.matching_destination_remote_ignore("https://github.com/other/x.git"), "https://github.com/")
+		self.assertEqual(config.matching_destination_remote_ignore(str(home / "mirrors/x.git")), str(home / "mirrors"))
+		self.assertIsNone(config.matching_destination_remote_ignore("/elsewhere/mirrors/x.git"))
+		self.assertEqual(config.matching_destination_folder(home / "src/mine/deeper/x/.git"), home / "src/mine")
+		self.assertEqual(config.matching_destination_folder(pathlib.Path("/opt/mine")), pathlib.Path("/opt/mine"))
+		self.assertIsNone(config.matching_destination_folder(home / "src/mine2/.git"))
+		self.assertIsNone(config.matching_destination_folder(home / "src"))
+		self.assertEqual(config.matching_destination_folder_ignore(home / "src/vendor/x/.git"), home / "src/vendor")
+		self.assertIsNone(config.matching_destination_folder_ignore(home / "src/mine/.git"))
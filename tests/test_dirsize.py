@@ -0,0 +1,48 @@
+import json, os, pathlib, subprocess, tempfile, unittest, unittest.mock, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.dirsize # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestDirectorySizes(unittest.TestCase):
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(self._tmp.cleanup)
+		self.root = pathlib.Path(self._tmp.name)
+		(self.root / "data" / "a" / "b").mkdir(parents=True)
+		(self.root / "data" / "one").write_bytes(b"x" * 100)
+		(self.root / "data" / "a" / "two").write_bytes(b"x" * 20)
+		(self.root / "data" / "a" / "b" / "three").write_bytes(b"x" * 3)
+		(self.root / "data" / "link").symlink_to(self.root / "data" / "one")
+		(self.root / "file").write_bytes(b"x" * 1000)
+		subprocess.run(["git", "init", "-q", os.fspath(self.root / "data" / "nested")], check=True)
+		(self.root / "data" / "nested" / "ignored").write_bytes(b"x" * 10000)
+		self.cache = self.root / "dirsizes.json"
+
+	def measure(self):
+		sizes = rgit.dirsize.DirectorySizes(self.cache, threads=2)
+		sizes.load()
+		result = sizes.measure([self.root / "file", self.root / "data", self.root / "missing"])
+		sizes.save()
+		return result
+
+	def test_measure(self):
+		link_size = os.lstat(self.root / "data" / "link").st_size
+		self.assertEqual(self.measure(), 1000 + 100 + 20 + 3 + link_size)
+
+	def test_unchanged_directories_are_not_read_again(self):
+		with unittest.mock.patch.object(rgit.dirsize, "RACY_NANOSECONDS", 0):
+			expected = self.measure()
+			with unittest.mock.patch.object(rgit.dirsize, "scan_directory", wraps=rgit.dirsize.scan_directory) as scan:
+				self.assertEqual(self.measure(), expected)
+				self.assertEqual(scan.call_count, 0)
+				(self.root / "data" / "a" / "four").write_bytes(b"x" * 4000)
+				os.utime(self.root / "data" / "a", ns=(0, 0))
+				self.assertEqual(self.measure(), expected + 4000)
+				self.assertEqual([c.args[0] for c in scan.call_args_list], [os.fspath(self.root / "data" / "a")])
+
+	def test_racy_directories_are_not_cached(self):
+		self.measure()
+		self.assertEqual(json.loads(self.cache.read_text()), {})
@@ -0,0 +1,16 @@
+import unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.git # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestGit(unittest.TestCase):
+	def test_unquote_path(self):
+		self.assertEqual(rgit.git.unquote_path("plain name"), "plain name")
+		self.assertEqual(rgit.git.unquote_path('"\\303\\274 \\"x\\"\\t\\\\"'), 'ü "x"\t\\')
+
+	def test_commit_subject(self):
+		data = b"tree 0\nauthor a\n\n\nFirst\n  second \n\nbody\n"
+		self.assertEqual(rgit.git.commit_subject(data), "First second")
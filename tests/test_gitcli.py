@@ -1,9 +1,9 @@
-import asyncio, subprocess, unittest, sys
+import asyncio, contextlib, json, os, subprocess, tempfile, time, unittest, unittest.mock, sys
 from . import get_toplevel
 
 
 sys.path.insert(0, get_toplevel())
-import rgit._gitcli # pylint: disable=wrong-import-position,wrong-import-order
+import rgit._gitcli, rgit.catfile # pylint: disable=wrong-import-position,wrong-import-order
 
 
 class TestRunSync(unittest.TestCase):
@@ -44,6 +44,190 @@ class TestRunAsync(unittest.TestCase):
 		self.assertIsInstance(result, str)
 
 
+class TestStreamAsync(unittest.TestCase):
+	def collect(self, *args, **kwargs):
+		async def run():
+			return [r async for r in rgit._gitcli.stream_async(*args, **kwargs)]
+		return asyncio.run(run())
+
+	def test_records(self):
+		self.assertEqual(self.collect("printf", "a\\nbb\\n\\nccc"), [b"a", b"bb", b"", b"ccc"])
+		self.assertEqual(self.collect("printf", "a\\0b\\0", delimiter=b"\0"), [b"a", b"b"])
+
+	def test_records_across_chunks(self):
+		with unittest.mock.patch.object(rgit._gitcli, "STREAM_CHUNK_SIZE", 3):
+			self.assertEqual(self.collect("printf", "abcdefg\\nh\\nijklm"), [b"abcdefg", b"h", b"ijklm"])
+
+	def test_stdin(self):
+		async def lines():
+			for i in range(3):
+				yield f"{i}\n"
+		self.assertEqual(self.collect("cat", stdin=lines()), [b"0", b"1", b"2"])
+		self.assertEqual(self.collect("cat", stdin=[b"a\n", "b\n"]), [b"a", b"b"])
+
+	def test_early_termination_kills_process(self):
+		async def run():
+			# Never exits on its own, and would fill the memory if its output wasn't read as needed.
+			records = rgit._gitcli.stream_async("yes")
+			async with contextlib.aclosing(records):
+				result = [await anext(records) for _ in range(3)]
+			return result
+		started = time.monotonic()
+		self.assertEqual(asyncio.run(run()), [b"y", b"y", b"y"])
+		self.assertLess(time.monotonic() - started, 1)
+
+	def test_returncode_checked_at_the_end(self):
+		with self.assertRaises(AssertionError):
+			self.collect("sh", "-c", "echo a; exit 3")
+		self.assertEqual(self.collect("sh", "-c", "echo a; exit 3", returncode_ok=3), [b"a"])
+
+
+class TestLaunchers(unittest.TestCase):
+	def setUp(self):
+		self.addCleanup(rgit._gitcli.set_launcher, None)
+		tmp = self.enterContext(tempfile.TemporaryDirectory())
+		self.enterContext(unittest.mock.patch.dict(os.environ, {"RGIT_FIXTURE": os.path.join(tmp, "fixture.jsonl")}))
+
+	def run_with_launchers(self, coro_factory):
+		results = {}
+		# The replay launcher doesn't start processes, it's tested with what is recorded in TestRecordReplay.
+		for launcher in (l for l in rgit._gitcli.LAUNCHERS if l != "replay"):
+			async def run():
+				rgit._gitcli.set_launcher(launcher) # pylint: disable=cell-var-from-loop
+				try:
+					return await coro_factory()
+				finally:
+					await rgit._gitcli.close_launcher()
+			with self.subTest(launcher=launcher):
+				results[launcher] = asyncio.run(run())
+		return results
+
+	def test_same_output(self):
+		results = self.run_with_launchers(lambda: rgit._gitcli.run_async("git", "hash-object", "--stdin", stdin="text\n"))
+		self.assertEqual(set(results.values()), {"8e27be7d6154a1f68ea9160ef0e18691d20560dc\n"})
+
+	def test_returncode_and_stderr(self):
+		async def run():
+			with self.assertRaises(AssertionError):
+				await rgit._gitcli.run_async("git", "no-such-command")
+			return await rgit._gitcli.run_async("git", "no-such-command", returncode_ok=1, stderr_ok=True)
+		self.assertEqual(set(self.run_with_launchers(run).values()), {""})
+
+	def test_missing_executable(self):
+		async def run():
+			with self.assertRaises(FileNotFoundError):
+				await rgit._gitcli.run_async("rgit-no-such-executable")
+		self.run_with_launchers(run)
+
+	def test_cancel_kills_child(self):
+		async def run():
+			task = asyncio.ensure_future(rgit._gitcli.run_async("sleep", "60"))
+			await asyncio.sleep(0.2)
+			started = time.monotonic()
+			task.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+			return time.monotonic() - started
+		for duration in self.run_with_launchers(run).values():
+			self.assertLess(duration, 1)
+
+
+class TestRecordReplay(unittest.TestCase):
+	def setUp(self):
+		self.addCleanup(rgit._gitcli.set_launcher, None)
+		tmp = self.enterContext(tempfile.TemporaryDirectory())
+		self.fixture = os.path.join(tmp, "fixture.jsonl")
+		self.enterContext(unittest.mock.patch.dict(os.environ, {"RGIT_FIXTURE": self.fixture}))
+
+	def run_commands(self, launcher):
+		async def run():
+			rgit._gitcli.set_launcher(launcher)
+			try:
+				return [
+					await rgit._gitcli.run_async("git", "hash-object", "--stdin", stdin="text\n"),
+					await rgit._gitcli.run_async("sh", "-c", "echo out; echo err >&2; exit 3", returncode_ok=3, stderr_ok=True),
+					[r async for r in rgit._gitcli.stream_async("printf", "a\\0b\\0", delimiter=b"\0")],
+					rgit._gitcli.run_sync("printf", "\\377 x \\n", encoding="latin_1", rstrip=False),
+				]
+			finally:
+				await rgit._gitcli.close_launcher()
+		return asyncio.run(run())
+
+	def test_replay_recorded(self):
+		recorded = self.run_commands("record")
+		self.assertEqual(recorded[0], "8e27be7d6154a1f68ea9160ef0e18691d20560dc\n")
+		with open(self.fixture, "r", encoding="utf_8") as fo:
+			records = [json.loads(line) for line in fo]
+		self.assertEqual([r["returncode"] for r in records], [0, 3, 0, 0])
+		self.assertEqual(records[0]["stdin"], "text\n")
+		self.assertEqual(records[1]["stderr"], "err\n")
+		with unittest.mock.patch.object(subprocess, "run", side_effect=AssertionError), \
+				unittest.mock.patch("asyncio.create_subprocess_exec", side_effect=AssertionError):
+			self.assertEqual(self.run_commands("replay"), recorded)
+
+	def test_missing_record(self):
+		self.run_commands("record")
+		rgit._gitcli.set_launcher("replay")
+		with self.assertRaises(LookupError):
+			rgit._gitcli.run_sync("git", "status")
+
+	def write_fixture(self, *records):
+		with open(self.fixture, "w", encoding="utf_8") as fo:
+			for record in records:
+				fo.write(json.dumps({"cwd": None, "stdin": "", "stderr": "", "returncode": 0, "duration": 0.3, **record}) + "\n")
+
+	def test_latency(self):
+		self.write_fixture(
+			{"args": ["git", "a"], "stdout": "1"},
+			{"args": ["git", "a"], "stdout": "2"},
+			{"args": ["git", "b"], "stdout": "", "latency": 60},
+		)
+		async def run():
+			rgit._gitcli.set_launcher("replay")
+			try:
+				started = time.monotonic()
+				results = [await rgit._gitcli.run_async("git", "a") for _ in range(3)]
+				duration = time.monotonic() - started
+				with self.assertRaises(asyncio.TimeoutError):
+					await asyncio.wait_for(rgit._gitcli.run_async("git", "b"), 0.1)
+				return results, duration
+			finally:
+				await rgit._gitcli.close_launcher()
+		with unittest.mock.patch.dict(os.environ, {"RGIT_REPLAY_LATENCY": "0.1"}):
+			results, duration = asyncio.run(run())
+		self.assertEqual(results, ["1", "2", "2"])
+		self.assertGreaterEqual(duration, 0.3)
+		with unittest.mock.patch.dict(os.environ, {"RGIT_REPLAY_LATENCY": "recorded"}):
+			results, duration = asyncio.run(run())
+		self.assertGreaterEqual(duration, 0.9)
+
+
+	def test_cat_file_answers(self):
+		gitdir = os.path.join(os.path.dirname(self.fixture), "repo.git")
+		subprocess.run(["git", "init", "-q", "--bare", gitdir], check=True)
+		oids = [
+			subprocess.run(["git", "--git-dir", gitdir, "hash-object", "-w", "--stdin"],
+				input=text, capture_output=True, text=True, check=True,
+			).stdout.strip()
+			for text in ("first\n", "second\n")
+		]
+		async def get_objects(launcher, *batches):
+			rgit._gitcli.set_launcher(launcher)
+			try:
+				pool = rgit.catfile.get_pool()
+				return [[o and o.data for o in await pool.get_objects(gitdir, batch)] for batch in batches]
+			finally:
+				await rgit.catfile.close_pool()
+				await rgit._gitcli.close_launcher()
+		recorded = asyncio.run(get_objects("record", [oids[0], "0" * 40], [oids[1]]))
+		self.assertEqual(recorded, [[b"first\n", None], [b"second\n"]])
+		# Asked in another order, each request gets its own answer.
+		replayed = asyncio.run(get_objects("replay", [oids[1]], [oids[0], oids[1], "0" * 40]))
+		self.assertEqual(replayed, [[b"second\n"], [b"first\n", b"second\n", None]])
+		with self.assertRaises(LookupError):
+			asyncio.run(get_objects("replay", ["HEAD"]))
+
+
 class TestGitDescribe(unittest.TestCase):
 	def test_returns_string_in_repo(self):
 		result = rgit._gitcli.git_describe(cwd=str(get_toplevel()))
@@ -0,0 +1,62 @@
+import os, pathlib, subprocess, tempfile, unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.gitdir # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestProbeState(unittest.TestCase):
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(self._tmp.cleanup)
+		self.worktree = pathlib.Path(os.path.realpath(self._tmp.name)) / "repo"
+		self.git("init", "-q", "-b", "main", os.fspath(self.worktree), cwd=None)
+		self.commit("f", "base\n")
+		self.git("branch", "other")
+		self.commit("f", "main\n")
+		self.git("checkout", "-q", "other")
+		self.commit("f", "other\n")
+		self.git("checkout", "-q", "main")
+
+	def git(self, *args, cwd=True, check=True):
+		return subprocess.run(
+			["git", "-c", "user.name=rgit", "-c", "user.email=rgit@localhost", *args],
+			cwd=self.worktree if cwd else None,
+			check=check, capture_output=True, encoding="UTF-8",
+		)
+
+	def commit(self, path, text):
+		(self.worktree / path).write_text(text)
+		self.git("add", path)
+		self.git("commit", "-q", "-m", text.strip())
+
+	def probe(self):
+		return rgit.gitdir.probe_state(self.worktree / ".git")
+
+	def test_clean(self):
+		self.assertEqual(self.probe(), ())
+
+	def test_detached(self):
+		self.git("checkout", "-q", "--detach")
+		self.assertEqual(self.probe(), ("detached",))
+
+	def test_merge(self):
+		self.git("merge", "other", check=False)
+		self.assertEqual(self.probe(), ("merge",))
+
+	def test_cherry_pick_on_detached_head(self):
+		self.git("checkout", "-q", "--detach")
+		self.git("cherry-pick", "other", check=False)
+		self.assertEqual(self.probe(), ("detached", "cherry-pick"))
+
+	def test_rebase(self):
+		self.git("rebase", "other", check=False)
+		self.assertEqual(self.probe(), ("rebase",))
+		self.git("rebase", "--abort")
+		self.git("rebase", "--apply", "other", check=False)
+		self.assertEqual(self.probe(), ("rebase",))
+
+	def test_bisect(self):
+		self.git("bisect", "start", "main", "main~1")
+		self.assertEqual(self.probe(), ("bisect",))
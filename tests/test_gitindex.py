@@ -0,0 +1,123 @@
+import os, pathlib, subprocess, tempfile, time, unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.gitindex, rgit.git # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestGitIndex(unittest.TestCase):
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(self._tmp.cleanup)
+		self.worktree = pathlib.Path(os.path.realpath(self._tmp.name)) / "repo"
+		self.git("init", "-q", os.fspath(self.worktree), cwd=None)
+		self.git("config", "core.untrackedCache", "true")
+		self.git("config", "core.excludesFile", os.fspath(self.worktree.parent / "ignore"))
+		(self.worktree / "a" / "b").mkdir(parents=True)
+		(self.worktree / "a" / "b" / "f").write_text("f\n")
+		(self.worktree / "top").write_text("top\n")
+		os.symlink("top", self.worktree / "link")
+		self.git("add", ".")
+		self.git("-c", "user.name=rgit", "-c", "user.email=rgit@localhost", "commit", "-q", "-m", "initial")
+		self.refresh()
+
+	def git(self, *args, cwd=True):
+		return subprocess.run(
+			["git", *args], cwd=self.worktree if cwd else None,
+			check=True, capture_output=True, encoding="UTF-8",
+		).stdout
+
+	def refresh(self):
+		# Files modified in the same second the index is written are racily clean, git only
+		# records them as clean (and updates the untracked cache) once they are not. Times are
+		# whole seconds apart, git may not compare nanoseconds and leave the index unchanged.
+		self._past = getattr(self, "_past", int(time.time()) - 10) - 1
+		past = self._past
+		for dirpath, dirnames, filenames in os.walk(self.worktree):
+			if ".git" in dirnames:
+				dirnames.remove(".git")
+			for name in (*dirnames, *filenames):
+				os.utime(os.path.join(dirpath, name), (past, past), follow_symlinks=False)
+		os.utime(self.worktree, (past, past))
+		if (self.worktree.parent / "ignore").exists():
+			os.utime(self.worktree.parent / "ignore", (past, past))
+		self.assertEqual(self.git("status", "--porcelain"), "")
+
+	def is_clean(self):
+		return rgit.git.is_worktree_clean_quick_sync(self.worktree / ".git")
+
+	def test_clean(self):
+		self.assertTrue(self.is_clean())
+		with rgit.gitindex.Index(self.worktree / ".git" / "index") as index:
+			self.assertEqual(index.version, 2)
+			self.assertEqual([e.path for e in index.entries()], [b"a/b/f", b"link", b"top"])
+			self.assertEqual(set(index.extensions()), {b"TREE", b"UNTR"})
+			self.assertEqual([d.path for d in index.untracked_cache().directories], [b"", b"a/", b"a/b/"])
+
+	def test_index_versions(self):
+		# Version 3 is only written if there are entries with extended flags.
+		self.git("update-index", "--index-version", "3", "--skip-worktree", "top")
+		for version in (3, 4):
+			self.git("update-index", "--index-version", str(version))
+			self.refresh()
+			with rgit.gitindex.Index(self.worktree / ".git" / "index") as index:
+				self.assertEqual(index.version, version)
+				entries = list(index.entries())
+				self.assertEqual([e.path for e in entries], [b"a/b/f", b"link", b"top"])
+				self.assertEqual([bool(e.extended_flags) for e in entries], [False, False, True])
+			self.assertTrue(self.is_clean())
+
+	def test_untracked(self):
+		(self.worktree / "a" / "b" / "new").write_text("new\n")
+		self.assertFalse(self.is_clean())
+		(self.worktree / "a" / "b" / "new").unlink()
+		self.refresh()
+		self.assertTrue(self.is_clean())
+		(self.worktree / "a" / "new").mkdir()
+		self.assertFalse(self.is_clean())
+
+	def test_modified(self):
+		(self.worktree / "top").write_text("changed\n")
+		self.assertFalse(self.is_clean())
+		(self.worktree / "link").unlink()
+		(self.worktree / "link").write_text("top")
+		self.assertFalse(self.is_clean())
+
+	def test_staged(self):
+		(self.worktree / "top").write_text("changed\n")
+		self.git("add", "top")
+		self.assertFalse(self.is_clean())
+		(self.worktree / "top").write_text("top\n")
+		self.git("add", "top")
+		# The cached tree is now invalid, the index is compared with HEAD instead.
+		self.refresh()
+		with rgit.gitindex.Index(self.worktree / ".git" / "index") as index:
+			self.assertIsNone(index.cache_tree_root())
+		self.assertTrue(self.is_clean())
+
+	def test_excludes(self):
+		(self.worktree / "a" / "b" / "x.log").write_text("log\n")
+		(self.worktree.parent / "ignore").write_text("*.log\n")
+		self.refresh()
+		self.assertTrue(self.is_clean())
+		(self.worktree.parent / "ignore").write_text("*.tmp\n")
+		self.assertFalse(self.is_clean())
+
+	def test_without_untracked_cache(self):
+		self.git("update-index", "--no-untracked-cache")
+		self.git("config", "core.untrackedCache", "false")
+		self.refresh()
+		self.assertFalse(self.is_clean())
+
+	def test_read_ewah(self):
+		# 2 words of ones, then 2 literal words.
+		rlw = 1 | (2 << 1) | (2 << 33)
+		data = b"".join([
+			(256).to_bytes(4, "big"), (3).to_bytes(4, "big"),
+			rlw.to_bytes(8, "big"), (0b101).to_bytes(8, "big"), (1 << 63).to_bytes(8, "big"),
+			(0).to_bytes(4, "big"),
+		])
+		positions, offset = rgit.gitindex._read_ewah(data, 0) # pylint: disable=protected-access
+		self.assertEqual(positions, [*range(128), 128, 130, 255])
+		self.assertEqual(offset, len(data))
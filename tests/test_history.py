@@ -0,0 +1,60 @@
+import pathlib, tempfile, unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.history, rgit.repostatus # pylint: disable=wrong-import-position,wrong-import-order
+
+
+DAY = 24 * 60 * 60
+
+
+def make_status(path, *, commits=0, untracked=0):
+	status = rgit.repostatus.RepoStatus(pathlib.Path(path))
+	status.commits = commits
+	for _ in range(untracked):
+		status.count_change("??")
+	return status
+
+
+class TestHistory(unittest.TestCase):
+	def setUp(self):
+		tmp = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+		self.addCleanup(tmp.cleanup)
+		self.path = pathlib.Path(tmp.name) / "history.sqlite3"
+
+	def test_unclean(self):
+		with rgit.history.History(self.path) as h:
+			for day in range(10):
+				h.record_run([
+					make_status("/a", commits=1 if day >= 2 else 0, untracked=1),
+					make_status("/b", untracked=1 if day >= 8 else 0),
+					make_status("/c", untracked=1 if day % 2 else 0),
+					*([make_status("/gone", untracked=1)] if day < 5 else []),
+				], time=day * DAY, duration=1)
+			# Only looks at /a, so it doesn't make /gone stale.
+			h.record_run([make_status("/a", commits=2, untracked=1)], time=10 * DAY, duration=1, partial=True)
+		with rgit.history.History(self.path) as h:
+			unclean = h.get_unclean(before=7 * DAY)
+			self.assertEqual([row[:4] for row in unclean], [("/a", 0, 2 * DAY, 2)])
+			self.assertEqual(unclean[0][4], {"Commits": 2, "??": 1})
+			self.assertEqual([row[0] for row in h.get_unclean(before=10 * DAY)], ["/a", "/b", "/c"])
+
+	def test_trend(self):
+		with rgit.history.History(self.path) as h:
+			for hour in range(48):
+				h.record_run([make_status("/a", commits=hour), make_status("/b")], time=hour * 3600, duration=1)
+			h.record_run([make_status("/a", commits=100)], time=48 * 3600, duration=1, partial=True)
+			self.assertEqual(h.get_trend(since=0, interval=DAY), [
+				(23 * 3600, 2, 1, 23, 0),
+				(47 * 3600, 2, 1, 47, 0),
+			])
+			self.assertEqual(len(h.get_trend(since=24 * 3600, interval=3600)), 24)
+
+	def test_repo(self):
+		with rgit.history.History(self.path) as h:
+			self.assertEqual(h.get_repo("/a", 10), ([], None))
+			for i in range(5):
+				h.record_run([make_status("/a", untracked=i % 2)], time=i, duration=1)
+			self.assertEqual(h.get_repo("/a", 10), ([(3, {"??": 1}), (1, {"??": 1})], 4))
+			self.assertEqual(h.get_repo("/a", 1), ([(3, {"??": 1})], 4))
@@ -0,0 +1,50 @@
+import collections, math, pathlib, unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.metrics, rgit.repostatus # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestMetrics(unittest.TestCase):
+	def test_render(self):
+		m = rgit.metrics.Metrics()
+		m.add("a", 1, "First", {"repo": 'C:\\a "b"\n'})
+		m.add("b", math.nan, "Second")
+		m.add("a", 2.5, "First", {"repo": "x"})
+		self.assertEqual(m.render(), "".join([
+			"# TYPE rgit_a gauge\n",
+			"# HELP rgit_a First\n",
+			'rgit_a{repo="C:\\\\a \\"b\\"\\n"} 1\n',
+			'rgit_a{repo="x"} 2.5\n',
+			"# TYPE rgit_b gauge\n",
+			"# HELP rgit_b Second\n",
+			"rgit_b NaN\n",
+			"# EOF\n",
+		]))
+
+	def test_collect(self):
+		clean = rgit.repostatus.RepoStatus(pathlib.Path("/clean"))
+		dirty = rgit.repostatus.RepoStatus(pathlib.Path("/dirty"))
+		dirty.commits = 3
+		dirty.count_change("•M")
+		timed_out = rgit.repostatus.RepoStatus(pathlib.Path("/slow"), notes=("timed out",))
+		durations = {clean.path: 0.5, dirty.path: 1.5}
+		text = rgit.metrics.collect([clean, dirty, timed_out], durations,
+			run_duration=2.0, timestamp=100.0, processes_started=7,
+			quick_checks=collections.Counter(clean=1, unknown=3), throttled_seconds=4.5,
+		).render()
+		samples = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+		self.assertEqual(samples['rgit_repo_unpushed_commits{repo="/clean"}'], "0")
+		self.assertEqual(samples['rgit_repo_unpushed_commits{repo="/dirty"}'], "3")
+		self.assertEqual(samples['rgit_repo_changed_paths{repo="/dirty",status=".M"}'], "1")
+		self.assertNotIn('rgit_repo_changed_paths{repo="/clean",status=".M"}', samples)
+		self.assertEqual(samples['rgit_repo_timed_out{repo="/slow"}'], "1")
+		self.assertNotIn('rgit_repo_duration_seconds{repo="/slow"}', samples)
+		self.assertEqual(samples["rgit_run_repositories"], "3")
+		self.assertEqual(samples["rgit_run_unclean_repositories"], "2")
+		self.assertEqual(samples["rgit_run_processes_started"], "7")
+		self.assertEqual(samples["rgit_run_slowest_repository_seconds"], "1.5")
+		self.assertEqual(samples["rgit_run_quick_check_clean_ratio"], "0.25")
+		self.assertNotIn("rgit_run_commit_walk_cache_hit_ratio", samples)
+		self.assertEqual(samples["rgit_run_throttled_seconds"], "4.5")
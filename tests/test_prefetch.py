@@ -0,0 +1,80 @@
+import os, pathlib, subprocess, tempfile, threading, unittest, unittest.mock, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.prefetch # pylint: disable=wrong-import-position,wrong-import-order
+
+
+def git(*args, cwd=None):
+	subprocess.run(["git", "-c", "user.name=u", "-c", "user.email=u@example.com", *args],
+		cwd=cwd, check=True, capture_output=True,
+	)
+
+
+class TestGetRepoPaths(unittest.TestCase):
+	def test_packs_and_worktrees(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			tmp = pathlib.Path(os.path.realpath(tmp))
+			main = tmp / "main"
+			git("init", "-q", os.fspath(main))
+			git("commit", "-q", "--allow-empty", "-m", "packed", cwd=main)
+			git("gc", "-q", cwd=main)
+			git("worktree", "add", "-q", "-b", "other", os.fspath(tmp / "worktree"), cwd=main)
+			commondir = main / ".git"
+			packs = sorted(os.fspath(p) for p in (commondir / "objects" / "pack").glob("*.idx"))
+			self.assertEqual(len(packs), 1)
+
+			files, directories = rgit.prefetch.get_repo_paths(commondir)
+			self.assertEqual(files, [
+				commondir / "HEAD", commondir / "index", commondir / "config", commondir / "packed-refs", *packs,
+			])
+			self.assertEqual(directories, [main])
+
+			gitdir = commondir / "worktrees" / "worktree"
+			files, directories = rgit.prefetch.get_repo_paths(tmp / "worktree" / ".git")
+			self.assertEqual(files, [
+				gitdir / "HEAD", gitdir / "index", commondir / "config", commondir / "packed-refs", *packs,
+			])
+			self.assertEqual(directories, [tmp / "worktree"])
+
+
+class TestPrefetcher(unittest.TestCase):
+	def test_prefetch(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			tmp = pathlib.Path(tmp)
+			repos = []
+			for name in ("a", "b"):
+				(tmp / name / ".git").mkdir(parents=True)
+				(tmp / name / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+				repos.append(tmp / name / ".git")
+			prefetcher = rgit.prefetch.Prefetcher(threads=2)
+			prefetcher.start(repos)
+			self.assertTrue(prefetcher.wait(5))
+			self.assertEqual((prefetcher.files, prefetcher.directories), (8, 2))
+			self.assertEqual(prefetcher.bytes, 2 * len("ref: refs/heads/main\n"))
+			self.assertIsNotNone(prefetcher.duration)
+
+	def test_stop(self):
+		release = threading.Event()
+		started = threading.Event()
+		prefetched = []
+		def prefetch_file(path):
+			prefetched.append(path)
+			started.set()
+			release.wait(5)
+			return 1
+		repos = [pathlib.Path(f"/nonexistent/{name}") for name in ("a", "b", "c")]
+		paths = {repo: ([repo / "HEAD"], [repo]) for repo in repos}
+		with unittest.mock.patch.object(rgit.prefetch, "prefetch_file", prefetch_file), \
+			unittest.mock.patch.object(rgit.prefetch, "get_repo_paths", paths.get):
+			prefetcher = rgit.prefetch.Prefetcher(threads=1)
+			prefetcher.start(repos)
+			self.assertTrue(started.wait(5))
+			prefetcher.stop()
+			release.set()
+			# The read underway finishes, nothing else is started.
+			self.assertFalse(prefetcher.wait(0.2))
+		self.assertEqual(prefetched, [repos[0] / "HEAD"])
+		self.assertEqual((prefetcher.files, prefetcher.directories), (1, 0))
+		self.assertIsNone(prefetcher.duration)
@@ -0,0 +1,83 @@
+import io, os, pathlib, subprocess, tempfile, unittest, unittest.mock, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.prompt, rgit.gitdir, rgit.repostatus # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestPrompt(unittest.TestCase):
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		self.tmp = pathlib.Path(os.path.realpath(self._tmp.name))
+		self.worktree = self.tmp / "repo"
+		subprocess.run(["git", "init", "-q", os.fspath(self.worktree)], check=True)
+		self.gitdir = self.worktree / ".git"
+		patcher = unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": os.fspath(self.tmp / "cache")})
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.addCleanup(self._tmp.cleanup)
+
+	def show(self, path, **kwargs):
+		fo = io.StringIO()
+		rgit.prompt.show(os.fspath(path), fo=fo, **kwargs)
+		return fo.getvalue()
+
+	def status(self, **kwargs):
+		status = rgit.repostatus.RepoStatus(self.worktree)
+		for name, value in kwargs.items():
+			setattr(status, name, value)
+		return status
+
+	def test_summarize(self):
+		self.assertEqual(rgit.prompt.summarize(self.status()), "")
+		status = self.status()
+		status.count_change("??")
+		status.count_change("•M")
+		self.assertEqual(rgit.prompt.summarize(status), "")
+		status = self.status(commits=2, refs=1, remotes=rgit.repostatus.MISSING_REMOTE)
+		self.assertEqual(rgit.prompt.summarize(status), "↑2 ⚑1 ⊘")
+		self.assertEqual(rgit.prompt.summarize(self.status(notes=("timed out",))), "!")
+
+	def test_show(self):
+		(self.worktree / "subdir").mkdir()
+		self.assertEqual(self.show(self.worktree), "")
+		rgit.prompt.write_entries(self.gitdir, rgit.gitdir.fingerprint(self.gitdir), self.status(commits=2))
+		self.assertEqual(self.show(self.worktree, budget_ms=1000), "↑2\n")
+		self.assertEqual(self.show(self.worktree / "subdir", budget_ms=1000), "↑2\n")
+		self.assertEqual(self.show(self.gitdir, budget_ms=1000), "↑2\n")
+		self.assertEqual(self.show(self.tmp, budget_ms=1000), "")
+		self.assertEqual(self.show(self.worktree, budget_ms=0), "↑2 ?\n")
+		self.assertEqual(self.show(self.worktree, budget_ms=1000, max_age=-1), "↑2 ?\n")
+
+	def test_stale_after_change(self):
+		rgit.prompt.write_entries(self.gitdir, rgit.gitdir.fingerprint(self.gitdir), self.status())
+		self.assertEqual(self.show(self.worktree, budget_ms=1000), "")
+		subprocess.run(["git", "-C", os.fspath(self.worktree), "branch", "-q", "-m", "renamed"], check=True)
+		self.assertEqual(self.show(self.worktree, budget_ms=1000, stale_marker="~"), "~\n")
+
+	def test_state(self):
+		rgit.prompt.write_entries(self.gitdir, rgit.gitdir.fingerprint(self.gitdir), self.status(commits=2))
+		(self.gitdir / "MERGE_HEAD").write_text("0" * 40 + "\n")
+		self.assertEqual(self.show(self.worktree, budget_ms=1000), "↑2 merge\n")
+
+	def test_prune_entries(self):
+		other = self.tmp / "other"
+		subprocess.run(["git", "init", "-q", os.fspath(other)], check=True)
+		for gitdir in (self.gitdir, other / ".git"):
+			rgit.prompt.write_entries(gitdir, rgit.gitdir.fingerprint(gitdir), self.status(commits=2))
+		rgit.prompt.prune_entries([self.gitdir])
+		self.assertEqual(self.show(self.worktree, budget_ms=1000), "↑2\n")
+		self.assertEqual(self.show(other, budget_ms=1000), "")
+		self.assertEqual(len(os.listdir(rgit.prompt.cache_dir())), 2)
+
+	def test_main_does_not_import_the_rest_of_rgit(self):
+		result = subprocess.run(
+			[sys.executable, "-c", (
+				"import sys, rgit.__main__; rgit.__main__._smain(['prompt']); "
+				"print(sorted(m for m in sys.modules if m.split('.')[0] in ('rgit', 'pygit2', 'yaml', 'asyncio', 'argparse')))"
+			)],
+			cwd=self.tmp, env={**os.environ, "PYTHONPATH": os.fspath(get_toplevel())},
+			check=True, capture_output=True, encoding="UTF-8",
+		)
+		self.assertEqual(result.stdout.strip(), "['rgit', 'rgit.__main__', 'rgit.constants', 'rgit.gitdir', 'rgit.prompt']")
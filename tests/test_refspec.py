@@ -0,0 +1,69 @@
+import unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.refspec # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestParse(unittest.TestCase):
+	def test_parse(self):
+		test_data = [
+			("+refs/heads/*:refs/remotes/origin/*", ("refs/heads/*", "refs/remotes/origin/*", True, False)),
+			("refs/heads/main:refs/remotes/origin/main", ("refs/heads/main", "refs/remotes/origin/main", False, False)),
+			("refs/heads/main", ("refs/heads/main", None, False, False)),
+			("^refs/heads/tmp/*", ("refs/heads/tmp/*", None, False, True)),
+		]
+		for refspec, expected in test_data:
+			self.assertEqual(tuple(rgit.refspec.parse(refspec)), expected, refspec)
+
+	def test_parse_invalid(self):
+		for refspec in ("+^refs/heads/x", "^refs/heads/x:refs/remotes/o/x", "refs/heads/*:refs/remotes/o/x", "refs/*/*:refs/*/*"):
+			with self.assertRaises(ValueError, msg=refspec):
+				rgit.refspec.parse(refspec)
+
+
+class TestRefspecMap(unittest.TestCase):
+	def setUp(self):
+		self.refspecs = rgit.refspec.RefspecMap()
+		self.refspecs.add("origin", "+refs/heads/*:refs/remotes/origin/*")
+		self.refspecs.add("origin", "^refs/heads/tmp/*")
+		self.refspecs.add("origin", "^refs/heads/scratch")
+		self.refspecs.add("origin", "+refs/pull/*/head:refs/pull/origin/*")
+		self.refspecs.add("mirror", "refs/heads/main:refs/remotes/mirror/main")
+		self.refspecs.add("other", "+refs/heads/feature*:refs/remotes/other/f*")
+
+	def test_lookup(self):
+		test_data = [
+			("refs/remotes/origin/main", ("origin", "refs/heads/main")),
+			("refs/remotes/origin/a/b", ("origin", "refs/heads/a/b")),
+			("refs/pull/origin/12", ("origin", "refs/pull/12/head")),
+			("refs/remotes/mirror/main", ("mirror", "refs/heads/main")),
+			("refs/remotes/mirror/other", None),
+			("refs/remotes/other/fx", ("other", "refs/heads/featurex")),
+			("refs/heads/main", None),
+			("refs/remotes/origin/tmp/x", rgit.refspec.EXCLUDED),
+			("refs/remotes/origin/scratch", rgit.refspec.EXCLUDED),
+		]
+		for ref, expected in test_data:
+			self.assertEqual(self.refspecs.lookup(ref), expected, ref)
+
+	def test_first_added_wins(self):
+		self.refspecs.add("late", "refs/heads/x:refs/remotes/origin/x")
+		self.assertEqual(self.refspecs.lookup("refs/remotes/origin/x"), ("origin", "refs/heads/x"))
+
+	def test_negative_applies_per_remote(self):
+		self.refspecs.add("second", "+refs/heads/*:refs/remotes/origin/*")
+		self.assertEqual(self.refspecs.lookup("refs/remotes/origin/tmp/x"), ("second", "refs/heads/tmp/x"))
+
+
+class TestMatchRefspec(unittest.TestCase):
+	def test_match_refspec(self):
+		test_data = [
+			("refs/remotes/origin/main", "refs/remotes/origin/*", "refs/heads/*", "refs/heads/main"),
+			("refs/remotes/origin/main", "refs/remotes/origin/main", "refs/heads/main", "refs/heads/main"),
+			("refs/remotes/origin/main", "refs/remotes/other/*", "refs/heads/*", None),
+			("refs/remotes/origin/main", "refs/remotes/origin/x", "refs/heads/x", None),
+		]
+		for ref, spec, other_spec, expected in test_data:
+			self.assertEqual(rgit.refspec.match_refspec(ref, spec, other_spec), expected, (ref, spec, other_spec))
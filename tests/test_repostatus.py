@@ -0,0 +1,54 @@
+import pathlib, pickle, unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.repostatus # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestRepoStatus(unittest.TestCase):
+	def test_clean(self):
+		status = rgit.repostatus.RepoStatus(pathlib.Path("/repo"))
+		self.assertFalse(status)
+		self.assertEqual(status.to_dict(), {})
+		self.assertIsNone(status.changes)
+		self.assertEqual(status.get_change("??"), 0)
+
+	def test_columns(self):
+		status = rgit.repostatus.RepoStatus(pathlib.Path("/repo"))
+		status.add_note("missing worktree")
+		status.add_note("timed out")
+		status.state = ("detached", "merge")
+		status.set_remotes({"origin", "mirror"})
+		status.set_other_remotes({"upstream"})
+		status.set_extra("Unsupported Remote Config", {"origin": {"mirror": ["true"]}})
+		status.count_change("??")
+		status.count_change("??")
+		status.count_change("M•")
+		status.commits = 3
+		self.assertTrue(status)
+		self.assertEqual(status.to_dict(), {
+			"Notes": "missing worktree, timed out",
+			"State": "detached, merge",
+			"Remotes": "mirror, origin",
+			"Other Remotes": "upstream",
+			"Unsupported Remote Config": {"origin": {"mirror": ["true"]}},
+			"Commits": 3,
+			"??": 2,
+			"M•": 1,
+		})
+		self.assertEqual(pickle.loads(pickle.dumps(status)).to_dict(), status.to_dict())
+
+	def test_missing_remote(self):
+		status = rgit.repostatus.RepoStatus(pathlib.Path("/repo"))
+		status.set_remotes(rgit.repostatus.MISSING_REMOTE)
+		self.assertTrue(status)
+		self.assertEqual(status.to_dict(), {"Remotes": " - "})
+		self.assertEqual(pickle.loads(pickle.dumps(status)).to_dict(), {"Remotes": " - "})
+
+	def test_remote_names_are_interned(self):
+		a = rgit.repostatus.RepoStatus(pathlib.Path("/a"))
+		b = rgit.repostatus.RepoStatus(pathlib.Path("/b"))
+		a.set_other_remotes(["".join(["up", "stream"])])
+		b.set_other_remotes(["".join(["upst", "ream"])])
+		self.assertIs(a.other_remotes[0], b.other_remotes[0])
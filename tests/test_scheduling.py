@@ -0,0 +1,192 @@
+import asyncio, os, pathlib, tempfile, threading, time, unittest, unittest.mock, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.scheduling # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestDeviceLimiter(unittest.TestCase):
+	def test_get_devices(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			gitdir = pathlib.Path(tmp) / ".git"
+			gitdir.mkdir()
+			self.assertEqual(rgit.scheduling.get_devices(gitdir), (os.stat(tmp).st_dev,))
+			self.assertEqual(rgit.scheduling.get_devices(gitdir / "missing"), ())
+
+	def test_limits_per_device(self):
+		async def run():
+			limiter = rgit.scheduling.DeviceLimiter(jobs=8, device_jobs=2)
+			limiter._device_jobs_overrides = {} # pylint: disable=protected-access
+			running = {1: 0, 2: 0}
+			peak = {1: 0, 2: 0}
+			async def job(device):
+				async with limiter.acquire((device,)):
+					running[device] += 1
+					peak[device] = max(peak[device], running[device])
+					await asyncio.sleep(0.01)
+					running[device] -= 1
+			await asyncio.gather(*(job(1 + i % 2) for i in range(10)))
+			return peak
+		self.assertEqual(asyncio.run(run()), {1: 2, 2: 2})
+
+	def test_limits_overall(self):
+		async def run():
+			limiter = rgit.scheduling.DeviceLimiter(jobs=3, device_jobs=2)
+			limiter._device_jobs_overrides = {} # pylint: disable=protected-access
+			running = 0
+			peak = 0
+			async def job(device):
+				nonlocal running, peak
+				async with limiter.acquire((device,)):
+					running += 1
+					peak = max(peak, running)
+					await asyncio.sleep(0.01)
+					running -= 1
+			await asyncio.gather(*(job(i % 4) for i in range(12)))
+			return peak
+		self.assertEqual(asyncio.run(run()), 3)
+
+
+	def test_device_lookups(self):
+		lock = threading.Lock()
+		running = 0
+		peak = 0
+		def get_devices(repo):
+			nonlocal running, peak
+			with lock:
+				running += 1
+				peak = max(peak, running)
+			time.sleep(0.01)
+			with lock:
+				running -= 1
+			return (len(repo.name),)
+		async def run():
+			limiter = rgit.scheduling.DeviceLimiter(jobs=3, configured_device_jobs=[(tempfile.gettempdir(), 1)])
+			resolve_patch = unittest.mock.patch.object(limiter, "_resolve_configured_device_jobs",
+				wraps=limiter._resolve_configured_device_jobs, # pylint: disable=protected-access
+			)
+			with resolve_patch as resolve, unittest.mock.patch.object(rgit.scheduling, "get_devices", get_devices):
+				devices = await asyncio.gather(*(limiter.get_devices(pathlib.Path("r" * i)) for i in range(1, 11)))
+			return devices, resolve.call_count
+		devices, resolve_calls = asyncio.run(run())
+		self.assertEqual(devices, [(i,) for i in range(1, 11)])
+		self.assertEqual(resolve_calls, 1)
+		self.assertLessEqual(peak, 3)
+
+	def test_start_order(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			tmp = pathlib.Path(tmp)
+			history = rgit.scheduling.TimingHistory(tmp / "timings.json")
+			repos = [tmp / f"r{i}" for i in range(6)]
+			for i, repo in enumerate(repos):
+				repo.mkdir()
+				if i % 2:
+					history.record(repo, i)
+				else:
+					(repo / "index").write_bytes(b"\0" * (i + 1) * 10_000_000)
+			asyncio.run(history.find_index_sizes(repos))
+			scheduled = history.order(repos)
+			self.assertEqual(scheduled, [repos[5], repos[3], repos[4], repos[2], repos[1], repos[0]])
+		started = []
+		def get_devices(repo):
+			# The devices of the slowest repos are found last.
+			time.sleep(0.01 * (len(repos) - scheduled.index(repo)))
+			return (1,)
+		async def run():
+			limiter = rgit.scheduling.DeviceLimiter(jobs=len(repos), device_jobs=1)
+			limiter.set_order(scheduled)
+			async def job(repo):
+				async with limiter.acquire(await limiter.get_devices(repo), repo):
+					started.append(repo)
+					await asyncio.sleep(0.001)
+			with unittest.mock.patch.object(rgit.scheduling, "get_devices", get_devices):
+				await asyncio.gather(*(job(repo) for repo in scheduled))
+		asyncio.run(run())
+		self.assertEqual(started, scheduled)
+
+	def test_limits_shared_by_workers(self):
+		async def run():
+			limiter = rgit.scheduling.DeviceLimiter(jobs=5, device_jobs=3, workers=2)
+			limiter._device_jobs_overrides = {} # pylint: disable=protected-access
+			return limiter._semaphore._value, limiter._get_device_semaphore(1)._value # pylint: disable=protected-access
+		self.assertEqual(asyncio.run(run()), (3, 2))
+
+
+class TestLoadThrottle(unittest.TestCase):
+	def test_limit(self):
+		load = 6.0
+		throttle = rgit.scheduling.LoadThrottle(8, cpus=8, get_load=lambda: load)
+		self.assertEqual(throttle.limit(), 2)
+		load = 20.0
+		self.assertEqual(throttle.limit(), 1)
+		load = 0.0
+		self.assertEqual(throttle.limit(), 8)
+		load = None
+		self.assertEqual(throttle.limit(), 8)
+		self.assertEqual(rgit.scheduling.LoadThrottle(8, workers=2, cpus=8, get_load=lambda: 3.0).limit(), 3)
+
+	def test_throttles_while_busy(self):
+		async def run():
+			load = 7.0
+			throttle = rgit.scheduling.LoadThrottle(8, cpus=8, get_load=lambda: load)
+			throttle.POLL_SECONDS = 0.05
+			running = 0
+			peak = 0
+			async def job():
+				nonlocal running, peak
+				async with throttle.acquire():
+					running += 1
+					peak = max(peak, running)
+					await asyncio.sleep(0.05)
+					running -= 1
+			jobs = asyncio.gather(*(job() for _ in range(6)))
+			await asyncio.sleep(0.12)
+			busy_peak = peak
+			load = 0.0
+			await jobs
+			return busy_peak, peak, throttle.throttled_seconds
+		busy_peak, peak, throttled_seconds = asyncio.run(run())
+		self.assertEqual(busy_peak, 1)
+		self.assertGreater(peak, 1)
+		self.assertGreaterEqual(throttled_seconds, 0.1)
+
+	def test_device_limiter(self):
+		self.assertIsNone(rgit.scheduling.DeviceLimiter(jobs=4).throttle)
+		self.assertIsNotNone(rgit.scheduling.DeviceLimiter(jobs=4, background=True).throttle)
+
+
+class TestTimingHistory(unittest.TestCase):
+	def test_order_and_persistence(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			tmp = pathlib.Path(tmp)
+			repos = [tmp / name for name in ("small", "big", "unknown", "indexed")]
+			for repo in repos:
+				repo.mkdir()
+			(tmp / "indexed" / "index").write_bytes(b"\0" * 10_000_000)
+
+			history = rgit.scheduling.TimingHistory(tmp / "timings.json")
+			history.load()
+			history.record(repos[0], 0.1)
+			history.record(repos[1], 20)
+			history.save(repos=repos[1:])
+
+			history = rgit.scheduling.TimingHistory(tmp / "timings.json")
+			history.load()
+			self.assertIsNone(history.get(repos[0]))
+			self.assertEqual(history.get(repos[1]), 20)
+			asyncio.run(history.find_index_sizes(repos))
+			self.assertEqual(
+				history.order(repos),
+				[repos[1], repos[3], repos[0], repos[2]],
+			)
+			history.record(repos[1], 10)
+			self.assertEqual(history.get(repos[1]), 15)
+
+	def test_split(self):
+		history = rgit.scheduling.TimingHistory("/nonexistent/timings.json")
+		repos = [pathlib.Path(f"/nonexistent/{name}") for name in ("a", "b", "a-worktree", "c", "d")]
+		for repo, seconds in zip(repos, (4, 3, 1, 2, 2)):
+			history.record(repo, seconds)
+		shards = history.split(repos, 2, lambda repo: repo.name.split("-")[0])
+		self.assertEqual(shards, [[repos[0], repos[2], repos[4]], [repos[1], repos[3]]])
@@ -0,0 +1,261 @@
+import asyncio, contextlib, io, json, os, pathlib, subprocess, tempfile, time, unittest, unittest.mock, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit._gitcli, rgit._launchers, rgit.catfile, rgit.cli, rgit.configuration, rgit.git, rgit.scheduling # pylint: disable=wrong-import-position,wrong-import-order
+from rgit.cli.status import Status # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class StatusTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmp = pathlib.Path(os.path.realpath(self.enterContext(tempfile.TemporaryDirectory())))
+		self.enterContext(unittest.mock.patch.dict(os.environ, {
+			"XDG_CACHE_HOME": os.fspath(self.tmp / "cache"),
+			"XDG_DATA_HOME": os.fspath(self.tmp / "data"),
+			"RGIT_FIXTURE": os.fspath(self.tmp / "fixture.jsonl"),
+		}))
+		self.addCleanup(rgit._gitcli.set_launcher, None)
+		self.gitdirs = []
+
+	def git(self, *args, cwd=None):
+		subprocess.run(["git", "-c", "user.name=u", "-c", "user.email=u@example.com", *args],
+			cwd=cwd, check=True, capture_output=True,
+		)
+
+	def add_repo(self, name, *, files=()):
+		worktree = self.tmp / name
+		self.git("init", "-q", os.fspath(worktree))
+		for file in files:
+			(worktree / file).write_text(file)
+		self.gitdirs.append(worktree / ".git")
+		return worktree
+
+	def load_config(self, *, destination_remotes=None):
+		content = {"repositories": [os.fspath(g) for g in self.gitdirs]}
+		if destination_remotes is not None:
+			content["destination.remotes"] = [os.fspath(r) for r in destination_remotes]
+		else:
+			content["destination.folders"] = [os.fspath(self.tmp)]
+		self.config_path = self.tmp / "config.json"
+		self.config_path.write_text(json.dumps(content))
+		return asyncio.run(rgit.configuration.load(config_file_path=self.config_path))
+
+	def run_status(self, *args, launcher=None):
+		"""
+		Runs `rgit status` with the configuration last loaded, returns its exit code and output.
+		"""
+		options = ["--config-path", os.fspath(self.config_path)]
+		if launcher is not None:
+			options.extend(("--launcher", launcher))
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			exit_code = asyncio.run(rgit.cli.main([
+				*options, "status", "--no-history", "--no-zsh-named-dirs", *args,
+			]))
+		return exit_code, output.getvalue()
+
+	def set_latency(self, latency, predicate):
+		"""
+		Makes the git commands of the fixture that `predicate(args)` is true for take `latency`
+		seconds when replayed.
+		"""
+		fixture = pathlib.Path(os.environ["RGIT_FIXTURE"])
+		records = [json.loads(line) for line in fixture.read_text().splitlines()]
+		for record in records:
+			if predicate(record["args"]):
+				record["latency"] = latency
+		fixture.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+	def patch_kill(self):
+		return unittest.mock.patch.object(rgit._launchers._ReplayedProcess, "kill", autospec=True, # pylint: disable=protected-access
+			side_effect=rgit._launchers._ReplayedProcess.kill, # pylint: disable=protected-access
+		)
+
+	def inspect(self, config, repo, *, launcher=None, timeout=None):
+		async def run():
+			rgit._gitcli.set_launcher(launcher)
+			try:
+				status = Status()
+				status.prepare(config)
+				return await status.inspect_repo(repo, rgit.scheduling.DeviceLimiter(jobs=2), timeout=timeout)
+			finally:
+				await rgit.catfile.close_pool()
+				await rgit._gitcli.close_launcher()
+		return asyncio.run(run())
+
+
+class TestRepoTimeout(StatusTestCase):
+	def test_hung_git_is_killed(self):
+		self.add_repo("slow", files=("untracked",))
+		config = self.load_config()
+		recorded, _ = self.inspect(config, self.gitdirs[0], launcher="record")
+		self.assertEqual(recorded.to_dict(), {"??": 1})
+
+		# `git status` never finishes when replayed.
+		self.set_latency(60, lambda args: "status" in args)
+
+		started = time.monotonic()
+		with self.patch_kill() as killed:
+			status, duration = self.inspect(config, self.gitdirs[0], launcher="replay", timeout=0.3)
+		self.assertLess(time.monotonic() - started, 5)
+		self.assertEqual(status.notes, ("timed out",))
+		self.assertEqual(status.to_dict(), {"Notes": "timed out"})
+		self.assertGreaterEqual(duration, 0.3)
+		killed.assert_called_once()
+
+
+class TestCommitWalks(StatusTestCase):
+	def test_shared_by_worktrees_and_mirrors(self):
+		main = self.add_repo("main")
+		self.git("commit", "-q", "--allow-empty", "-m", "pushed", cwd=main)
+		self.git("branch", "-q", "-m", "main", cwd=main)
+		for remote in ("origin", "mirror"):
+			url = os.fspath(self.tmp / "destination" / f"{remote}.git")
+			self.git("init", "-q", "--bare", url)
+			self.git("remote", "add", remote, url, cwd=main)
+			self.git("push", "-q", remote, "main", cwd=main)
+		self.git("branch", "-q", "-u", "origin/main", cwd=main)
+		self.git("commit", "-q", "--allow-empty", "-m", "unpushed", cwd=main)
+		# The same commits tracking the mirror, checked out in a linked worktree.
+		self.git("branch", "-q", "--track", "mirrored", "mirror/main", cwd=main)
+		self.git("branch", "-q", "-f", "mirrored", "main", cwd=main)
+		self.git("worktree", "add", "-q", os.fspath(self.tmp / "worktree"), "mirrored", cwd=main)
+		self.gitdirs.append(self.tmp / "worktree" / ".git")
+		self.load_config(destination_remotes=[self.tmp / "destination"])
+
+		clear = unittest.mock.patch.object(rgit.git.ObjectDatabaseMemo, "clear", autospec=True,
+			side_effect=rgit.git.ObjectDatabaseMemo.clear,
+		)
+		with clear as cleared:
+			_, output = self.run_status("--json")
+		self.assertEqual(json.loads(output), {os.fspath(g): {"Commits": 2} for g in self.gitdirs})
+		cleared.assert_called_once()
+		memo = cleared.call_args.args[0]
+		# Both repos walk from both branches, one walk is made for all four.
+		self.assertEqual((memo.hits, memo.misses), (3, 1))
+		self.assertEqual(memo._results, {}) # pylint: disable=protected-access
+
+
+class TestAnyUnclean(StatusTestCase):
+	def test_clean(self):
+		self.add_repo("clean")
+		self.load_config()
+		self.assertEqual(self.run_status("--any-unclean"), (0, ""))
+
+	def test_unclean(self):
+		self.add_repo("clean")
+		self.add_repo("dirty", files=("untracked",))
+		self.load_config()
+		self.assertEqual(self.run_status("--any-unclean"), (1, ""))
+
+	def test_detached_head(self):
+		worktree = self.add_repo("detached")
+		self.git("commit", "-q", "--allow-empty", "-m", "detached", cwd=worktree)
+		self.load_config()
+		self.assertEqual(self.run_status("--any-unclean"), (0, ""))
+		self.git("checkout", "-q", "--detach", cwd=worktree)
+		self.assertEqual(self.run_status("--any-unclean"), (1, ""))
+
+	def test_remaining_cancelled(self):
+		self.add_repo("slow")
+		self.add_repo("dirty", files=("untracked",))
+		self.load_config()
+		self.run_status("--json", launcher="record")
+		# The worktree of the clean repo would take a minute to scan.
+		slow = os.fspath(self.gitdirs[0])
+		self.set_latency(60, lambda args: "status" in args and slow in args)
+
+		started = time.monotonic()
+		with self.patch_kill() as killed:
+			self.assertEqual(self.run_status("--any-unclean", launcher="replay"), (1, ""))
+		self.assertLess(time.monotonic() - started, 5)
+		killed.assert_called_once()
+
+
+class TestWorkers(StatusTestCase):
+	def test_same_as_one_process(self):
+		self.add_repo("clean")
+		self.add_repo("untracked", files=("a", "b"))
+		worktree = self.add_repo("modified", files=("tracked",))
+		self.git("add", "tracked", cwd=worktree)
+		self.git("commit", "-q", "-m", "tracked", cwd=worktree)
+		(worktree / "tracked").write_text("modified")
+		worktree = self.add_repo("detached")
+		self.git("commit", "-q", "--allow-empty", "-m", "detached", cwd=worktree)
+		self.git("checkout", "-q", "--detach", cwd=worktree)
+		self.gitdirs.append(self.tmp / "missing" / ".git")
+		self.load_config()
+		exit_code, output = self.run_status("--json")
+		self.assertEqual(len(json.loads(output)), 4)
+		self.assertEqual(self.run_status("--json", "--workers", "2"), (exit_code, output))
+
+	def test_worker_failure(self):
+		worktree = self.add_repo("unsupported")
+		self.git("commit", "-q", "--allow-empty", "-m", "unsupported", cwd=worktree)
+		url = os.fspath(self.tmp / "destination" / "origin.git")
+		self.git("init", "-q", "--bare", url)
+		self.git("remote", "add", "origin", url, cwd=worktree)
+		self.git("update-ref", "refs/unsupported/ref", "HEAD", cwd=worktree)
+		self.add_repo("other")
+		self.load_config(destination_remotes=[self.tmp / "destination"])
+		with self.assertRaises(ValueError):
+			self.run_status()
+		with self.assertRaises(RuntimeError) as raised:
+			self.run_status("--workers", "2")
+		self.assertEqual(raised.exception.args[0], "status worker failed")
+		self.assertIn("Unrecognized Reference", raised.exception.args[2])
+		self.assertIn("ValueError", raised.exception.__notes__[0])
+
+
+class TestReplay(StatusTestCase):
+	def test_commit_lookups(self):
+		worktree = self.add_repo("branches")
+		self.git("commit", "-q", "--allow-empty", "-m", "pushed", cwd=worktree)
+		self.git("branch", "-q", "-m", "main", cwd=worktree)
+		url = os.fspath(self.tmp / "destination" / "origin.git")
+		self.git("init", "-q", "--bare", url)
+		self.git("remote", "add", "origin", url, cwd=worktree)
+		self.git("push", "-q", "-u", "origin", "main", cwd=worktree)
+		# Two tracking branches whose unpushed commits are looked up by the same `git cat-file`.
+		for branch, subjects in (("first", ("TMP", "unpushed")), ("second", ("TMP: later", "TMP"))):
+			self.git("checkout", "-q", "-b", branch, "--track", "origin/main", cwd=worktree)
+			for subject in subjects:
+				self.git("commit", "-q", "--allow-empty", "-m", subject, cwd=worktree)
+		config = self.load_config(destination_remotes=[self.tmp / "destination"])
+		recorded, _ = self.inspect(config, self.gitdirs[0], launcher="record")
+		self.assertEqual(recorded.commits, 1)
+		replayed, _ = self.inspect(config, self.gitdirs[0], launcher="replay")
+		self.assertEqual(replayed.to_dict(), recorded.to_dict())
+
+
+class TestTimingHistory(StatusTestCase):
+	def test_partial_runs_not_recorded(self):
+		self.add_repo("first")
+		self.add_repo("second")
+		self.load_config()
+		timings = self.tmp / "cache" / "rgit" / "timings.json"
+		self.run_status(os.fspath(self.tmp / "first"))
+		content = json.loads(timings.read_text())
+		self.assertEqual((content["runs"], content["last_run"]), ({}, None))
+		self.assertEqual(list(content["repositories"]), [os.fspath(self.gitdirs[0])])
+		self.run_status()
+		self.assertIsNotNone(json.loads(timings.read_text())["last_run"])
+
+
+class TestPromptEntries(StatusTestCase):
+	def test_pruned_by_full_runs(self):
+		self.add_repo("kept")
+		self.add_repo("dropped")
+		self.load_config()
+		self.run_status()
+		entries = self.tmp / "cache" / "rgit" / "prompt"
+		self.assertEqual(len(list(entries.iterdir())), 4)
+		del self.gitdirs[1]
+		self.load_config()
+		self.run_status(os.fspath(self.tmp / "kept"))
+		self.assertEqual(len(list(entries.iterdir())), 4)
+		self.run_status()
+		self.assertEqual(sorted(e.read_text().split("\n")[0] for e in entries.iterdir()), sorted([
+			os.fspath(self.tmp / "kept"), os.fspath(self.tmp / "kept" / ".git"),
+		]))
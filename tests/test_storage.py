@@ -0,0 +1,20 @@
+import os, pathlib, stat, tempfile, unittest, sys
+from . import get_toplevel
+
+
+sys.path.insert(0, get_toplevel())
+import rgit.storage # pylint: disable=wrong-import-position,wrong-import-order
+
+
+class TestWriteText(unittest.TestCase):
+	def test_mode(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			path = pathlib.Path(tmp) / "sub" / "m.prom"
+			rgit.storage.write_text(path, "a\n")
+			self.assertEqual(path.read_text(encoding="UTF-8"), "a\n")
+			self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o666 & ~rgit.storage._UMASK) # pylint: disable=protected-access
+			os.chmod(path, 0o640)
+			rgit.storage.write_text(path, "b\n")
+			self.assertEqual(path.read_text(encoding="UTF-8"), "b\n")
+			self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o640)
+			self.assertEqual(os.listdir(path.parent), ["m.prom"])
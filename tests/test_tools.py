@@ -1,4 +1,4 @@
-import unittest, sys
+import asyncio, threading, time, unittest, unittest.mock, sys
 from . import get_toplevel
 
 
@@ -7,6 +7,12 @@ import rgit.tools # pylint: disable=wrong-import-position,wrong-import-order
 
 
 class TestTools(unittest.TestCase):
+	def test_format_size(self):
+		self.assertEqual(
+			[rgit.tools.format_size(s) for s in (0, 1023, 1024, 1536, 10 * 1024, 30 * 1024 ** 3)],
+			["0B", "1023B", "1.0K", "1.5K", "10K", "30G"],
+		)
+
 	def test_url_starts_with(self):
 		test_data = [
 			(
@@ -203,3 +209,38 @@ class TestTools(unittest.TestCase):
 			self.assertIs(
 				rgit.tools.url_starts_with(url, prefix), expected, (url, prefix, expected)
 			)
+
+
+class TestRunInDaemonThread(unittest.TestCase):
+	def setUp(self):
+		self.pool = rgit.tools._DaemonThreadPool(2) # pylint: disable=protected-access
+		self.enterContext(unittest.mock.patch.object(rgit.tools, "_daemon_thread_pool", self.pool))
+
+	def test_threads_reused(self):
+		def call(i):
+			time.sleep(0.01)
+			return i, threading.get_ident()
+		async def run():
+			return await asyncio.gather(*(rgit.tools.run_in_daemon_thread(call, i) for i in range(20)))
+		results = asyncio.run(run())
+		self.assertEqual([i for i, _ in results], list(range(20)))
+		self.assertLessEqual(len({ident for _, ident in results}), 2)
+		self.assertEqual(self.pool.threads, 2)
+
+	def test_exception(self):
+		async def run():
+			return await rgit.tools.run_in_daemon_thread(int, "x")
+		with self.assertRaises(ValueError):
+			asyncio.run(run())
+
+	def test_abandoned_call_replaced(self):
+		stuck = threading.Event()
+		self.addCleanup(stuck.set)
+		async def run():
+			for _ in range(2):
+				with self.assertRaises(TimeoutError):
+					await asyncio.wait_for(rgit.tools.run_in_daemon_thread(stuck.wait), 0.05)
+			# Both threads are stuck, and calls still run in new ones.
+			return await asyncio.wait_for(rgit.tools.run_in_daemon_thread(sum, [1, 2]), 1)
+		self.assertEqual(asyncio.run(run()), 3)
+		self.assertEqual(self.pool.threads, 1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import argparse, asyncio, pathlib, sys, time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+from rgit import _gitcli # pylint: disable=wrong-import-position
+from rgit.tools import draw_table # pylint: disable=wrong-import-position
+
+
+# Compares the launchers of `_gitcli` (see `rgit/_launchers.py`) by running the same git command
+# many times. The ballast is memory the benchmark allocates and touches first, standing in for
+# the memory pygit2 and the results of a large run take - forking gets slower as it grows.
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the ways rgit starts git processes.")
+	parser.add_argument("--count", type=int, default=500, help="number of processes to start per launcher")
+	parser.add_argument("--jobs", type=int, default=32, help="number of processes running at once")
+	parser.add_argument("--ballast", type=int, default=0, metavar="MB", help="memory to allocate before starting")
+	parser.add_argument("--launcher", dest="launchers", action="append", choices=_gitcli.LAUNCHERS,
+		help="launcher to benchmark, can be repeated (default: all)")
+	parser.add_argument("command", nargs="*", default=["git", "--version"], help="command to run (default: git --version)")
+	opts = parser.parse_args()
+
+	ballast = bytearray(opts.ballast << 20)
+	# Touch every page, untouched pages are not mapped and cost nothing to fork.
+	for i in range(0, len(ballast), 4096):
+		ballast[i] = 1
+
+	rows = [["Launcher", "Processes", "Seconds", "Per process ms"]]
+	for launcher in opts.launchers or _gitcli.LAUNCHERS:
+		duration = asyncio.run(run(launcher, opts.command, opts.count, opts.jobs))
+		rows.append([launcher, opts.count, f"{duration:.3f}", f"{duration * 1000 / opts.count:.3f}"])
+	draw_table(rows, fo=sys.stdout,
+		title=f"{' '.join(opts.command)} with {opts.jobs} jobs and {opts.ballast} MB ballast",
+		has_header=True,
+	)
+
+
+async def run(launcher, command, count, jobs):
+	_gitcli.set_launcher(launcher)
+	semaphore = asyncio.Semaphore(jobs)
+	async def run_one():
+		async with semaphore:
+			await _gitcli.run_async(*command)
+	try:
+		# Starts helper processes, if any, outside of the measurement.
+		await _gitcli.run_async(*command)
+		started = time.perf_counter()
+		await asyncio.gather(*(run_one() for _ in range(count)))
+		return time.perf_counter() - started
+	finally:
+		await _gitcli.close_launcher()
+
+
+if __name__ == "__main__":
+	main()
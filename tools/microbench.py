@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import argparse, asyncio, io, json, pathlib, random, subprocess, sys, time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+from rgit import configuration, git, refspec, repostatus, storage, tools # pylint: disable=wrong-import-position
+from rgit.cli.status import Status # pylint: disable=wrong-import-position
+
+
+# Benchmarks of the pure functions on the hot paths of `rgit status`, with fixed inputs generated
+# from a seeded random number generator. Timings depend on the machine, so the baseline they are
+# compared to is kept out of the repository - save it on the commit a change is based on, then
+# compare the change to it:
+#
+#	tools/microbench.py --save
+#	... change something ...
+#	tools/microbench.py --compare HEAD
+#
+# The best of the repeats is reported, it's the one least disturbed by everything else running.
+
+DEFAULT_BASELINE = pathlib.Path(__file__).parent.parent / ".microbench.json"
+DEFAULT_THRESHOLD = 10
+DEFAULT_REPEAT = 5
+
+_BENCHMARKS = {}
+
+
+def benchmark(name):
+	"""
+	Registers a function that prepares the inputs and returns the callable to time.
+	"""
+	def decorator(setup):
+		_BENCHMARKS[name] = setup
+		return setup
+	return decorator
+
+
+def _random_path(rng, depth):
+	return "/".join(rng.choice(("src", "lib", "docs", "tests", "core", "util", "app", "x")) + str(rng.randrange(100)) for _ in range(depth))
+
+
+@benchmark("tools.url_starts_with")
+def bench_url_starts_with(rng):
+	hosts = ["github.com", "gitlab.com", "git.example.com", "bitbucket.org"]
+	urls = []
+	for i in range(10_000):
+		host = rng.choice(hosts)
+		form = i % 4
+		if form == 0:
+			urls.append(f"https://{host}/{_random_path(rng, 2)}.git")
+		elif form == 1:
+			urls.append(f"ssh://git@{host}/{_random_path(rng, 2)}.git")
+		elif form == 2:
+			urls.append(f"git@{host}:{_random_path(rng, 2)}.git")
+		else:
+			urls.append(f"/home/user/mirrors/{_random_path(rng, 3)}")
+	prefixes = ["https://github.com/src1", "ssh://git@gitlab.com/", "git@github.com:", "/home/user/mirrors/lib2"]
+	def run():
+		for url in urls:
+			for prefix in prefixes:
+				tools.url_starts_with(url, prefix)
+	return run
+
+
+@benchmark("tools.gen_sort_index")
+def bench_gen_sort_index(rng):
+	columns = ["#", "Path", *repostatus.CHANGE_COLUMNS, "Commits", "Refs", "Remotes", "Other Remotes", "State", "Notes"]
+	column_sets = [rng.sample(columns, rng.randrange(4, len(columns))) for _ in range(10_000)]
+	def run():
+		for values in column_sets:
+			tools.gen_sort_index(values, Status._column_sort_order) # pylint: disable=protected-access
+	return run
+
+
+@benchmark("tools.draw_table")
+def bench_draw_table(rng):
+	rows = [["#", "Path", "Remotes", "Refs", "Commits", "??", "M•", "•M"]]
+	for i in range(100_000):
+		rows.append([i + 1, f"~/{_random_path(rng, 3)}", rng.choice(["", " - ", "origin"]), rng.randrange(3),
+			rng.randrange(10), rng.randrange(100), "", rng.randrange(5)])
+	def run():
+		tools.draw_table(rows, fo=io.StringIO(), title="Unclean Repositories", has_header=True)
+	return run
+
+
+@benchmark("tools.ProgressDisplay._render")
+def bench_progress_display(rng):
+	progress = tools.ProgressDisplay(fo=io.StringIO())
+	progress._width = 120 # pylint: disable=protected-access
+	progress._chars = [rng.choice("·⊙◉✕") for _ in range(10_000)] # pylint: disable=protected-access
+	def run():
+		for _ in range(100):
+			progress._render() # pylint: disable=protected-access
+	return run
+
+
+@benchmark("refspec.match_refspec")
+def bench_match_refspec(rng):
+	refs = [f"refs/{rng.choice(('heads', 'tags', 'remotes/origin'))}/{_random_path(rng, rng.randrange(1, 3))}" for _ in range(100_000)]
+	def run():
+		for ref in refs:
+			refspec.match_refspec(ref, "refs/heads/*", "refs/remotes/origin/*")
+	return run
+
+
+@benchmark("refspec.RefspecMap.lookup")
+def bench_refspec_map(rng):
+	refs = [f"refs/{rng.choice(('heads', 'tags', 'notes'))}/{_random_path(rng, rng.randrange(1, 3))}" for _ in range(100_000)]
+	refspecs = refspec.RefspecMap()
+	for remote in ("origin", "upstream", "mirror", "backup"):
+		refspecs.add(remote, refspec.parse(f"+refs/heads/*:refs/remotes/{remote}/*"))
+		refspecs.add(remote, refspec.parse("+refs/tags/*:refs/tags/*"))
+	refspecs.add("mirror", refspec.parse("^refs/heads/tmp/*"))
+	def run():
+		for ref in refs:
+			refspecs.lookup(ref)
+	return run
+
+
+@benchmark("git.parse_status_porcelain_v2")
+def bench_parse_status_porcelain_v2(rng):
+	oid = "0123456789abcdef0123456789abcdef01234567"
+	entries = ["# branch.oid " + oid, "# branch.head main"]
+	for i in range(100_000):
+		path = _random_path(rng, 3)
+		kind = i % 10
+		if kind < 5:
+			entries.append(f"? {path}")
+		elif kind < 9:
+			entries.append(f"1 .M N... 100644 100644 100644 {oid} {oid} {path}")
+		else:
+			entries.append(f"2 R. N... 100644 100644 100644 {oid} {oid} R100 {path}")
+			entries.append(_random_path(rng, 3))
+	async def parse():
+		async def generate():
+			for entry in entries:
+				yield entry
+		await git.parse_status_porcelain_v2(generate())
+	def run():
+		asyncio.run(parse())
+	return run
+
+
+@benchmark("Status.count_status_line")
+def bench_count_status_line(rng):
+	lines = [f"{rng.choice(('??', ' M', 'M ', 'MM', 'A ', ' D', 'R '))} {_random_path(rng, 3)}" for _ in range(100_000)]
+	def run():
+		status = repostatus.RepoStatus(pathlib.Path("/repo"))
+		for line in lines:
+			Status.count_status_line(status, line)
+	return run
+
+
+@benchmark("configuration matching")
+def bench_configuration_matching(rng):
+	config = configuration.FileBasedConfiguration(None)
+	config._content = { # pylint: disable=protected-access
+		"destination.folders": [f"src/group{i}" for i in range(0, 500, 2)],
+		"destination.folders.ignore": [f"src/group{i}/vendor" for i in range(500)],
+		"destination.remotes": [f"https://github.com/org{i}/" for i in range(50)],
+		"destination.remotes.ignore": [f"git@gitlab.com:org{i}/" for i in range(50)],
+	}
+	config._compile() # pylint: disable=protected-access
+	repos = [config.basedir / f"src/group{rng.randrange(500)}/{_random_path(rng, 2)}/.git" for _ in range(10_000)]
+	urls = [f"https://github.com/org{rng.randrange(100)}/{_random_path(rng, 1)}.git" for _ in range(10_000)]
+	def run():
+		for repo, url in zip(repos, urls):
+			config.matching_destination_folder(repo)
+			config.matching_destination_folder_ignore(repo)
+			config.matching_destination_remote(url)
+			config.matching_destination_remote_ignore(url)
+	return run
+
+
+@benchmark("cli startup")
+def bench_cli_startup(rng):
+	# A fresh interpreter every time, nothing is imported yet. Parsing the arguments of `prompt`
+	# needs no other command, so this is the cost of the startup itself.
+	args = [sys.executable, "-c", "import rgit.cli; rgit.cli._parse_args(['prompt'])"]
+	def run():
+		for _ in range(10):
+			subprocess.run(args, cwd=pathlib.Path(__file__).parent.parent, check=True)
+	return run
+
+
+def measure(names, repeat):
+	results = {}
+	for name in names:
+		run = _BENCHMARKS[name](random.Random(name))
+		timings = []
+		for _ in range(repeat):
+			started = time.perf_counter()
+			run()
+			timings.append(time.perf_counter() - started)
+		results[name] = min(timings)
+	return results
+
+
+def resolve_commit(rev):
+	return subprocess.run(["git", "rev-parse", "--verify", f"{rev}^{{commit}}"],
+		cwd=pathlib.Path(__file__).parent, check=True, capture_output=True, text=True,
+	).stdout.strip()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the functions on the hot paths of rgit.")
+	parser.add_argument("--baseline", type=pathlib.Path, default=DEFAULT_BASELINE,
+		help=f"the file with results by commit (default: {DEFAULT_BASELINE.name} in the repository)")
+	parser.add_argument("--save", action="store_true",
+		help="store the results as the ones of the checked out commit, which should have no changes")
+	parser.add_argument("--compare", metavar="REV", default=None,
+		help="compare the results with the ones stored for the commit and fail if any got slower")
+	parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, metavar="PERCENT",
+		help=f"how much slower than the baseline is a failure (default: {DEFAULT_THRESHOLD})")
+	parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+		help=f"number of times to run each benchmark (default: {DEFAULT_REPEAT})")
+	parser.add_argument("names", nargs="*", metavar="NAME",
+		help=f"benchmarks to run (default: all): {', '.join(_BENCHMARKS)}")
+	opts = parser.parse_args()
+	for name in opts.names:
+		if name not in _BENCHMARKS:
+			parser.error(f"unknown benchmark {name!r}")
+
+	baseline = storage.read_json(opts.baseline, {})
+	expected = None
+	if opts.compare is not None:
+		commit = resolve_commit(opts.compare)
+		expected = baseline.get(commit)
+		if expected is None:
+			sys.stderr.write(f"no results for {commit} in {opts.baseline}, run with --save on it first\n")
+			return 2
+
+	results = measure(opts.names or list(_BENCHMARKS), opts.repeat)
+
+	slower = []
+	rows = [["Benchmark", "Seconds", "Baseline", "Change %"]]
+	for name, duration in results.items():
+		row = [name, f"{duration:.4f}", "-", "-"]
+		if expected is not None and name in expected:
+			change = (duration - expected[name]) / expected[name] * 100
+			row[2:] = [f"{expected[name]:.4f}", f"{change:+.1f}"]
+			if change > opts.threshold:
+				slower.append(name)
+		rows.append(row)
+	tools.draw_table(rows, fo=sys.stdout, has_header=True)
+
+	if opts.save:
+		baseline[resolve_commit("HEAD")] = {**baseline.get(resolve_commit("HEAD"), {}), **results}
+		storage.write_text(opts.baseline, json.dumps(baseline, indent="\t", sort_keys=True) + "\n")
+
+	if slower:
+		sys.stderr.write(f"slower than the baseline by more than {opts.threshold:g}%: {', '.join(slower)}\n")
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())